@@ -0,0 +1,114 @@
+"""asyncio counterparts of crud.py and queries.py, for serving a JSON API next to the Streamlit app.
+
+Every function here has the same name and arguments as its blocking original and is awaited
+instead of called:
+
+    import async_api as api
+    provider = await api.get_provider_by_id(5)
+    await api.add_claim(1001, 5, 7, "Pending", timeutil.now())
+    trend = await api.monthly_claim_trend()
+
+Reads run on a dedicated thread pool of READ_WORKERS threads, no more than the connection pool
+holds, so a burst of requests queues in the event loop instead of on the connection pool.
+Writes never commit on the pool threads: the crud function's statements are captured there
+(crud.capture_writes, which may read to route a row to its shard or allocate its id) and queued on
+writer.py's single writer thread, which commits whatever has accumulated as one transaction, and
+the await returns once the write is committed.
+
+The crud batch functions (add_claims etc.) manage their own transaction and are not mirrored;
+call them through run_blocking() if needed.
+"""
+import asyncio
+import contextvars
+import functools
+import inspect
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import crud
+import db
+import migrate
+import queries
+import writer
+
+READ_WORKERS = min(8, db.POOL_SIZE)
+
+CRUD_READS = [
+    "get_provider_by_id", "get_providers", "find_providers", "search_providers",
+    "get_receiver_by_id", "get_receivers", "find_receivers", "search_receivers",
+    "get_food_by_id", "get_food_listings", "find_food_listings", "search_food_listings",
+    "get_claim_by_id", "get_claims", "find_claims",
+    "distinct_values",
+]
+CRUD_WRITES = [
+    "add_provider", "update_provider", "delete_provider",
+    "add_receiver", "update_receiver", "delete_receiver",
+    "add_food", "update_food", "delete_food",
+    "add_claim", "update_claim", "delete_claim",
+]
+# queries.py helpers that aren't analytics calls
+QUERIES_SKIP = set(migrate.QUERY_HELPERS)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _read_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=READ_WORKERS, thread_name_prefix="async-read")
+        return _executor
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """Run any blocking function on the read pool (the caller's contextvars go with it)."""
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, fn, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(_read_executor(), call)
+
+
+def _capture(fn, *args, **kwargs):
+    with crud.capture_writes() as statements:
+        fn(*args, **kwargs)
+    return statements
+
+
+async def write(fn, *args, **kwargs):
+    """Capture what crud write function `fn` would run and commit it through the writer queue.
+    Returns the number of rows changed."""
+    # capturing can block too (shard routing reads, id allocation in the home database), so it runs
+    # on the read pool; only the wait for the writer happens on the event loop
+    statements = await run_blocking(_capture, fn, *args, **kwargs)
+    # a full write queue must not block the event loop: retry without waiting until SUBMIT_TIMEOUT
+    until = time.monotonic() + writer.SUBMIT_TIMEOUT
+    while True:
+        try:
+            future = writer.submit(statements, statements.path, timeout=0)
+            break
+        except TimeoutError:
+            if time.monotonic() > until:
+                raise
+            await asyncio.sleep(writer.MAX_DELAY)
+    return await asyncio.wrap_future(future)
+
+
+async def run_batch(calls, timeout=queries.BATCH_TIMEOUT):
+    return await run_blocking(queries.run_batch, calls, timeout)
+
+
+def _mirror(fn, runner):
+    @functools.wraps(fn)
+    async def call(*args, **kwargs):
+        return await runner(fn, *args, **kwargs)
+    return call
+
+
+for _name in CRUD_READS:
+    globals()[_name] = _mirror(getattr(crud, _name), run_blocking)
+for _name in CRUD_WRITES:
+    globals()[_name] = _mirror(getattr(crud, _name), write)
+for _name, _fn in inspect.getmembers(queries, inspect.isfunction):
+    if _fn.__module__ == queries.__name__ and not _name.startswith("_") and _name not in QUERIES_SKIP:
+        globals()[_name] = _mirror(_fn, run_blocking)
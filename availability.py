@@ -0,0 +1,134 @@
+"""What food is still claimable, and for how long.
+
+Each Food_Listings row carries two counters kept current by triggers on Claims:
+Claimed_Quantity (sum of Claims.Quantity over claims that hold food) and Full_Claims (how many
+holding claims took the whole listing, i.e. have no Quantity). A listing is live while
+Full_Claims = 0 AND Quantity > Claimed_Quantity, and two partial indexes over live rows only,
+ordered by Expiry_Date, let "available now" / "expiring within N hours" queries seek straight to
+the matching Location / Food_Type range instead of scanning the table.
+
+The sweeper moves expired listings that never received a claim into Food_Listings_Archive in
+batches, so the hot table only keeps rows that are live or referenced by a claim. The listing
+summaries count the archive too (see summary.py), so a swept listing still counts as donated.
+
+    python availability.py [--grace-hours 24] [--batch-size 1000]
+"""
+import argparse
+from datetime import datetime, timedelta
+
+import cache
+import db
+import timeutil
+
+# a claim holds its food from the moment it is made (Pending, e.g. a crud.reserve()) until it is
+# Cancelled or Rejected, which gives the quantity back
+RELEASED = ("Cancelled", "Rejected")
+HOLDING = "{row}.Status NOT IN (" + ", ".join(f"'{status}'" for status in RELEASED) + ")"
+
+# the WHERE terms must match the partial indexes' WHERE exactly for SQLite to use them
+LIVE = "Full_Claims = 0 AND Quantity > Claimed_Quantity"
+
+SWEEP_BATCH_SIZE = 1000
+
+
+def now():
+    """The current time in the database's timestamp format, truncated to the minute."""
+    return datetime.now().strftime("%Y-%m-%d %H:%M:00")
+
+
+def _trigger_sql():
+    def add(row, sign):
+        return (f"UPDATE Food_Listings SET "
+                f"Claimed_Quantity = Claimed_Quantity {sign} IFNULL({row}.Quantity, 0), "
+                f"Full_Claims = Full_Claims {sign} ({row}.Quantity IS NULL) "
+                f"WHERE Food_ID = {row}.Food_ID;")
+
+    holds_new = HOLDING.replace("{row}", "NEW")
+    holds_old = HOLDING.replace("{row}", "OLD")
+    return [
+        f"CREATE TRIGGER trg_claims_hold_ins AFTER INSERT ON Claims WHEN {holds_new} BEGIN {add('NEW', '+')} END",
+        f"CREATE TRIGGER trg_claims_hold_del AFTER DELETE ON Claims WHEN {holds_old} BEGIN {add('OLD', '-')} END",
+        f"CREATE TRIGGER trg_claims_hold_upd_old AFTER UPDATE OF Status, Quantity, Food_ID ON Claims "
+        f"WHEN {holds_old} BEGIN {add('OLD', '-')} END",
+        f"CREATE TRIGGER trg_claims_hold_upd_new AFTER UPDATE OF Status, Quantity, Food_ID ON Claims "
+        f"WHEN {holds_new} BEGIN {add('NEW', '+')} END",
+    ]
+
+
+def install(conn):
+    """(Re)create the hold triggers and recompute the counters. Runs inside the caller's transaction."""
+    for suffix in ("ins", "del", "upd_old", "upd_new"):
+        conn.execute(f"DROP TRIGGER IF EXISTS trg_claims_hold_{suffix}")
+    for statement in _trigger_sql():
+        conn.execute(statement)
+    recompute(conn)
+
+
+def recompute(conn):
+    holds = HOLDING.replace("{row}", "c")
+    conn.execute(f"""
+        UPDATE Food_Listings SET
+            Claimed_Quantity = (SELECT IFNULL(SUM(c.Quantity), 0) FROM Claims c
+                                WHERE c.Food_ID = Food_Listings.Food_ID AND {holds}),
+            Full_Claims = (SELECT COUNT(*) FROM Claims c
+                           WHERE c.Food_ID = Food_Listings.Food_ID AND {holds} AND c.Quantity IS NULL)
+    """)
+
+
+# -------------------------
+# Sweeper
+# -------------------------
+def sweep(path=None, grace_hours=0, batch_size=SWEEP_BATCH_SIZE, as_of=None):
+    """Archive listings that expired more than grace_hours ago and have no claims. Returns rows moved."""
+    import changelog
+
+    cutoff = (datetime.strptime(as_of or now(), timeutil.FORMAT) - timedelta(hours=grace_hours)
+              ).strftime(timeutil.FORMAT)
+    moved = 0
+    with db.connection(path) as conn:
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                ids = [row[0] for row in conn.execute("""
+                    SELECT Food_ID FROM Food_Listings f
+                    WHERE Expiry_Date < ?
+                      AND NOT EXISTS (SELECT 1 FROM Claims c WHERE c.Food_ID = f.Food_ID)
+                    ORDER BY Expiry_Date
+                    LIMIT ?
+                """, (cutoff, batch_size))]
+                if ids:
+                    marks = ", ".join("?" for _ in ids)
+                    conn.execute(f"""
+                        INSERT OR REPLACE INTO Food_Listings_Archive
+                            (Food_ID, Food_Name, Quantity, Expiry_Date, Provider_ID, Provider_Type,
+                             Location, Food_Type, Meal_Type, Archived_At)
+                        SELECT Food_ID, Food_Name, Quantity, Expiry_Date, Provider_ID, Provider_Type,
+                               Location, Food_Type, Meal_Type, CURRENT_TIMESTAMP
+                        FROM Food_Listings WHERE Food_ID IN ({marks})
+                    """, ids)
+                    logged = changelog.last_seq(conn)
+                    conn.execute(f"DELETE FROM Food_Listings WHERE Food_ID IN ({marks})", ids)
+                    changelog.relabel(conn, logged, "archive")
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            moved += len(ids)
+            if ids:
+                cache.invalidate(["Food_Listings"])
+            if len(ids) < batch_size:
+                return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive expired, unclaimed food listings")
+    parser.add_argument("--db", default=db.DB_NAME)
+    parser.add_argument("--grace-hours", type=float, default=0)
+    parser.add_argument("--batch-size", type=int, default=SWEEP_BATCH_SIZE)
+    args = parser.parse_args()
+    moved = sweep(args.db, args.grace_hours, args.batch_size)
+    print(f"✅ archived {moved:,} expired listing(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""The Analysis page's queries run one after another vs through queries.run_batch.
+
+    python -m benchmarks.bench_analysis --scale 1m
+"""
+import argparse
+
+import cache
+import queries
+from benchmarks import synthetic
+from benchmarks.common import print_table, summarize, temp_database, time_calls
+
+# what the Analysis page asks for (the city lookup is typed in by the user, so it isn't batched)
+CALLS = {
+    "providers_per_city": (queries.providers_per_city,),
+    "receivers_per_city": (queries.receivers_per_city,),
+    "top_provider_types": (queries.top_provider_types,),
+    "top_receivers": (queries.top_receivers, 10),
+    "total_food_available": (queries.total_food_available,),
+    "city_with_most_listings": (queries.city_with_most_listings,),
+    "common_food_types": (queries.common_food_types,),
+    "claims_per_food": (queries.claims_per_food, 10),
+    "top_successful_provider": (queries.top_successful_provider,),
+    "claim_status_percentage": (queries.claim_status_percentage,),
+    "avg_quantity_per_receiver": (queries.avg_quantity_per_receiver, 10),
+    "most_claimed_meal_type": (queries.most_claimed_meal_type,),
+    "total_donated_per_provider": (queries.total_donated_per_provider, 10),
+    "top_donated_foods": (queries.top_donated_foods, 5),
+}
+
+
+def sequential():
+    return {name: fn(*args) for name, (fn, *args) in CALLS.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", default="10k", help="synthetic database scale (see benchmarks/synthetic.py)")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with temp_database(synthetic.database(args.scale)):
+        rows = []
+        slowest = 0.0
+        for name, (fn, *fn_args) in CALLS.items():
+            stats = summarize(time_calls(lambda: fn(*fn_args), args.repeat, 1, setup=cache.clear))
+            slowest = max(slowest, stats["p50_us"])
+        rows.append(("sequential (uncached)", summarize(time_calls(sequential, args.repeat, 1, setup=cache.clear))))
+        for workers in (2, 4, 8):
+            queries.BATCH_WORKERS, queries._executor = workers, None
+            rows.append((f"run_batch, {workers} workers (uncached)", summarize(time_calls(
+                lambda: queries.run_batch(CALLS), args.repeat, 1, setup=cache.clear))))
+        print_table(f"Analysis page queries (slowest single query p50: {slowest:,.0f} us)", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Load test of async_api.py: read throughput as concurrency grows, and grouped writes vs per-call commits.
+
+Readers issue point lookups and first-page finds through the async API for a fixed time at each
+concurrency level. Writers insert and then complete claims, first through async_api (one writer
+thread, grouped commits) and then through blocking crud calls from the same number of threads
+(one commit each). Afterwards the claims are counted and the summary tables and hold counters are
+checked against the base tables, so a write that was acknowledged but lost shows up.
+
+    python -m benchmarks.bench_async --scale 1m --seconds 5
+"""
+import argparse
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import async_api
+import availability
+import cache
+import crud
+import db
+import summary
+import timeutil
+import writer
+from benchmarks import synthetic
+from benchmarks.common import percentile, temp_database
+
+
+async def reader(stop_at, max_ids, latencies, rng):
+    while time.perf_counter() < stop_at:
+        start = time.perf_counter()
+        kind = rng.random()
+        if kind < 0.4:
+            await async_api.get_food_by_id(rng.randint(1, max_ids["Food_Listings"]))
+        elif kind < 0.8:
+            await async_api.get_claim_by_id(rng.randint(1, max_ids["Claims"]))
+        else:
+            await async_api.find_claims({"Status": "Pending"})
+        latencies.append(time.perf_counter() - start)
+
+
+async def read_load(concurrency, seconds, max_ids):
+    latencies = []
+    stop_at = time.perf_counter() + seconds
+    await asyncio.gather(*(reader(stop_at, max_ids, latencies, random.Random(i)) for i in range(concurrency)))
+    return latencies
+
+
+async def async_writes(ids, food_ids, receiver_ids):
+    adds = [async_api.add_claim(cid, food, receiver, "Pending", timeutil.now(), 1)
+            for cid, food, receiver in zip(ids, food_ids, receiver_ids)]
+    await asyncio.gather(*adds)
+    await asyncio.gather(*(async_api.update_claim(cid, Status="Completed") for cid in ids))
+
+
+def blocking_writes(ids, food_ids, receiver_ids, threads):
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda row: crud.add_claim(row[0], row[1], row[2], "Pending", timeutil.now(), 1),
+                      zip(ids, food_ids, receiver_ids)))
+        list(pool.map(lambda cid: crud.update_claim(cid, Status="Completed"), ids))
+
+
+def consistency_problems(path):
+    with db.connection(path, readonly=True) as conn:
+        problems = summary.check(conn)
+        drift = conn.execute(f"""
+            SELECT COUNT(*) FROM Food_Listings f
+            WHERE Claimed_Quantity <> (SELECT IFNULL(SUM(Quantity), 0) FROM Claims c
+                                       WHERE c.Food_ID = f.Food_ID AND {availability.HOLDING.replace("{row}", "c")})
+        """).fetchone()[0]
+    if drift:
+        problems["Food_Listings.Claimed_Quantity"] = drift
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", default="10k", help="synthetic database scale (see benchmarks/synthetic.py)")
+    parser.add_argument("--seconds", type=float, default=3.0, help="duration of each read level")
+    parser.add_argument("--writes", type=int, default=5000, help="claims inserted (and completed) per write run")
+    parser.add_argument("--threads", type=int, default=8, help="threads for the blocking write run")
+    args = parser.parse_args()
+
+    with temp_database(synthetic.database(args.scale)) as path:
+        with db.connection(path, readonly=True) as conn:
+            max_ids = {table: conn.execute(f"SELECT MAX({cols[0]}) FROM {table}").fetchone()[0]
+                       for table, cols in crud.COLUMNS.items()}
+
+        print(f"\n{'readers':>8}{'ops/sec':>12}{'p50 us':>12}{'p95 us':>12}{'p99 us':>12}")
+        for concurrency in (1, 2, 4, 8, 16, 32):
+            cache.clear()
+            latencies = asyncio.run(read_load(concurrency, args.seconds, max_ids))
+            print(f"{concurrency:>8}{len(latencies) / args.seconds:>12,.0f}{percentile(latencies, 50) * 1e6:>12.0f}"
+                  f"{percentile(latencies, 95) * 1e6:>12.0f}{percentile(latencies, 99) * 1e6:>12.0f}")
+
+        rng = random.Random(7)
+        n = args.writes
+        food_ids = [rng.randint(1, max_ids["Food_Listings"]) for _ in range(n)]
+        receiver_ids = [rng.randint(1, max_ids["Receivers"]) for _ in range(n)]
+        first = max_ids["Claims"] + 1
+
+        ids = list(range(first, first + n))
+        start = time.perf_counter()
+        asyncio.run(async_writes(ids, food_ids, receiver_ids))
+        grouped = time.perf_counter() - start
+        stats = writer.get_writer(path).stats()
+
+        ids = list(range(first + n, first + 2 * n))
+        start = time.perf_counter()
+        blocking_writes(ids, food_ids, receiver_ids, args.threads)
+        single = time.perf_counter() - start
+
+        with db.connection(path, readonly=True) as conn:
+            written = conn.execute("SELECT COUNT(*) FROM Claims WHERE Claim_ID >= ? AND Status = 'Completed'",
+                                   (first,)).fetchone()[0]
+        print(f"\n{'writes (insert + complete)':<40}{'seconds':>10}{'ops/sec':>12}")
+        print(f"{'async_api, grouped commits':<40}{grouped:>10.2f}{2 * n / grouped:>12,.0f}"
+              f"   ({stats['groups']} transactions, {stats['units_per_group']} writes each)")
+        print(f"{f'crud from {args.threads} threads, commit each':<40}{single:>10.2f}{2 * n / single:>12,.0f}")
+
+        problems = consistency_problems(path)
+        ok = written == 2 * n and not problems
+        print(f"\n{'✅' if ok else '❌'} {written:,} of {2 * n:,} claims written and completed; "
+              f"derived tables {'consistent' if not problems else problems}")
+        writer.close_all()
+        if not ok:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
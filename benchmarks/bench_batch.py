@@ -0,0 +1,49 @@
+"""Throughput of the batch CRUD functions vs looping over the single-row ones.
+
+    python -m benchmarks.bench_batch --rows 5000
+"""
+import argparse
+import time
+
+import crud
+import migrate
+from benchmarks.common import temp_database
+
+
+def rate(label, rows, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<40}{rows:>10,} rows{elapsed:>10.3f}s{rows / elapsed:>14,.0f} rows/sec")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--chunk-size", type=int, default=crud.CHUNK_SIZE)
+    args = parser.parse_args()
+    n = args.rows
+
+    with temp_database():
+        migrate.upgrade(crud.DB_NAME)
+        base = 10_000_000
+        single = [(base + i, 1, 1, "Pending", "2025-03-01 00:00:00") for i in range(n)]
+        batch = [(base + n + i, 1, 1, "Pending", "2025-03-01 00:00:00") for i in range(n)]
+
+        print()
+        rate("add_claim x N", n, lambda: [crud.add_claim(*row) for row in single])
+        rate("add_claims", n, lambda: crud.add_claims(batch, args.chunk_size))
+        rate("update_claim x N", n, lambda: [crud.update_claim(row[0], Status="Completed") for row in single])
+        rate("update_claims", n, lambda: crud.update_claims(
+            ((row[0], {"Status": "Completed"}) for row in batch), args.chunk_size))
+        rate("delete_claim x N", n, lambda: [crud.delete_claim(row[0]) for row in single])
+        rate("delete_claims", n, lambda: crud.delete_claims((row[0] for row in batch), args.chunk_size))
+
+        # duplicate ids in a batch are reported per row; the rest of the batch still lands
+        mixed = batch[:] + [batch[0]] * (n // args.chunk_size or 1)
+        result = crud.add_claims(mixed, args.chunk_size)
+        print(f"\nmixed batch: {result.applied:,} applied, {len(result.failed)} failed, e.g. {result.failed[:1]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Change log: what it costs the writers, and catching up on changes vs. re-reading the tables.
+
+A consumer is registered, then --writes claims are added, completed and a tenth of them deleted,
+one commit per call (the app's path), timed with the log triggers in place and again with them
+dropped. The consumer then catches up on the changes (consume(), in --batch-size batches); for
+comparison the whole Claims table is read the way a scheduled job without the log would. To
+check the log is complete, the Claims table as of registration plus every change consumed must
+equal the table at the end; a move of the busiest city to a shard (logged as "move"s) and the
+expired-listing sweeper (logged as "archive"s) run in between, so those paths are covered too.
+Finally the log is truncated and its size before and after reported.
+
+    python -m benchmarks.bench_changelog --scale 1m --writes 5000
+"""
+import argparse
+import time
+
+import availability
+import changelog
+import crud
+import db
+import shards
+import timeutil
+from benchmarks import synthetic
+from benchmarks.bench_shards import busiest_cities
+from benchmarks.common import temp_database
+
+
+def write_run(first_id, n, food_ids):
+    """Add, complete and (every tenth) delete n claims; returns writes per second."""
+    start = time.perf_counter()
+    writes = 0
+    for claim_id in range(first_id, first_id + n):
+        crud.add_claim(claim_id, food_ids[claim_id % len(food_ids)], 1, "Pending", timeutil.now(), 1)
+        crud.update_claim(claim_id, Status="Completed")
+        writes += 2
+        if claim_id % 10 == 0:
+            crud.delete_claim(claim_id)
+            writes += 1
+    return writes / (time.perf_counter() - start)
+
+
+def set_triggers(path, on):
+    with db.transaction(path) as conn:
+        if on:
+            changelog.install(conn)
+        else:
+            for table in changelog.TABLES:
+                for suffix in ("ins", "upd", "del"):
+                    conn.execute(f"DROP TRIGGER IF EXISTS trg_changelog_{table}_{suffix}")
+
+
+def claims_table():
+    return {row[0]: list(row) for row in crud.get_claims()}
+
+
+def catch_up(mirror, counts, batch_size):
+    """Apply the consumer's new Claims changes to mirror; returns (changes read, seconds)."""
+    start = time.perf_counter()
+    changes = 0
+    for batch in changelog.consume("bench", batch_size):
+        for change in batch:
+            counts[change.op] = counts.get(change.op, 0) + 1
+            if change.table != "Claims" or change.op in ("move", "archive"):
+                continue
+            if change.op == "delete":
+                mirror.pop(change.row_id, None)
+            else:
+                mirror[change.row_id] = [change.data[col] for col in crud.COLUMNS["Claims"]]
+        changes += len(batch)
+    return changes, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", default="10k", help="synthetic database scale (see benchmarks/synthetic.py)")
+    parser.add_argument("--writes", type=int, default=2000, help="claims added per write run")
+    parser.add_argument("--batch-size", type=int, default=changelog.BATCH_SIZE)
+    args = parser.parse_args()
+
+    with temp_database(synthetic.database(args.scale)) as path:
+        food_ids = [row[0] for row in crud.find_food_listings(limit=1000)[0]]
+        first_id = db.execute("SELECT MAX(Claim_ID) FROM Claims", fetchone=True)[0] + 1
+        mirror, counts = claims_table(), {}
+        changelog.register("bench", path)
+
+        logged_rate = write_run(first_id, args.writes, food_ids)
+        changes, consume_seconds = catch_up(mirror, counts, args.batch_size)
+        start = time.perf_counter()
+        claims_table()
+        scan_seconds = time.perf_counter() - start
+
+        set_triggers(path, False)
+        unlogged_rate = write_run(first_id + args.writes, args.writes, food_ids)
+        set_triggers(path, True)
+        # the unlogged run's claims are in the table but not in the log; take them out again, logged
+        crud.delete_claims(list(range(first_id + args.writes, first_id + 2 * args.writes)))
+        city = busiest_cities(path, 1)[0]
+        shards.move_cities([city], "bench")
+        write_run(first_id + 2 * args.writes, args.writes // 10, food_ids)   # some of it lands in the shard
+        swept = availability.sweep(path, as_of="2100-01-01 00:00:00")
+        more, _ = catch_up(mirror, counts, args.batch_size)
+
+        print(f"\n{args.writes:,} claims added + completed, a tenth deleted, one commit per call")
+        print(f"{'log triggers':<16}{'writes/s':>10}")
+        print(f"{'on':<16}{logged_rate:>10,.0f}\n{'off':<16}{unlogged_rate:>10,.0f}"
+              f"   ({(unlogged_rate / logged_rate - 1) * 100:+.0f}% without)")
+        print(f"\nConsumer caught up on those {changes:,} changes in {consume_seconds:.3f}s "
+              f"({changes / consume_seconds:,.0f} changes/s); re-reading Claims instead took {scan_seconds:.3f}s")
+        print(f"Then the sweeper archived {swept:,} listings and {city!r} moved to a shard: {more:,} more changes")
+        print("All changes consumed: " + ", ".join(f"{n:,} {op}" for op, n in sorted(counts.items())))
+
+        before = sum(rows for _, _, _, rows, _ in changelog.status(path))
+        changelog.unregister("bench", path)   # no consumers left: every complete segment goes
+        after = sum(rows for _, _, _, rows, _ in changelog.status(path))
+        print(f"Log rows: {before:,} before truncation, {after:,} after "
+              f"(whole {changelog.SEGMENT_SIZE:,}-seq segments only)")
+
+        table = claims_table()
+        shards.move_cities([city], shards.HOME, path)
+        if mirror != table:
+            differ = set(mirror) ^ set(table) | {k for k in set(mirror) & set(table) if mirror[k] != table[k]}
+            print(f"❌ registration snapshot + consumed changes != Claims: {len(differ):,} claims differ")
+            raise SystemExit(1)
+        print(f"\n✅ the Claims table at registration plus the consumed changes reproduce it exactly")
+
+
+if __name__ == "__main__":
+    main()
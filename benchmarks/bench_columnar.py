@@ -0,0 +1,69 @@
+"""Latency and peak memory of the query result formats on large results.
+
+Compares pd.read_sql_query ("pandas") with the columnar fetch path building a DataFrame
+("frame"), bare NumPy columns ("columns"), a pyarrow Table ("arrow", if installed) and
+queries.stream() consuming the result batch by batch.
+
+    python -m benchmarks.bench_columnar --scale 1m --rows 200000
+"""
+import argparse
+import tracemalloc
+
+import cache
+import columnar
+import queries
+from benchmarks import synthetic
+from benchmarks.common import print_table, summarize, temp_database, time_calls
+
+
+def peak_bytes(fn):
+    """Peak memory traced while running fn() once."""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def drain(generator):
+    for _ in generator:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", default="10k", help="synthetic database scale (see benchmarks/synthetic.py)")
+    parser.add_argument("--rows", type=int, default=100_000, help="rows in the large result")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    with temp_database(synthetic.database(args.scale)):
+        top_city = queries.providers_per_city()["City"][0]
+        cases = [
+            ("claims_between", queries.claims_between, ("2000-01-01", "2100-01-01", None, args.rows)),
+            ("provider_contacts_by_city", queries.provider_contacts_by_city, (top_city,)),
+        ]
+        formats = ["pandas", "frame", "columns"] + (["arrow"] if columnar.HAS_PYARROW else [])
+        rows, memory = [], []
+        for name, fn, fn_args in cases:
+            for fmt in formats:
+                def run(fmt=fmt, fn=fn, fn_args=fn_args):
+                    with queries.result_format(fmt):
+                        return fn(*fn_args)
+                rows.append((f"{name} [{fmt}]", summarize(time_calls(run, args.repeat, 1, setup=cache.clear))))
+                cache.clear()
+                memory.append((f"{name} [{fmt}]", peak_bytes(run)))
+            run = lambda fn=fn, fn_args=fn_args: drain(queries.stream(fn, *fn_args))
+            rows.append((f"{name} [stream]", summarize(time_calls(run, args.repeat, 1))))
+            memory.append((f"{name} [stream]", peak_bytes(run)))
+
+        n = len(queries.claims_between("2000-01-01", "2100-01-01", limit=args.rows))
+        print_table(f"Per-call latency ({n:,}-row claims_between result)", rows)
+        print(f"\n{'case':<40}{'peak MB':>12}")
+        for name, peak in memory:
+            print(f"{name:<40}{peak / 1e6:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
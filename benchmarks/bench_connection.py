@@ -0,0 +1,73 @@
+"""Per-call latency of the old connect/commit/close helpers vs the pooled connection layer.
+
+    python -m benchmarks.bench_connection
+"""
+import argparse
+import sqlite3
+
+import pandas as pd
+
+import crud
+import db
+import queries
+from benchmarks.common import print_table, summarize, temp_database, time_calls
+
+
+# -------------------------
+# The helpers as they were before db.py: a fresh connection and a commit per call
+# -------------------------
+def legacy_run_query(query, params=(), fetchone=False, fetchall=False):
+    conn = sqlite3.connect(crud.DB_NAME)
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+    conn.commit()
+    result = None
+    if fetchone:
+        result = cursor.fetchone()
+    elif fetchall:
+        result = cursor.fetchall()
+    conn.close()
+    return result
+
+
+def legacy_run_sql(query, params=()):
+    conn = sqlite3.connect(queries.DB_NAME)
+    df = pd.read_sql_query(query, conn, params=params)
+    conn.close()
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=500)
+    args = parser.parse_args()
+
+    lookup = "SELECT * FROM Providers WHERE Provider_ID = ?"
+    update = "UPDATE Claims SET Status = ? WHERE Claim_ID = ?"
+    analytics = "SELECT City, COUNT(*) AS Provider_Count FROM Providers GROUP BY City"
+
+    rows = []
+    with temp_database():
+        # convert the scratch copy to the journal mode the old code ran with, then time it
+        with sqlite3.connect(crud.DB_NAME) as conn:
+            conn.execute("PRAGMA journal_mode = DELETE")
+        rows.append(("legacy  get_provider_by_id", summarize(time_calls(
+            lambda: legacy_run_query(lookup, (42,), fetchone=True), args.repeat))))
+        rows.append(("legacy  update_claim", summarize(time_calls(
+            lambda: legacy_run_query(update, ("Pending", 42)), args.repeat))))
+        rows.append(("legacy  run_sql (providers_per_city)", summarize(time_calls(
+            lambda: legacy_run_sql(analytics), args.repeat))))
+
+        rows.append(("pooled  get_provider_by_id", summarize(time_calls(
+            lambda: crud.get_provider_by_id(42), args.repeat))))
+        rows.append(("pooled  update_claim", summarize(time_calls(
+            lambda: crud.update_claim(42, Status="Pending"), args.repeat))))
+        rows.append(("pooled  run_sql (providers_per_city)", summarize(time_calls(
+            lambda: queries.run_sql(analytics), args.repeat))))
+        db.close_all()
+
+    print_table("Per-call latency, legacy vs pooled connections", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Throughput and peak memory of export.py against the get_*() + DataFrame route.
+
+The baseline is what downstream reporting did before: crud.get_*() for each table, a DataFrame
+over the rows, then DataFrame.to_parquet / to_csv(compression="gzip"). export.py streams each
+table in chunks instead. Peak memory is traced with tracemalloc in a separate run, so the
+timings are not slowed down by it.
+
+While the full extract runs, a background thread keeps adding claims. Afterwards an incremental
+extract must pick up exactly the claims the full extract's snapshot did not include, which
+checks both the snapshot and the watermark.
+
+    python -m benchmarks.bench_export --scale 1m
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+
+import crud
+import db
+import export
+import timeutil
+from benchmarks import synthetic
+from benchmarks.common import temp_database
+
+GETTERS = {"Providers": crud.get_providers, "Receivers": crud.get_receivers,
+           "Food_Listings": crud.get_food_listings, "Claims": crud.get_claims}
+
+
+def dataframe_export(out_dir, fmt):
+    for table, get_all in GETTERS.items():
+        frame = pd.DataFrame(get_all(), columns=crud.COLUMNS[table])
+        if fmt == "parquet":
+            frame.to_parquet(os.path.join(out_dir, f"{table}.parquet"), index=False)
+        else:
+            frame.to_csv(os.path.join(out_dir, f"{table}.csv.gz"), index=False, compression="gzip")
+
+
+def measure(fn):
+    """(seconds, bytes written under the directory fn writes to, peak traced bytes)."""
+    out_dir = tempfile.mkdtemp(prefix="fw_export_")
+    try:
+        start = time.perf_counter()
+        fn(out_dir)
+        seconds = time.perf_counter() - start
+        written = sum(os.path.getsize(os.path.join(root, name))
+                      for root, _, names in os.walk(out_dir) for name in names)
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+    out_dir = tempfile.mkdtemp(prefix="fw_export_")
+    tracemalloc.start()
+    try:
+        fn(out_dir)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        shutil.rmtree(out_dir, ignore_errors=True)
+    return seconds, written, peak
+
+
+def snapshot_check(path, writes):
+    """Full extract while claims are being added, then an incremental one; returns (ok, message)."""
+    out_dir = tempfile.mkdtemp(prefix="fw_export_")
+    with db.connection(path, readonly=True) as conn:
+        first = conn.execute("SELECT MAX(Claim_ID) FROM Claims").fetchone()[0] + 1
+        food, receiver = conn.execute("SELECT MIN(Food_ID), MIN(Receiver_ID) FROM Claims").fetchone()
+    stop = threading.Event()
+
+    def add_claims():
+        for claim_id in range(first, first + writes):
+            if stop.is_set():
+                break
+            crud.add_claim(claim_id, food, receiver, "Pending", timeutil.now(), 1)
+
+    writer = threading.Thread(target=add_claims)
+    try:
+        writer.start()
+        full = export.export(out_dir, "csv", ["Claims"])
+        stop.set()
+        writer.join()
+        incremental = export.export(out_dir, "csv", ["Claims"], incremental=True)
+        with db.connection(path, readonly=True) as conn:
+            total = conn.execute("SELECT COUNT(*) FROM Claims").fetchone()[0]
+    finally:
+        stop.set()
+        shutil.rmtree(out_dir, ignore_errors=True)
+    exported = full["tables"][0]["rows"] + incremental["tables"][0]["rows"]
+    return exported == total, (f"{full['tables'][0]['rows']:,} rows in the full extract + "
+                               f"{incremental['tables'][0]['rows']:,} in the incremental one = {exported:,}; "
+                               f"table has {total:,}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", default="10k", help="synthetic database scale (see benchmarks/synthetic.py)")
+    parser.add_argument("--changes", type=int, default=1000, help="claims updated before the incremental extract")
+    args = parser.parse_args()
+
+    formats = ["csv"] + (["parquet"] if export.pq is not None else [])
+    with temp_database(synthetic.database(args.scale)) as path:
+        cases = []
+        for fmt in formats:
+            cases.append((f"get_*() + DataFrame [{fmt}]", lambda out, fmt=fmt: dataframe_export(out, fmt)))
+            cases.append((f"export.py [{fmt}]", lambda out, fmt=fmt: export.export(out, fmt)))
+
+        print(f"\n{'case':<42}{'seconds':>9}{'MB out':>9}{'MB/s':>8}{'peak MB':>10}")
+        for name, fn in cases:
+            seconds, written, peak = measure(fn)
+            print(f"{name:<42}{seconds:>9.2f}{written / 1e6:>9.1f}{written / seconds / 1e6:>8.1f}{peak / 1e6:>10.1f}")
+
+        out_dir = tempfile.mkdtemp(prefix="fw_export_")
+        try:
+            export.export(out_dir, formats[-1])
+            crud.update_claims([(claim_id, {"Status": "Completed"}) for (claim_id,) in
+                                db.execute("SELECT Claim_ID FROM Claims WHERE Status = 'Pending' LIMIT ?",
+                                           (args.changes,), path=path, fetchall=True)])
+            report = export.export(out_dir, formats[-1], incremental=True, trace_memory=True)
+        finally:
+            shutil.rmtree(out_dir, ignore_errors=True)
+        seconds = sum(t["seconds"] for t in report["tables"])
+        written = sum(t["bytes"] for t in report["tables"])
+        rows = sum(t["rows"] for t in report["tables"])
+        print(f"{f'export.py --incremental [{formats[-1]}]':<42}{seconds:>9.2f}{written / 1e6:>9.1f}"
+              f"{written / seconds / 1e6:>8.1f}{report['peak_bytes'] / 1e6:>10.1f}"
+              f"   ({rows:,} rows after {args.changes:,} claim updates)")
+
+        ok, message = snapshot_check(path, writes=5000)
+        print(f"\n{'✅' if ok else '❌'} extract during writes: {message}")
+        if not ok:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Distance query latency: the R-tree city index behind queries.food_near_receiver against scans.
+
+Two baselines, both what one writes without a spatial index:
+  city scan     haversine to every gazetteer city, then the same per-city listing lookup
+  listing scan  haversine to the city of every live listing
+All three run as plain SQL (no DataFrame, no result cache) for receivers in a busy, a middling
+and a quiet city at several radii, and must return the same listings. The synthetic gazetteer
+has only a few hundred cities, so the run is repeated after padding it with PADDING_CITIES far-away
+ones to show how each approach grows with the gazetteer.
+
+    python -m benchmarks.bench_geo --scale 1m
+"""
+import argparse
+import random
+
+import availability
+import db
+import geo
+import queries
+from benchmarks import synthetic
+from benchmarks.common import print_table, summarize, temp_database, time_calls
+
+RADII_KM = [10, 25, 50, 100]
+PADDING_CITIES = 100_000
+ALL = 1_000_000   # limit for the correctness comparison: every listing in range
+
+ORIGIN = """SELECT g.Latitude AS Lat, g.Longitude AS Lon, ? AS Km
+            FROM Receivers r JOIN Gazetteer g ON g.City = r.City WHERE r.Receiver_ID = ?"""
+DISTANCE = geo.haversine_sql("o.Lat", "o.Lon", "g.Latitude", "g.Longitude")
+
+
+def rtree_query(receiver_id, km, limit):
+    with queries.result_format("sql"):
+        return queries.food_near_receiver(receiver_id, km, limit)
+
+
+def city_scan_query(receiver_id, km, limit):
+    rtree_sql, params = rtree_query(receiver_id, km, limit)
+    body = rtree_sql[rtree_sql.index("SELECT f.Food_ID"):]
+    return f"""
+        WITH origin AS ({ORIGIN}),
+        near AS (SELECT g.City, {DISTANCE} AS Distance_Km, o.Km FROM origin o, Gazetteer g)
+        {body}""", params
+
+
+def listing_scan_query(receiver_id, km, limit):
+    return f"""
+        WITH origin AS ({ORIGIN})
+        SELECT f.Food_ID, f.Food_Name, f.Quantity - f.Claimed_Quantity AS Available_Quantity, f.Expiry_Date,
+               f.Provider_ID, f.Location, f.Food_Type, f.Meal_Type, ROUND({DISTANCE}, 1) AS Distance_Km
+        FROM origin o
+        CROSS JOIN Food_Listings f
+        JOIN Gazetteer g ON g.City = f.Location
+        WHERE {availability.LIVE} AND f.Expiry_Date >= ? AND {DISTANCE} <= o.Km
+        ORDER BY {DISTANCE}, f.Expiry_Date
+        LIMIT ?
+    """, (km, receiver_id, availability.now(), limit)
+
+
+APPROACHES = {"r-tree": rtree_query, "city scan": city_scan_query, "listing scan": listing_scan_query}
+
+
+def run(path, approach, receiver_id, km, limit=100):
+    query, params = APPROACHES[approach](receiver_id, km, limit)
+    return db.execute(query, params, path=path, fetchall=True)
+
+
+def sample_receivers(path):
+    """{label: receiver id} for receivers in the busiest, a middling and the quietest located city."""
+    with db.connection(path, readonly=True) as conn:
+        cities = [city for (city,) in conn.execute("""
+            SELECT s.Location FROM Summary_Locations s JOIN Gazetteer g ON g.City = s.Location
+            WHERE EXISTS (SELECT 1 FROM Receivers r WHERE r.City = s.Location)
+            ORDER BY s.Listing_Count DESC""")]
+        picks = {"busy": cities[0], "middling": cities[len(cities) // 2], "quiet": cities[-1]}
+        return {label: conn.execute("SELECT MIN(Receiver_ID) FROM Receivers WHERE City = ?", (city,)).fetchone()[0]
+                for label, city in picks.items()}
+
+
+def pad_gazetteer(path, n, seed=42):
+    """Add n made-up cities with no rows, scattered over the globe away from synthetic.REGION."""
+    rng = random.Random(seed)
+    south, north, west, east = synthetic.REGION
+    rows = []
+    while len(rows) < n:
+        lat, lon = rng.uniform(-60, 70), rng.uniform(-180, 180)
+        if not (south - 5 < lat < north + 5 and west - 5 < lon < east + 5):
+            rows.append((f"Padding {len(rows):06d}", round(lat, 5), round(lon, 5)))
+    with db.transaction(path) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        geo.load(conn, rows)
+
+
+def bench(path, receivers, repeat, approaches, radii):
+    rows, mismatches = [], []
+    for label, receiver_id in receivers.items():
+        for km in radii:
+            results = {}
+            for approach in approaches:
+                slow = approach == "listing scan"
+                rows.append((f"{label} city, {km} km, {approach}", summarize(time_calls(
+                    lambda: run(path, approach, receiver_id, km), max(3, repeat // 10) if slow else repeat, 1))))
+                results[approach] = {row[0] for row in run(path, approach, receiver_id, km, ALL)}
+            if len({frozenset(found) for found in results.values()}) > 1:
+                mismatches.append(f"{label} city, {km} km: " +
+                                  ", ".join(f"{len(found):,} via {name}" for name, found in results.items()))
+    return rows, mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", default="10k", help="synthetic database scale (see benchmarks/synthetic.py)")
+    parser.add_argument("--repeat", type=int, default=30)
+    args = parser.parse_args()
+
+    with temp_database(synthetic.database(args.scale)) as path:
+        receivers = sample_receivers(path)
+        with db.connection(path, readonly=True) as conn:
+            listings, cities = (conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                                for table in ("Food_Listings", "Gazetteer"))
+        rows, mismatches = bench(path, receivers, args.repeat, APPROACHES, RADII_KM)
+        print_table(f"Live listings near a receiver, first 100 ({listings:,} listings, {cities:,} cities)", rows)
+
+        pad_gazetteer(path, PADDING_CITIES)
+        rows, padded_mismatches = bench(path, receivers, args.repeat, ["r-tree", "city scan"], [25])
+        print_table(f"Same, gazetteer padded to {cities + PADDING_CITIES:,} cities", rows)
+
+        for mismatch in mismatches + padded_mismatches:
+            print(f"❌ results differ: {mismatch}")
+        if mismatches or padded_mismatches:
+            raise SystemExit(1)
+        print("\n✅ all approaches return the same listings for every receiver / radius")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Claim bursts: per-call commits vs the writer.py group-commit queue.
+
+Simulates a large donation being posted: --sessions threads (one per Streamlit session) each
+create --claims claims and move every one through Pending -> Approved -> Completed. With
+per-call commits each of those writes is its own transaction; with the queue
+(crud.submit_claim / submit_claim_update) they are committed in groups, with the writer waiting
+up to max_delay for more work before each commit. Queued writes are submitted without waiting for
+the previous one, so the run also checks that every claim ends up Completed (per-claim
+ordering held) and that the derived tables still match the base tables.
+
+    python -m benchmarks.bench_group_commit --sessions 16 --claims 200
+"""
+import argparse
+import random
+import sqlite3
+import threading
+import time
+
+import crud
+import db
+import timeutil
+import writer
+from benchmarks import synthetic
+from benchmarks.bench_async import consistency_problems
+from benchmarks.common import percentile, temp_database
+
+STATUSES = ("Approved", "Completed")
+
+
+def per_call(claim_id, food_id, receiver_id, latencies, errors):
+    calls = [lambda: crud.add_claim(claim_id, food_id, receiver_id, "Pending", timeutil.now(), 1)]
+    calls += [lambda status=status: crud.update_claim(claim_id, Status=status) for status in STATUSES]
+    for call in calls:
+        start = time.perf_counter()
+        try:
+            call()
+        except sqlite3.OperationalError:   # "database is locked" once busy_timeout runs out
+            errors.append(claim_id)
+        latencies.append(time.perf_counter() - start)
+
+
+def queued(claim_id, food_id, receiver_id, latencies, errors):
+    start = time.perf_counter()
+    futures = [crud.submit_claim(claim_id, food_id, receiver_id, "Pending", timeutil.now(), 1)]
+    futures += [crud.submit_claim_update(claim_id, Status=status) for status in STATUSES]
+    for future in futures:
+        try:
+            future.result()
+        except sqlite3.Error:
+            errors.append(claim_id)
+        latencies.append(time.perf_counter() - start)
+
+
+def burst(write, ids, food_ids, receiver_ids, sessions):
+    latencies, errors = [], []
+
+    def session(part):
+        for i in part:
+            write(ids[i], food_ids[i], receiver_ids[i], latencies, errors)
+
+    threads = [threading.Thread(target=session, args=(range(s, len(ids), sessions),)) for s in range(sessions)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", default="10k", help="synthetic database scale (see benchmarks/synthetic.py)")
+    parser.add_argument("--sessions", type=int, default=16, help="concurrent writers")
+    parser.add_argument("--claims", type=int, default=200, help="claims per session")
+    parser.add_argument("--delays", default="0,0.002,0.005,0.01", help="writer max_delay values to try (seconds)")
+    parser.add_argument("--max-queue", type=int, default=writer.MAX_QUEUE)
+    args = parser.parse_args()
+
+    modes = [("per-call commits, synchronous=NORMAL", per_call, {"synchronous": "NORMAL"}, None),
+             ("per-call commits, synchronous=FULL", per_call, {"synchronous": "FULL"}, None)]
+    modes += [(f"queued, max_delay={float(delay) * 1000:g}ms", queued, None, float(delay))
+              for delay in args.delays.split(",")]
+
+    with temp_database(synthetic.database(args.scale)) as path:
+        with db.connection(path, readonly=True) as conn:
+            max_food, max_receiver, max_claim = conn.execute(
+                "SELECT (SELECT MAX(Food_ID) FROM Food_Listings), (SELECT MAX(Receiver_ID) FROM Receivers),"
+                " (SELECT MAX(Claim_ID) FROM Claims)").fetchone()
+        rng = random.Random(3)
+        n = args.sessions * args.claims
+        food_ids = [rng.randint(1, max_food) for _ in range(n)]
+        receiver_ids = [rng.randint(1, max_receiver) for _ in range(n)]
+        pragmas = dict(db.PRAGMAS)
+
+        print(f"\n{args.sessions} sessions x {args.claims} claims x 3 writes")
+        print(f"{'mode':<40}{'writes/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}{'errors':>8}{'txns':>8}")
+        first, failed = max_claim + 1, False
+        for label, write, pragma, delay in modes:
+            ids = list(range(first, first + n))
+            first += n
+            if pragma:
+                db.configure(**pragma)
+            else:
+                writer.configure(max_delay=delay, max_queue=args.max_queue)
+            seconds, latencies, errors = burst(write, ids, food_ids, receiver_ids, args.sessions)
+            txns = writer.get_writer(path).stats()["groups"] if write is queued else len(latencies)
+            print(f"{label:<40}{len(latencies) / seconds:>10,.0f}{percentile(latencies, 50) * 1e3:>9.1f}"
+                  f"{percentile(latencies, 99) * 1e3:>9.1f}{max(latencies) * 1e3:>9.1f}{len(errors):>8}{txns:>8}")
+            writer.close_all()
+            db.configure(**pragmas)
+
+            with db.connection(path, readonly=True) as conn:
+                done = conn.execute("SELECT COUNT(*) FROM Claims WHERE Claim_ID BETWEEN ? AND ? AND Status = ?",
+                                    (ids[0], ids[-1], "Completed")).fetchone()[0]
+            if done != n:
+                print(f"   ❌ only {done:,} of {n:,} claims ended up Completed")
+                failed = True
+
+        problems = consistency_problems(path)
+        print(f"\n{'❌ ' + str(problems) if problems else '✅ derived tables consistent'}")
+        if failed or problems:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
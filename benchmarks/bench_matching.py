@@ -0,0 +1,89 @@
+"""Claim-matching throughput at 10k / 100k / 1M listings.
+
+    python -m benchmarks.bench_matching                      # in-memory allocation only
+    python -m benchmarks.bench_matching --db-max 100000      # also run matching.run() against SQLite up to 100k
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+import crud
+import matching
+import migrate
+from benchmarks.common import temp_database
+
+FOOD_TYPES = ["Vegetarian", "Non-Vegetarian", "Vegan"]
+MEAL_TYPES = ["Breakfast", "Lunch", "Dinner", "Snacks"]
+
+
+def synthetic(n_listings, seed=7):
+    """n listings over n/50 cities, and n/2 requests from receivers spread over the same cities."""
+    rng = random.Random(seed)
+    n_cities = max(1, n_listings // 50)
+    start = datetime.now() + timedelta(hours=1)
+    listings = [
+        matching.Listing(
+            food_id=i + 1,
+            location=f"City {rng.randrange(n_cities)}",
+            food_type=rng.choice(FOOD_TYPES),
+            meal_type=rng.choice(MEAL_TYPES),
+            expiry_date=(start + timedelta(minutes=rng.randrange(7 * 24 * 60))).strftime("%Y-%m-%d %H:%M:%S"),
+            available=rng.randint(5, 50),
+        )
+        for i in range(n_listings)
+    ]
+    n_receivers = max(1, n_listings // 10)
+    cities = {rid: f"City {rng.randrange(n_cities)}" for rid in range(1, n_receivers + 1)}
+    requests = [
+        matching.Request(
+            receiver_id=rng.randint(1, n_receivers),
+            quantity=rng.randint(5, 60),
+            food_type=rng.choice(FOOD_TYPES + [None]),
+            meal_type=rng.choice(MEAL_TYPES + [None, None]),
+        )
+        for _ in range(n_listings // 2)
+    ]
+    return listings, requests, cities
+
+
+def bench_memory(n):
+    listings, requests, cities = synthetic(n)
+    start = time.perf_counter()
+    allocations = matching.match(requests, listings, cities)
+    elapsed = time.perf_counter() - start
+    print(f"match()       {n:>10,} listings {len(requests):>9,} requests  {elapsed:8.3f}s  "
+          f"{len(requests) / elapsed:>12,.0f} req/s  {len(allocations):,} allocations")
+
+
+def bench_db(n):
+    listings, requests, cities = synthetic(n)
+    with temp_database(source=None) as path:
+        migrate.upgrade(path)
+        crud.add_receivers((rid, f"Receiver {rid}", "NGO", city, "") for rid, city in cities.items())
+        crud.add_food_listings(
+            (l.food_id, "Food", l.available, l.expiry_date, 1, "Restaurant", l.location, l.food_type, l.meal_type)
+            for l in listings
+        )
+        start = time.perf_counter()
+        allocations = matching.run(requests, path)
+        elapsed = time.perf_counter() - start
+    print(f"run() + write {n:>10,} listings {len(requests):>9,} requests  {elapsed:8.3f}s  "
+          f"{len(requests) / elapsed:>12,.0f} req/s  {len(allocations):,} claims inserted")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--db-max", type=int, default=0, help="largest size to also run against SQLite")
+    args = parser.parse_args()
+    print()
+    for n in args.sizes:
+        bench_memory(n)
+    for n in args.sizes:
+        if n <= args.db_max:
+            bench_db(n)
+
+
+if __name__ == "__main__":
+    main()
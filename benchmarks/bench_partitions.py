@@ -0,0 +1,113 @@
+"""Monthly partitions: recent-period analytics on one file vs. a small hot file plus monthly archives.
+
+Runs on the --history variant of the synthetic database (see benchmarks/synthetic.py), whose
+listings and claims span the past year. The claim analytics are timed for the last 30 and 90
+days and for all time (plain SQL time plus the merge, no result cache), first with everything in
+one file, then after partitions.compact() has moved every month but the last --hot-months out to
+archive files and VACUUMed the hot file: the recent-period calls then read the hot file and at
+most an archive or two, the all-time calls every file. Each call must return the same rows on
+both layouts (compared as sets, since ties may come back in another order), and the run ends
+with the derived-table consistency check of every file.
+
+    python -m benchmarks.bench_partitions --scale 1m
+"""
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+
+import availability
+import cache
+import partitions
+import queries
+from benchmarks import synthetic
+from benchmarks.bench_async import consistency_problems
+from benchmarks.common import print_table, summarize, temp_database, time_calls
+
+CALLS = {
+    "top_receivers": lambda start: queries.top_receivers(10, start),
+    "claims_per_food": lambda start: queries.claims_per_food(10, start),
+    "claim_status_percentage": lambda start: queries.claim_status_percentage(start),
+    "avg_quantity_per_receiver": lambda start: queries.avg_quantity_per_receiver(10, start),
+    "most_claimed_meal_type": lambda start: queries.most_claimed_meal_type(start),
+    "claim_counts_between": lambda start: queries.claim_counts_between(start or "2000-01-01", "2100-01-01"),
+}
+PERIODS = {"30d": 30, "90d": 90, "all": None}
+
+
+def since(days):
+    return (datetime.now().date() - timedelta(days=days)).isoformat() if days else None
+
+
+def read_all():
+    """{(name, period): set of rows} for every call and period, read fresh (NaN, i.e. NULL, as None)."""
+    cache.clear()
+    with queries.result_format("frame"):
+        return {(name, label): {tuple(None if value != value else value for value in row)
+                                for row in fn(since(days)).itertuples(index=False, name=None)}
+                for name, fn in CALLS.items() for label, days in PERIODS.items()}
+
+
+def time_reads(layout, repeat):
+    rows = []
+    with queries.result_format("frame"):
+        for name, fn in CALLS.items():
+            for label, days in PERIODS.items():
+                start = since(days)
+                rows.append((f"{name} {label}, {layout}",
+                             summarize(time_calls(lambda: fn(start), repeat, 1, setup=cache.clear))))
+    return rows
+
+
+def sizes(path):
+    """(hot file MB, archives MB, number of archives) of `path`."""
+    archives = partitions.archive_paths(path)
+    mb = lambda file: sum(os.path.getsize(f) for f in (file, file + "-wal") if os.path.exists(f)) / 1e6
+    return mb(path), sum(mb(archive) for archive in archives), len(archives)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", default="10k", help="synthetic database scale (see benchmarks/synthetic.py)")
+    parser.add_argument("--hot-months", type=int, default=partitions.HOT_MONTHS)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    # pin the clock, as bench_shards does, so nothing expires between the two layouts
+    as_of = availability.now()
+    availability.now = lambda: as_of
+    with temp_database(synthetic.database(args.scale, history=True)) as path:
+        before_sizes = sizes(path)
+        read_rows = time_reads("1 file", args.repeat)
+        expected = read_all()
+
+        start = time.perf_counter()
+        done = partitions.compact(path, args.hot_months, vacuum_hot=True)
+        compact_seconds = time.perf_counter() - start
+        got = read_all()
+        read_rows += time_reads("split", args.repeat)
+
+        print(f"\nCompacted {len(done)} months ({sum(m['listings'] for _, m, _ in done):,} listings, "
+              f"{sum(m['claims'] for _, m, _ in done):,} claims) in {compact_seconds:.2f}s, "
+              f"keeping {args.hot_months} months hot")
+        print(f"{'layout':<16}{'hot MB':>10}{'archives MB':>13}{'archives':>10}")
+        for label, (hot, archived, n) in (("1 file", before_sizes), ("split", sizes(path))):
+            print(f"{label:<16}{hot:>10.1f}{archived:>13.1f}{n:>10}")
+        print_table("Claim analytics by period, fresh (no result cache)", read_rows)
+
+        problems = [f"{name} ({label}): {len(expected[name, label]):,} rows in one file, "
+                    f"{len(got[name, label]):,} partitioned, {len(expected[name, label] ^ got[name, label]):,} differ"
+                    for name, label in expected if expected[name, label] != got[name, label]]
+        for file in partitions.files(path):
+            drift = consistency_problems(file)
+            if drift:
+                problems.append(f"{file}: {drift}")
+        for problem in problems:
+            print(f"❌ {problem}")
+        if problems:
+            raise SystemExit(1)
+        print("\n✅ partitioned analytics match the single file, derived tables consistent in every file")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""Columnar read model: analytics from the in-memory columns vs. SQL, and refreshing vs. reloading.
+
+Runs on the --history variant of the synthetic database (claims over the past year). The model
+is loaded and its memory reported per column, next to what pandas takes for the same columns
+read with pd.read_sql_query. The listing and claim analytics are then timed both ways, as
+DataFrames: queries.py fresh (no result cache, so the SQL round trip and the DataFrame build)
+and readmodel.py. After that, --writes claims are added, completed and a tenth of them deleted,
+and the refresh that applies those changes is timed against a full reload. The sweeper runs next
+(and must leave the donation analytics as they were), then a compaction into monthly archives,
+then a third of the listings left are deleted, which makes the model compact its columns; each is
+followed by a refresh. Both sides must agree after every step. Rows tied at a LIMIT may differ,
+so a key found on one side only must carry the smallest value shown.
+
+    python -m benchmarks.bench_readmodel --scale 1m --writes 5000
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import availability
+import cache
+import crud
+import db
+import partitions
+import queries
+import readmodel
+from benchmarks import synthetic
+from benchmarks.bench_changelog import write_run
+from benchmarks.common import print_table, summarize, temp_database, time_calls
+
+SINCE = (datetime.now().date() - timedelta(days=90)).isoformat()
+CALLS = {
+    "top_provider_types": (),
+    "city_with_most_listings": (),
+    "common_food_types": (),
+    "total_donated_per_provider": (10,),
+    "top_donated_foods": (5,),
+    "top_receivers": (10,),
+    "top_receivers 90d": (10, SINCE),
+    "claims_per_food": (10,),
+    "claims_per_food 90d": (10, SINCE),
+    "top_successful_provider": (),
+    "claim_status_percentage": (),
+    "claim_status_percentage 90d": (SINCE,),
+    "avg_quantity_per_receiver": (10,),
+    "avg_quantity_per_receiver 90d": (10, SINCE),
+    "most_claimed_meal_type": (),
+    "claim_counts_between 90d": (SINCE, "2100-01-01"),
+}
+# what was donated: the sweeper archiving expired listings must not change these
+DONATION_CALLS = ["top_provider_types", "city_with_most_listings", "common_food_types",
+                  "total_donated_per_provider", "top_donated_foods"]
+
+
+def call(module, name, args):
+    return getattr(module, name.split()[0])(*args)
+
+
+def differences(step):
+    """Messages for the calls on which queries.py and readmodel.py disagree."""
+    cache.clear()
+    problems = []
+    with queries.result_format("columns"):
+        for name, args in CALLS.items():
+            (keys, values), (got_keys, got_values) = (call(module, name, args).values()
+                                                      for module in (queries, readmodel))
+            expected, got = dict(zip(keys, values.tolist())), dict(zip(got_keys, got_values.tolist()))
+            smallest = min((v for v in values.tolist() if v == v), default=None)
+            close = lambda a, b: a == b or a != a and b != b or abs(a - b) <= 0.011   # NaN, ROUND() halves
+            wrong = [key for key in expected.keys() | got.keys()
+                     if not (key in expected and key in got and close(expected[key], got[key]))
+                     and not close((expected | got)[key], smallest)]
+            if len(keys) != len(got_keys) or wrong:
+                problems.append(f"{step}: {name}: {len(keys)} rows from SQL, {len(got_keys)} from the model, "
+                                f"{len(wrong)} differ, e.g. {sorted(map(str, wrong))[:3]}")
+    return problems
+
+
+def donations():
+    """queries.py's donation analytics, as plain lists."""
+    cache.clear()
+    with queries.result_format("columns"):
+        return {name: [values.tolist() for values in call(queries, name, CALLS[name]).values()]
+                for name in DONATION_CALLS}
+
+
+def pandas_mb(path):
+    """MB pandas takes for the model's columns of the file at `path`, strings as Python objects."""
+    import pandas as pd
+    with db.connection(path, readonly=True) as conn:
+        return sum(pd.read_sql_query(f"SELECT {', '.join(columns)} FROM {table}", conn)
+                   .memory_usage(index=True, deep=True).sum() for table, columns in readmodel.TABLES.items()) / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", default="10k", help="synthetic database scale (see benchmarks/synthetic.py)")
+    parser.add_argument("--writes", type=int, default=2000, help="claims added, then completed")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    # pin the clock, as bench_shards does, so nothing expires between the two sides
+    as_of = availability.now()
+    availability.now = lambda: as_of
+    with temp_database(synthetic.database(args.scale, history=True)) as path:
+        start = time.perf_counter()
+        model = readmodel.get(path)
+        load_seconds = time.perf_counter() - start
+        memory = model.memory()
+        frame_mb = pandas_mb(path)
+
+        rows = []
+        with queries.result_format("frame"):
+            for name, call_args in CALLS.items():
+                for label, module, setup in (("SQL", queries, cache.clear), ("model", readmodel, None)):
+                    rows.append((f"{name}, {label}", summarize(time_calls(
+                        lambda: call(module, name, call_args), args.repeat, 1, setup=setup))))
+        problems = differences("loaded")
+
+        food_ids = [row[0] for row in crud.find_food_listings(limit=1000)[0]]
+        first_id = db.execute("SELECT MAX(Claim_ID) FROM Claims", fetchone=True)[0] + 1
+        write_run(first_id, args.writes, food_ids)
+        start = time.perf_counter()
+        changes = model.refresh(force=True)
+        refresh_seconds = time.perf_counter() - start
+        problems += differences("after the writes")
+        start = time.perf_counter()
+        model.load()
+        reload_seconds = time.perf_counter() - start
+
+        donated = donations()
+        swept = availability.sweep(path, as_of=as_of)
+        problems += [f"after the sweep: {name} changed" for name, result in donations().items() if result != donated[name]]
+        swept_changes = model.refresh(force=True)
+        problems += differences("after the sweep")
+        compacted = partitions.compact(path)
+        compacted_changes = model.refresh(force=True)
+        problems += differences("after compaction")
+        # more than a quarter of the listings at once, so the model compacts its columns on the refresh
+        listing_ids = [food_id for (food_id,) in db.execute("SELECT Food_ID FROM Food_Listings", fetchall=True)]
+        deleted = listing_ids[::3]
+        marks = ", ".join("?" for _ in deleted)
+        crud.delete_claims([claim_id for (claim_id,) in db.execute(
+            f"SELECT Claim_ID FROM Claims WHERE Food_ID IN ({marks})", deleted, fetchall=True)])   # foreign keys
+        crud.delete_food_listings(deleted)
+        model.refresh(force=True)
+        problems += differences("after deleting a third of the listings")
+
+        print(f"\nLoaded {', '.join(f'{table.n - table.dead:,} {name}' for name, table in model.tables.items())} "
+              f"in {load_seconds:.2f}s")
+        print(f"{'column':<30}{'type':<34}{'MB':>8}")
+        for table, _, col, kind, size in memory:
+            print(f"{table + '.' + col:<30}{kind:<34}{size / 1e6:>8.2f}")
+        print(f"{'model total':<64}{sum(size for *_, size in memory) / 1e6:>8.2f}")
+        print(f"{'the same columns in pandas':<64}{frame_mb:>8.2f}")
+        print_table("Analytics as DataFrames: queries.py fresh (no result cache) vs. readmodel.py", rows)
+        print(f"\n{args.writes:,} claims added + completed, a tenth deleted: refresh applied {changes:,} changes "
+              f"in {refresh_seconds:.3f}s ({changes / refresh_seconds:,.0f}/s); a full reload takes {reload_seconds:.2f}s")
+        print(f"Sweeper archived {swept:,} listings: refresh applied {swept_changes:,} changes")
+        print(f"Compaction moved {len(compacted)} months to archives: refresh applied {compacted_changes:,} changes")
+        print(f"Deleted {len(deleted):,} listings; {model.loads} loads in all")
+        for problem in problems:
+            print(f"❌ {problem}")
+        if problems:
+            raise SystemExit(1)
+        print("\n✅ the read model matches queries.py after the load, the writes, the sweep, the compaction "
+              "and the deletes")
+
+
+if __name__ == "__main__":
+    main()
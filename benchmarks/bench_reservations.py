@@ -0,0 +1,155 @@
+"""Claim reservations under contention: check-then-insert vs. crud.reserve().
+
+--workers processes claim food from the same --listings live listings, each restocked to --stock
+kg, asking for 1-5 kg at a time until every listing is sold out. The naive run does what
+add_claim() callers did before: read what is left, then insert a Pending claim if it looked like
+enough, as two separate statements. The second run calls crud.reserve() with partial fills
+allowed, and the third does the same after the cities of half its listings were moved to a shard
+(see shards.py), so the claims go to two files. After each run every listing's holding claims are
+added up and compared with its Quantity; the naive run may over-allocate, reserve() must not. All
+claims are added without an id, and every Claim_ID must come out unique across the shard files.
+Half of the reservations are then cancelled and the listings' counters checked again, so the
+release path is covered too.
+
+    python -m benchmarks.bench_reservations --workers 8 --listings 50
+"""
+import argparse
+import collections
+import multiprocessing
+import os
+import random
+import sqlite3
+import time
+
+import availability
+import crud
+import db
+import shards
+import timeutil
+from benchmarks import synthetic
+from benchmarks.bench_async import consistency_problems
+from benchmarks.common import temp_database
+
+
+def naive(food_id, receiver_id, quantity):
+    left = db.execute("SELECT Quantity - Claimed_Quantity FROM Food_Listings WHERE Food_ID = ?",
+                      (food_id,), fetchone=True)[0]
+    if left < 1:
+        return None
+    crud.add_claim(None, food_id, receiver_id, "Pending", timeutil.now(), min(quantity, left))
+    return 1
+
+
+def reserving(food_id, receiver_id, quantity):
+    reservation = crud.reserve(food_id, receiver_id, quantity, min_quantity=1)
+    return reservation and reservation.attempts
+
+
+def worker(claim, food_ids, seed, results):
+    """Claim from food_ids until each has come back sold out; puts (claims, retries, locked errors) on results."""
+    rng = random.Random(seed)
+    food_ids = list(food_ids)
+    done = retries = errors = 0
+    while food_ids:
+        food_id = rng.choice(food_ids)
+        try:
+            attempts = claim(food_id, rng.randint(1, 100), rng.randint(1, 5))
+        except sqlite3.OperationalError:   # "database is locked" after the last try
+            errors += 1
+            continue
+        if attempts:
+            done += 1
+            retries += attempts - 1
+        else:
+            food_ids.remove(food_id)
+    results.put((done, retries, errors))
+
+
+def run(claim, food_ids, workers):
+    """(claims, retries, locked errors, seconds) of `workers` processes selling out food_ids."""
+    db.close_all()   # children must not share the parent's connections
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(claim, food_ids, i, results))
+                 for i in range(workers)]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    totals = [results.get() for _ in processes]
+    seconds = time.perf_counter() - start
+    for process in processes:
+        process.join()
+    return [sum(column) for column in zip(*totals)] + [seconds]
+
+
+def over_allocated(food_ids):
+    """(listings, kg) by which the holding claims on food_ids exceed the listings' Quantity, over every shard."""
+    marks = ", ".join("?" for _ in food_ids)
+    holds = availability.HOLDING.replace("{row}", "c")
+    totals = [db.execute(f"""
+        SELECT COUNT(*), IFNULL(SUM(Held - Quantity), 0) FROM (
+            SELECT f.Quantity, SUM(c.Quantity) AS Held FROM Food_Listings f
+            JOIN Claims c ON c.Food_ID = f.Food_ID AND {holds}
+            WHERE f.Food_ID IN ({marks}) GROUP BY f.Food_ID
+        ) WHERE Held > Quantity
+    """, food_ids, path=path, fetchone=True) for path in shards.paths()]
+    return [sum(column) for column in zip(*totals)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", default="10k", help="synthetic database scale (see benchmarks/synthetic.py)")
+    parser.add_argument("--workers", type=int, default=8, help="claiming processes")
+    parser.add_argument("--listings", type=int, default=50, help="listings claimed from in each run")
+    parser.add_argument("--stock", type=int, default=200, help="kg each listing is restocked to")
+    args = parser.parse_args()
+
+    # pin the clock so no listing expires in the middle of a run
+    as_of = availability.now()
+    availability.now = lambda: as_of
+    with temp_database(synthetic.database(args.scale)) as path:
+        live = [food_id for (food_id,) in db.execute(f"""
+            SELECT Food_ID FROM Food_Listings WHERE {availability.LIVE} AND Expiry_Date >= ?
+            ORDER BY Food_ID LIMIT ?""", (as_of, 3 * args.listings), fetchall=True)]
+        crud.update_food_listings([(food_id, {"Quantity": args.stock}) for food_id in live])
+        before = {row[0] for row in crud.get_claims()}
+
+        rows = []
+        runs = (("check, then add_claim()", naive), ("crud.reserve()", reserving), ("crud.reserve(), 2 shards", reserving))
+        for i, (label, claim) in enumerate(runs):
+            food_ids = live[i::3]
+            if i == 2:
+                marks = ", ".join("?" for _ in food_ids)
+                cities = sorted({city for (city,) in db.execute(
+                    f"SELECT Location FROM Food_Listings WHERE Food_ID IN ({marks})", food_ids, fetchall=True)})
+                shards.move_cities(cities[::2], "north")
+            rows.append((label, *run(claim, food_ids, args.workers), *over_allocated(food_ids)))
+
+        claims = crud.get_claims()
+        duplicates = [claim_id for claim_id, n in collections.Counter(row[0] for row in claims).items() if n > 1]
+        naive_ids = set(live[0::3])
+        reserved = sorted(row[0] for row in claims if row[0] not in before and row[1] not in naive_ids)
+        if duplicates:
+            print(f"❌ {len(duplicates):,} Claim_IDs were handed out in more than one shard, e.g. {duplicates[:5]}")
+            raise SystemExit(1)
+        crud.update_claims([(claim_id, {"Status": "Cancelled"}) for claim_id in reserved[::2]])
+        problems = {}
+        for shard in shards.paths(path):
+            problems.update({f"{os.path.basename(shard)}: {name}": n for name, n in consistency_problems(shard).items()})
+
+        print(f"\n{args.workers} processes selling out {args.listings} listings of {args.stock} kg each run, "
+              f"1-5 kg per claim")
+        print(f"{'':<26}{'claims':>8}{'claims/s':>10}{'retries':>9}{'locked':>8}{'over-allocated':>18}")
+        for label, done, retries, errors, seconds, listings, kg in rows:
+            print(f"{label:<26}{done:>8,}{done / seconds:>10,.0f}{retries:>9,}{errors:>8,}"
+                  f"{f'{listings} ({kg:,} kg)':>18}")
+        print(f"Cancelled {len(reserved[::2]):,} reservations; counter drift after the release: {problems or 'none'}")
+        if rows[1][-2] or rows[2][-2] or problems:
+            print("❌ reserve() over-allocated or the hold counters drifted")
+            raise SystemExit(1)
+        print("\n✅ no listing was over-allocated through reserve(), every Claim_ID is unique across the shards, "
+              "and cancelling gave the food back")
+
+
+if __name__ == "__main__":
+    main()
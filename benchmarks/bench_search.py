@@ -0,0 +1,70 @@
+"""Name search latency: the FTS5 indexes (crud.search_*) against LIKE '%text%' scans.
+
+Each search term is run through crud.search_* (ranked, first page) and through the LIKE query a
+dispatcher would otherwise use (unranked, first page, so a common term can stop early while a
+rare one scans the whole table). The FTS5 path is checked against a p95 latency target.
+
+    python -m benchmarks.bench_search --scale 1m
+"""
+import argparse
+
+import crud
+import db
+import search
+from benchmarks import synthetic
+from benchmarks.common import print_table, summarize, temp_database, time_calls
+
+TARGET_P95_MS = 25
+
+TERMS = {
+    "Food_Listings": ["bre", "bread", "tofu", "bread, soup"],
+    "Providers": ["gonz", "gonz coch", "ltd", "zzz"],
+    "Receivers": ["smi", "baker king", "and", "zzz"],
+}
+SEARCH = {"Food_Listings": crud.search_food_listings, "Providers": crud.search_providers,
+          "Receivers": crud.search_receivers}
+
+
+def like_search(table, text, limit=crud.PAGE_SIZE):
+    """Every word of `text` somewhere in the name, the way it's done without an index."""
+    column = search.BY_SOURCE[table]["columns"][0]
+    words = search._WORD.findall(text)
+    where = " AND ".join(f"{column} LIKE ?" for _ in words)
+    return crud.run_query(f"SELECT {', '.join(crud.COLUMNS[table])} FROM {table} WHERE {where} LIMIT ?",
+                          tuple(f"%{word}%" for word in words) + (limit,), fetchall=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", default="10k", help="synthetic database scale (see benchmarks/synthetic.py)")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    with temp_database(synthetic.database(args.scale)) as path:
+        rows, misses = [], []
+        for table, terms in TERMS.items():
+            for text in terms:
+                stats = summarize(time_calls(lambda: SEARCH[table](text), args.repeat, 2))
+                rows.append((f"{table} fts {text!r}", stats))
+                if stats["p95_us"] > TARGET_P95_MS * 1000:
+                    misses.append(f"{table} {text!r}: p95 {stats['p95_us'] / 1000:.1f} ms")
+                if "," not in text:
+                    rows.append((f"{table} like {text!r}",
+                                 summarize(time_calls(lambda: like_search(table, text), max(3, args.repeat // 10), 1))))
+        with db.connection(path, readonly=True) as conn:
+            sizes = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in TERMS}
+        print_table("Name search, first page (" + ", ".join(f"{t} {n:,}" for t, n in sizes.items()) + " rows)", rows)
+
+        with db.transaction(path) as conn:
+            problems = search.check(conn)
+        print(f"\n{'❌ ' + str(problems) if problems else '✅ search indexes match their tables'}")
+        for miss in misses:
+            print(f"❌ over the {TARGET_P95_MS} ms p95 target: {miss}")
+        if not misses:
+            print(f"✅ every search within the {TARGET_P95_MS} ms p95 target")
+        if problems or misses:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
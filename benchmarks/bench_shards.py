@@ -0,0 +1,162 @@
+"""Sharding by city: write throughput of writers in different cities, fan-out read latency, moves.
+
+Each of --writers processes (one per city, the busiest cities) adds claims on its own city's
+listings and completes them, two per-call commits per claim, for --seconds: first with every city
+in one file, then with each writer's city moved to a shard of its own (the first stays home), so
+the writers no longer queue on one write lock. The analytics below are timed on both layouts
+(plain SQL time plus the merge, no result cache) and must return the same rows; ties in the sort
+order may come back in another order, so rows are compared as sets. The moves themselves are timed
+too, and the run ends with shards.check() and the per-shard derived-table consistency check.
+
+    python -m benchmarks.bench_shards --scale 1m --writers 4
+"""
+import argparse
+import multiprocessing
+import sqlite3
+import time
+
+import availability
+import cache
+import crud
+import db
+import keys
+import queries
+import shards
+import timeutil
+from benchmarks import synthetic
+from benchmarks.bench_async import consistency_problems
+from benchmarks.common import print_table, summarize, temp_database, time_calls
+
+READS = {
+    "total_food_available": (),
+    "top_receivers": (),
+    "claims_per_food": (),
+    "claim_status_percentage": (),
+    "avg_quantity_per_receiver": (),
+    "monthly_claim_trend": (),
+    "claim_status_by_month": (),
+    "claims_between": ("2000-01-01", "2100-01-01"),
+}
+
+
+def busiest_cities(path, n):
+    with db.connection(path, readonly=True) as conn:
+        return [city for (city,) in conn.execute(
+            "SELECT Location FROM Summary_Locations ORDER BY Listing_Count DESC LIMIT ?", (n,))]
+
+
+def write_worker(city, first_id, seconds, results):
+    """Claim listings of `city` for `seconds`; puts (writes, locked errors) on results."""
+    food_ids = [row[0] for row in crud.find_food_listings({"Location": city}, limit=1000)[0]]
+    writes = errors = 0
+    claim_id = first_id
+    until = time.perf_counter() + seconds
+    while time.perf_counter() < until:
+        try:
+            crud.add_claim(claim_id, food_ids[claim_id % len(food_ids)], 1, "Pending", timeutil.now(), 1)
+            crud.update_claim(claim_id, Status="Completed")
+            writes += 2
+        except sqlite3.OperationalError:   # "database is locked" once busy_timeout runs out
+            errors += 1
+        claim_id += 1
+    results.put((writes, errors))
+
+
+def write_run(cities, first_id, seconds):
+    """Total writes/s and errors of one process per city, all running at once."""
+    db.close_all()   # children must not share the parent's connections
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    workers = [context.Process(target=write_worker, args=(city, first_id + i * 10**7, seconds, results))
+               for i, city in enumerate(cities)]
+    for worker in workers:
+        worker.start()
+    totals = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    return sum(w for w, _ in totals) / seconds, sum(e for _, e in totals)
+
+
+def read_all():
+    """{name: set of rows} for every READS call, read fresh (NaN, i.e. NULL, as None so rows compare)."""
+    cache.clear()
+    with queries.result_format("frame"):
+        return {name: {tuple(None if value != value else value for value in row)
+                       for row in getattr(queries, name)(*args).itertuples(index=False, name=None)}
+                for name, args in READS.items()}
+
+
+def time_reads(label, repeat):
+    rows = []
+    with queries.result_format("frame"):
+        for name, args in READS.items():
+            fn = getattr(queries, name)
+            rows.append((f"{name}, {label}", summarize(time_calls(lambda: fn(*args), repeat, 1, setup=cache.clear))))
+    return rows
+
+
+def layout_problems(path):
+    """Misplaced listings and derived-table drift in any shard, as messages."""
+    problems = [f"{n:,} listings of {city!r} in shard {name!r}" for name, city, n in shards.check(path)]
+    for shard in shards.paths(path):
+        drift = consistency_problems(shard)
+        if drift:
+            problems.append(f"{shard}: {drift}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", default="10k", help="synthetic database scale (see benchmarks/synthetic.py)")
+    parser.add_argument("--writers", type=int, default=2, help="writer processes, one city and shard each")
+    parser.add_argument("--seconds", type=float, default=3.0, help="duration of each write run")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    # pin the clock: listings expiring during the run would otherwise change the live-quantity answers
+    as_of = availability.now()
+    availability.now = lambda: as_of
+    with temp_database(synthetic.database(args.scale)) as path:
+        cities = busiest_cities(path, args.writers)
+        # ids handed out up front: writes with ids above the home sequence would each have to raise it
+        first_id = keys.allocate("Claims", 2 * args.writers * 10**7, path)
+
+        read_rows = time_reads("one file", args.repeat)
+        one_file = write_run(cities, first_id, args.seconds)
+        expected = read_all()
+
+        start = time.perf_counter()
+        moved = [shards.move_cities([city], f"s{i}") for i, city in enumerate(cities) if i]
+        move_seconds = time.perf_counter() - start
+        got = read_all()   # before the second write run, which adds claims
+        read_rows += time_reads(f"{args.writers} shards", args.repeat)
+        sharded = write_run(cities, first_id + args.writers * 10**7, args.seconds)
+
+        print(f"\n{args.writers} writer processes, one city each, {args.seconds:g}s per run")
+        print(f"{'layout':<24}{'writes/s':>10}{'locked':>8}")
+        for label, (rate, errors) in (("one file", one_file), (f"{args.writers} shards", sharded)):
+            print(f"{label:<24}{rate:>10,.0f}{errors:>8}")
+        print(f"\nMoved {sum(m['listings'] for m in moved):,} listings and {sum(m['claims'] for m in moved):,} "
+              f"claims to {len(moved)} shards in {move_seconds:.2f}s")
+        print_table("Analytics, fresh (no result cache)", read_rows)
+
+        problems = layout_problems(path)
+        start = time.perf_counter()
+        shards.move_cities(cities[1:], shards.HOME)
+        print(f"\nMoved them back in {time.perf_counter() - start:.2f}s")
+        problems += layout_problems(path)
+
+        for name in READS:
+            if expected[name] != got[name]:
+                problems.append(f"{name}: {len(expected[name]):,} rows in one file, {len(got[name]):,} merged, "
+                                f"{len(expected[name] ^ got[name]):,} differ")
+        for problem in problems:
+            print(f"❌ {problem}")
+        if problems:
+            raise SystemExit(1)
+        print("\n✅ merged analytics match the single file, every listing is in its city's shard, "
+              "derived tables consistent")
+
+
+if __name__ == "__main__":
+    main()
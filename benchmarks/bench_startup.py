@@ -0,0 +1,134 @@
+"""Cold start of the Streamlit app: import-time breakdown and time to first render, per page.
+
+Every sample is a fresh `python -X importtime` process, as in a newly started container: it
+renders the Home page with Streamlit's AppTest (the landing page, so process start to the end of
+that render is the time to first render), then switches to the page under test, then reruns that page once more. Two
+variants are timed: the app as it is, and "eager", which imports pandas and queries.py before the
+app runs, the way app.py used to at its top. The import breakdown lists the top-level modules
+that took longest to import over the whole run, split into those loaded before the first Home
+render finished and those loaded by the page switch.
+
+Each process runs in a scratch directory with its own copy of the database, migrated beforehand
+as a deployed one would be, so the real food_wastage.db is never touched.
+
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --scale 1m --pages Home Analysis --repeat 5
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+import db
+import migrate
+from benchmarks import synthetic
+from benchmarks.common import ROOT, SHIPPED_DB, temp_database
+
+PAGES = ["Home", "Providers", "Receivers", "Food Listings", "Claims", "Analysis"]
+HEAVY = ["pandas", "numpy", "pyarrow", "tabulate"]
+TOP_IMPORTS = 8
+
+# runs in the child process; prints one JSON line
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+if {eager!r}:
+    import pandas, queries
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({app!r}, default_timeout=600)
+at.run()
+home = time.perf_counter()
+sys.stderr.write("--- first render ---\\n")
+loaded_at_home = [m for m in {heavy!r} if m in sys.modules]
+if {page!r} != "Home":
+    at.sidebar.radio[0].set_value({page!r}).run()
+switched = time.perf_counter()
+at.run()
+rerun = time.perf_counter()
+print(json.dumps({{
+    "first render": home - start, "page": switched - home, "rerun": rerun - switched,
+    "loaded_at_home": loaded_at_home, "loaded": [m for m in {heavy!r} if m in sys.modules],
+    "errors": [e.message for e in at.exception],
+}}))
+"""
+
+_IMPORT_LINE = re.compile(r"import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def top_level_imports(stderr):
+    """({module: cumulative us} before the first render, {module: cumulative us} after it),
+    counting only imports made directly by the app or the harness, not their nested imports."""
+    before, after = {}, {}
+    current = before
+    for line in stderr.splitlines():
+        if line.startswith("--- first render ---"):
+            current = after
+            continue
+        match = _IMPORT_LINE.match(line)
+        if match and not match.group(2):
+            current[match.group(3)] = current.get(match.group(3), 0) + int(match.group(1))
+    return before, after
+
+
+def sample(database, page, eager):
+    """Run one fresh process; returns (timings dict, imports before, imports after)."""
+    workdir = tempfile.mkdtemp(prefix="fw_startup_")
+    try:
+        shutil.copyfile(database, os.path.join(workdir, "food_wastage.db"))
+        code = CHILD.format(root=ROOT, app=os.path.join(ROOT, "app.py"), page=page, eager=eager, heavy=HEAVY)
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=workdir,
+                              capture_output=True, text=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{page}: child process failed\n{proc.stderr[-2000:]}")
+    timings = json.loads(proc.stdout.strip().splitlines()[-1])
+    if timings["errors"]:
+        raise RuntimeError(f"{page}: {timings['errors'][0]}")
+    return (timings, *top_level_imports(proc.stderr))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", default="shipped", help="'shipped' or a synthetic scale (see benchmarks/synthetic.py)")
+    parser.add_argument("--pages", nargs="+", default=PAGES)
+    parser.add_argument("--repeat", type=int, default=3, help="fresh processes per page and variant (median)")
+    args = parser.parse_args()
+
+    with temp_database(SHIPPED_DB if args.scale == "shipped" else synthetic.database(args.scale)) as database:
+        migrate.upgrade(database)
+        db.close_all()
+        report(database, args.pages, args.repeat)
+
+
+def report(database, pages, repeat):
+    print(f"\n{'page':<16}{'variant':<8}{'first render s':>15}{'page s':>8}{'rerun s':>9}"
+          f"   heavy modules at first render / after the page")
+    breakdown = {}
+    for page in pages:
+        for eager in (True, False):
+            runs = [sample(database, page, eager) for _ in range(repeat)]
+            median = {key: statistics.median(run[0][key] for run in runs)
+                      for key in ("first render", "page", "rerun")}
+            first = runs[0][0]
+            print(f"{page:<16}{'eager' if eager else 'lazy':<8}{median['first render']:>15.2f}{median['page']:>8.2f}"
+                  f"{median['rerun']:>9.2f}   "
+                  f"{','.join(first['loaded_at_home']) or '-'} / {','.join(first['loaded']) or '-'}")
+            if not eager:
+                breakdown[page] = runs[0][1:]
+
+    for page, (before, after) in breakdown.items():
+        print(f"\nSlowest top-level imports, {page} (lazy), ms:")
+        for label, imports in (("  up to the first render", before), ("  switching to the page", after)):
+            slowest = sorted(imports.items(), key=lambda item: -item[1])[:TOP_IMPORTS]
+            print(label + ": " + (", ".join(f"{name} {us / 1000:.0f}" for name, us in slowest) or "-"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""Latency of every crud.* and queries.* function and of each app.py page, on synthetic data.
+
+Runs against a scratch copy of a synthetic database (see benchmarks/synthetic.py), reports
+p50 / p95 / p99 latency, throughput and the process's peak RSS after each case, and can save
+the lot as JSON and compare it with an earlier run.
+
+    python -m benchmarks.bench_suite --scale 10k --output bench_10k.json
+    python -m benchmarks.bench_suite --scale 1m --compare bench_1m_before.json --max-regression 0.25
+    python -m benchmarks.bench_suite --scale shipped --only queries.   # the bundled database
+
+queries.* are timed with the result cache cleared before every call, so they measure SQL, not
+a dictionary lookup. Write cases run on rows the suite creates itself. A page render includes
+the Home render that AppTest needs before it can switch pages.
+"""
+import argparse
+import inspect
+import itertools
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import time
+from datetime import datetime, timedelta
+
+import cache
+import crud
+import db
+import migrate
+import queries
+import timeutil
+from benchmarks import synthetic
+from benchmarks.common import ROOT, SHIPPED_DB, peak_rss_mb, summarize, temp_database, time_calls
+
+PAGES = ["Home", "Providers", "Receivers", "Food Listings", "Claims", "Analysis"]
+
+# crud functions that are building blocks of the per-entity ones and are timed through them
+CRUD_HELPERS = {"run_query", "run_many", "update_many", "delete_many", "find_rows", "capture_writes", "search_rows"}
+
+BATCH = 100   # rows per call for the batch cases
+
+
+class Fixture:
+    """Sample keys from the database under test and hand out fresh ones for inserts."""
+
+    def __init__(self, path, seed=42):
+        self.rng = random.Random(seed)
+        with db.connection(path, readonly=True) as conn:
+            self.max_id = {table: conn.execute(f"SELECT MAX({cols[0]}) FROM {table}").fetchone()[0] or 0
+                           for table, cols in crud.COLUMNS.items()}
+            self.city = conn.execute("SELECT City FROM Summary_Providers_City ORDER BY Provider_Count DESC").fetchone()[0]
+            self.location = conn.execute("SELECT Location FROM Summary_Locations ORDER BY Listing_Count DESC").fetchone()[0]
+            # a receiver in the busiest city, for the distance queries
+            self.receiver = (conn.execute("SELECT Receiver_ID FROM Receivers WHERE City = ?", (self.city,)).fetchone()
+                             or conn.execute("SELECT MIN(Receiver_ID) FROM Receivers").fetchone())[0]
+            months = [row[0] for row in conn.execute("SELECT Month FROM Summary_Claims_Month ORDER BY Month")]
+            # the first few letters of a common name, as typed into a search box
+            self.search_text = {
+                "Providers": conn.execute("SELECT Name FROM Providers LIMIT 1").fetchone()[0][:4],
+                "Receivers": conn.execute("SELECT Name FROM Receivers LIMIT 1").fetchone()[0][:4],
+                "Food_Listings": conn.execute("SELECT Food_Name FROM Summary_Food_Names "
+                                              "ORDER BY Listing_Count DESC").fetchone()[0][:3],
+            }
+        self.months = months or ["2025-01"]
+        self.next_id = {table: itertools.count(max_id + 1_000_000) for table, max_id in self.max_id.items()}
+
+    def existing(self, table):
+        return self.rng.randint(1, max(1, self.max_id[table]))
+
+    def fresh(self, table):
+        return next(self.next_id[table])
+
+    def row(self, table, key):
+        """A valid row for `table` in the matching add_* function's argument order."""
+        if table == "Providers":
+            return (key, f"Bench Provider {key}", "Restaurant", "1 Bench Street", self.city, "+1-555-0000000")
+        if table == "Receivers":
+            return (key, f"Bench Receiver {key}", "NGO", self.city, "+1-555-0000000")
+        if table == "Food_Listings":
+            expiry = (datetime.now() + timedelta(days=1)).strftime(timeutil.FORMAT)
+            return (key, "Rice", 10, expiry, self.existing("Providers"), "Restaurant", self.location,
+                    "Vegetarian", "Lunch")
+        return (key, self.existing("Food_Listings"), self.existing("Receivers"), "Pending", timeutil.now(), 1)
+
+
+def crud_cases(fx):
+    """{crud function name: (fn, setup or None, rows per call)}."""
+    cases = {}
+    entities = [
+        ("Providers", "provider", "providers", {"City": fx.city}, {"Contact": "+1-555-1111111"}),
+        ("Receivers", "receiver", "receivers", {"City": fx.city}, {"Contact": "+1-555-1111111"}),
+        ("Food_Listings", "food", "food_listings", {"Location": fx.location}, {"Quantity": 20}),
+        ("Claims", "claim", "claims", {"Status": "Pending"}, {"Status": "Completed"}),
+    ]
+    for table, one, many, filters, change in entities:
+        by_id = "get_food_by_id" if one == "food" else f"get_{one}_by_id"
+        get_all = f"get_{many}"
+        add_one, add_many = getattr(crud, f"add_{one}"), getattr(crud, f"add_{many}")
+        pending = []   # keys added by setup for the delete cases to remove
+
+        def stage(table=table, add_one=add_one, pending=pending, n=1):
+            keys = [fx.fresh(table) for _ in range(n)]
+            if n == 1:
+                add_one(*fx.row(table, keys[0]))
+            else:
+                crud.run_many(synthetic.insert_sql(table), [fx.row(table, key) for key in keys])
+            pending.append(keys)
+
+        cases[f"add_{one}"] = (lambda table=table, add_one=add_one: add_one(*fx.row(table, fx.fresh(table))), None, 1)
+        cases[by_id] = (lambda table=table, fn=getattr(crud, by_id): fn(fx.existing(table)), None, 1)
+        cases[get_all] = (getattr(crud, get_all), None, fx.max_id[table])
+        cases[f"find_{many}"] = (lambda fn=getattr(crud, f"find_{many}"), filters=filters: fn(filters), None,
+                                 crud.PAGE_SIZE)
+        if table in fx.search_text:
+            cases[f"search_{many}"] = (lambda fn=getattr(crud, f"search_{many}"), text=fx.search_text[table]:
+                                       fn(text), None, crud.PAGE_SIZE)
+        cases[f"update_{one}"] = (lambda table=table, fn=getattr(crud, f"update_{one}"), change=change:
+                                  fn(fx.existing(table), **change), None, 1)
+        cases[f"delete_{one}"] = (lambda fn=getattr(crud, f"delete_{one}"), pending=pending: fn(pending.pop()[0]),
+                                  stage, 1)
+        cases[f"add_{many}"] = (lambda table=table, add_many=add_many:
+                                add_many([fx.row(table, fx.fresh(table)) for _ in range(BATCH)]), None, BATCH)
+        cases[f"update_{many}"] = (lambda table=table, fn=getattr(crud, f"update_{many}"), change=change:
+                                   fn([(fx.existing(table), change) for _ in range(BATCH)]), None, BATCH)
+        cases[f"delete_{many}"] = (lambda fn=getattr(crud, f"delete_{many}"), pending=pending: fn(pending.pop()),
+                                   lambda stage=stage: stage(n=BATCH), BATCH)
+    cases["distinct_values"] = (lambda: crud.distinct_values("Food_Listings", "Location"), None, 1)
+    # a lone queued write waits out writer.MAX_DELAY; bench_group_commit measures them in bursts
+    cases["submit_claim"] = (lambda: crud.submit_claim(*fx.row("Claims", fx.fresh("Claims"))).result(), None, 1)
+    cases["submit_claim_update"] = (lambda: crud.submit_claim_update(fx.existing("Claims"), Status="Completed")
+                                    .result(), None, 1)
+    # reserve() takes from one listing stocked so that it never sells out, added on first use
+    stocked = []
+
+    def stock():
+        if not stocked:
+            stocked.append(fx.fresh("Food_Listings"))
+            row = fx.row("Food_Listings", stocked[0])
+            crud.add_food(*row[:2], 10**9, *row[3:])
+
+    cases["reserve"] = (lambda: crud.reserve(stocked[0], fx.existing("Receivers"), 1), stock, 1)
+    return cases
+
+
+def query_args(fx):
+    """Sample arguments for the queries.* functions that have required parameters."""
+    start = f"{fx.months[0]}-01"
+    end = f"{fx.months[-1]}-28"
+    return {
+        "provider_contacts_by_city": (fx.city,),
+        "claim_counts_between": (start, end),
+        "claims_between": (start, end),
+        "providers_near_receiver": (fx.receiver,),
+        "food_near_receiver": (fx.receiver,),
+        "nearest_food": (fx.receiver,),
+    }
+
+
+def public_functions(module, skip=()):
+    return [(name, fn) for name, fn in inspect.getmembers(module, inspect.isfunction)
+            if fn.__module__ == module.__name__ and not name.startswith("_") and name not in skip]
+
+
+def run_case(results, args, group, name, fn, setup=None, rows_per_call=1, repeat=None, budget=None, warmup=2):
+    label = f"{group}.{name}"
+    if args.only and not any(label.startswith(prefix) for prefix in args.only):
+        return
+    repeat = repeat or args.repeat
+    budget = budget or args.budget
+    entry = {"name": label, "group": group, "rows_per_call": rows_per_call}
+    try:
+        samples = time_calls(fn, repeat=repeat, warmup=warmup, setup=setup, budget=budget)
+    except Exception as e:   # one broken case shouldn't lose the rest of the run
+        entry["error"] = f"{type(e).__name__}: {e}"
+        print(f"{label:<45}❌ {entry['error']}")
+    else:
+        stats = summarize(samples)
+        total = sum(samples)
+        entry.update(stats)
+        entry["calls_per_sec"] = stats["calls"] / total if total else None
+        entry["rows_per_sec"] = rows_per_call * stats["calls"] / total if total else None
+        print(f"{label:<45}{stats['p50_us']:>12.1f}{stats['p95_us']:>12.1f}{stats['p99_us']:>12.1f}"
+              f"{entry['calls_per_sec']:>12,.1f}{peak_rss_mb() or 0:>10.1f}")
+    entry["peak_rss_mb"] = peak_rss_mb()
+    results.append(entry)
+
+
+def bench_queries(results, fx, args):
+    sample_args = query_args(fx)
+    for name, fn in public_functions(queries, skip=set(migrate.QUERY_HELPERS)):
+        params = sample_args.get(name, ())
+        run_case(results, args, "queries", name, lambda fn=fn, params=params: fn(*params), setup=cache.clear)
+
+
+def bench_crud(results, fx, args):
+    cases = crud_cases(fx)
+    for name, _ in public_functions(crud):
+        if name in CRUD_HELPERS:
+            continue
+        if name not in cases:
+            if args.only and not any(f"crud.{name}".startswith(prefix) for prefix in args.only):
+                continue
+            results.append({"name": f"crud.{name}", "group": "crud", "error": "no benchmark case"})
+            print(f"{'crud.' + name:<45}⚠️ no benchmark case")
+            continue
+        fn, setup, rows = cases[name]
+        run_case(results, args, "crud", name, fn, setup, rows)
+
+
+def bench_app(results, args):
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        print("streamlit is not installed; skipping page renders")
+        return
+    app_path = os.path.join(ROOT, "app.py")
+
+    def render(page):
+        at = AppTest.from_file(app_path, default_timeout=600)
+        at.run()
+        if page != "Home":
+            at.sidebar.radio[0].set_value(page).run()
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+
+    for page in PAGES:
+        run_case(results, args, "app", page, lambda page=page: render(page), setup=cache.clear,
+                 repeat=args.app_repeat, budget=args.budget * 5, warmup=1)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path, max_regression):
+    """Print the p50 change of every case also in the baseline. Returns the names that regressed."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {case["name"]: case for case in json.load(f)["cases"]}
+    regressed = []
+    print(f"\n{'case':<45}{'before p50':>12}{'after p50':>12}{'change':>10}")
+    for case in results:
+        before = baseline.get(case["name"])
+        if not before or "p50_us" not in before or "p50_us" not in case:
+            continue
+        change = case["p50_us"] / before["p50_us"] - 1 if before["p50_us"] else 0.0
+        flag = ""
+        if max_regression is not None and change > max_regression:
+            regressed.append(case["name"])
+            flag = " ❌"
+        print(f"{case['name']:<45}{before['p50_us']:>12.1f}{case['p50_us']:>12.1f}{change:>+10.1%}{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", default="10k", help="10k, 1m, 10m, a row count, or 'shipped'")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=200, help="max calls per case")
+    parser.add_argument("--app-repeat", type=int, default=5, help="max renders per page")
+    parser.add_argument("--budget", type=float, default=2.0, help="seconds of timing per case before stopping early")
+    parser.add_argument("--only", action="append", default=[], help="run cases whose name starts with this (repeatable)")
+    parser.add_argument("--skip-app", action="store_true")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON from an earlier run to compare p50s against")
+    parser.add_argument("--max-regression", type=float, help="exit 1 if any p50 grew by more than this fraction")
+    args = parser.parse_args()
+
+    source = SHIPPED_DB if args.scale == "shipped" else synthetic.database(args.scale, args.seed)
+    started = datetime.now()
+    results = []
+    with temp_database(source) as path:
+        migrate.upgrade(path)
+        fx = Fixture(path, args.seed)
+        print(f"\n{'case':<45}{'p50 us':>12}{'p95 us':>12}{'p99 us':>12}{'calls/s':>12}{'RSS MB':>10}")
+        bench_queries(results, fx, args)
+        bench_crud(results, fx, args)
+        if not args.skip_app:
+            bench_app(results, args)
+
+    report = {
+        "scale": args.scale,
+        "seed": args.seed,
+        "started_at": started.strftime(timeutil.FORMAT),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "peak_rss_mb": peak_rss_mb(),
+        "cases": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n✅ wrote {len(results)} case(s) to {args.output}")
+    if args.compare:
+        regressed = compare(results, args.compare, args.max_regression)
+        if regressed:
+            print(f"\n❌ {len(regressed)} case(s) regressed by more than {args.max_regression:.0%}")
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+import crud
+import db
+import queries
+import writer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SHIPPED_DB = os.path.join(ROOT, "food_wastage.db")
+
+
+@contextmanager
+def temp_database(source=SHIPPED_DB):
+    """Point db/crud/queries at a scratch copy of `source` so benchmarks never touch the real file."""
+    workdir = tempfile.mkdtemp(prefix="fw_bench_")
+    path = os.path.join(workdir, "bench.db")
+    if source:
+        shutil.copyfile(source, path)
+    saved = db.DB_NAME, crud.DB_NAME, queries.DB_NAME
+    db.DB_NAME = crud.DB_NAME = queries.DB_NAME = path
+    try:
+        yield path
+    finally:
+        db.DB_NAME, crud.DB_NAME, queries.DB_NAME = saved
+        writer.close_all()   # before the pools: a writer thread holds one of their connections
+        db.close_all()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def time_calls(fn, repeat=200, warmup=5, setup=None, budget=None):
+    """Call fn() `repeat` times and return the per-call latencies in seconds.
+
+    `setup`, if given, runs untimed before every call. With a `budget` (seconds) timing stops
+    early once that much time has been measured, after at least three calls.
+    """
+    for _ in range(warmup):
+        if setup:
+            setup()
+        fn()
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+        if budget is not None and len(samples) >= 3 and sum(samples) > budget:
+            break
+    return samples
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    return {
+        "calls": len(samples),
+        "mean_us": statistics.fmean(samples) * 1e6,
+        "p50_us": percentile(samples, 50) * 1e6,
+        "p95_us": percentile(samples, 95) * 1e6,
+        "p99_us": percentile(samples, 99) * 1e6,
+    }
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB (None where `resource` is unavailable)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024   # bytes on macOS, KB elsewhere
+
+
+def print_table(title, rows):
+    print(f"\n{title}")
+    print(f"{'case':<40}{'mean us':>12}{'p50 us':>12}{'p95 us':>12}{'p99 us':>12}")
+    for name, stats in rows:
+        print(f"{name:<40}{stats['mean_us']:>12.1f}{stats['p50_us']:>12.1f}{stats['p95_us']:>12.1f}"
+              f"{stats['p99_us']:>12.1f}")
@@ -0,0 +1,245 @@
+"""Deterministic synthetic food_wastage databases at 10k / 1M / 10M rows.
+
+The same (scale, seed) always produces the same rows, with dates laid out around the day the
+database is generated so that a fresh one always has live, unexpired listings. Cities and food names are drawn from
+Zipf-like distributions, so a handful of cities hold most of the listings the way real data
+does, and food / meal / provider types follow the proportions of the shipped data rather than
+being uniform. Food_Listings and Claims get `rows` rows each; Providers and Receivers get
+rows / 20. Every city gets made-up coordinates inside a region about 300 km across (see
+city_coordinates), loaded into the gazetteer for the distance queries.
+
+The history variant (--history) spreads listing expiries over the past year instead and makes each
+claim in the three days before its listing expires (or before now, if it hasn't), so that there
+are closed months to archive (see partitions.py) and claims of a month belong to listings of
+about that month.
+
+The schema comes from migrate.upgrade(). The summary and hold triggers and the secondary indexes
+are dropped for the bulk load and rebuilt afterwards, which costs one GROUP BY / one sort each
+instead of a dozen trigger statements and index updates per inserted row.
+
+    python -m benchmarks.synthetic --scale 1m            # writes benchmarks/.data/synthetic_1m_42_v3.db
+    python -m benchmarks.synthetic --scale 1m --history  # writes benchmarks/.data/synthetic_1m_42_v3_history.db
+"""
+import argparse
+import os
+import random
+import sqlite3
+import time
+from bisect import bisect
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+import availability
+import changelog
+import crud
+import db
+import export
+import geo
+import migrate
+import search
+import summary
+import timeutil
+from benchmarks.common import ROOT
+
+SCALES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+DATA_DIR = os.path.join(ROOT, "benchmarks", ".data")
+INSERT_BATCH = 50_000
+GENERATOR_VERSION = 3   # bump when generate_rows() changes, so cached databases are regenerated
+
+# value -> weight, roughly as in the shipped CSVs
+PROVIDER_TYPES = {"Restaurant": 4, "Supermarket": 3, "Grocery Store": 2, "Catering Service": 1}
+RECEIVER_TYPES = {"NGO": 4, "Shelter": 3, "Charity": 2, "Individual": 1}
+FOOD_TYPES = {"Vegetarian": 5, "Non-Vegetarian": 3, "Vegan": 2}
+MEAL_TYPES = {"Lunch": 4, "Dinner": 3, "Breakfast": 2, "Snacks": 1}
+STATUSES = {"Completed": 5, "Pending": 3, "Cancelled": 2}
+# provider / receiver names look like the shipped ones ("Gonzales-Cochran", "Nielsen, Johnson and Fuller");
+# they are derived from the id rather than drawn from the rng, so the rest of the data doesn't change
+SURNAMES = ["Gonzales", "Cochran", "Nielsen", "Johnson", "Fuller", "Smith", "Garcia", "Martinez", "Brown", "Lee",
+            "Walker", "Hall", "Allen", "Young", "King", "Wright", "Lopez", "Hill", "Scott", "Green", "Adams",
+            "Baker", "Nelson", "Carter", "Mitchell", "Perez", "Roberts", "Turner", "Phillips", "Campbell", "Parker",
+            "Evans", "Edwards", "Collins", "Stewart", "Sanchez", "Morris", "Rogers", "Reed", "Cook", "Morgan",
+            "Bell", "Murphy", "Bailey", "Rivera", "Cooper", "Richardson", "Cox", "Howard", "Ward", "Torres",
+            "Peterson", "Gray", "Ramirez", "James", "Watson", "Brooks", "Kelly", "Sanders", "Price", "Bennett"]
+# the made-up cities are scattered over this box (south, north, west, east), about 300 x 300 km
+REGION = (43.5, 46.5, -95.0, -91.0)
+FOOD_NAMES = ["Rice", "Bread", "Vegetables", "Soup", "Pasta", "Chicken", "Salad", "Dairy", "Fruits", "Fish",
+              "Curry", "Sandwiches", "Noodles", "Beans", "Eggs", "Cereal", "Pastries", "Juice", "Lentils", "Tofu"]
+
+
+class Sampler:
+    """Weighted choice with precomputed cumulative weights, so drawing is O(log n)."""
+
+    def __init__(self, rng, values, weights):
+        self.random = rng.random
+        self.values = list(values)
+        self.cum_weights = list(accumulate(weights))
+        self.total = self.cum_weights[-1]
+
+    def __call__(self):
+        return self.values[bisect(self.cum_weights, self.random() * self.total)]
+
+
+def zipf(rng, values, s=1.1):
+    return Sampler(rng, values, [1 / rank ** s for rank in range(1, len(values) + 1)])
+
+
+def weighted(rng, table):
+    return Sampler(rng, table.keys(), table.values())
+
+
+def company_name(n):
+    """A deterministic surname-based name for id n."""
+    h, k = n * 2654435761 % 2 ** 32, len(SURNAMES)   # Knuth's multiplicative hash spreads consecutive ids
+    a, b, c = SURNAMES[h % k], SURNAMES[h // k % k], SURNAMES[h // k ** 2 % k]
+    return (f"{a}-{b}", f"{a}, {b} and {c}", f"{a} {b}", f"{a} Ltd")[h // k ** 3 % 4]
+
+
+def counts(rows):
+    parents = max(100, rows // 20)
+    return {"Providers": parents, "Receivers": parents, "Food_Listings": rows, "Claims": rows}
+
+
+def city_names(rows):
+    return [f"City {i:05d}" for i in range(max(20, int(counts(rows)["Providers"] ** 0.5)))]
+
+
+def city_coordinates(rows, seed=42):
+    """Yield (city, latitude, longitude) for every city of generate_rows(rows, seed), uniformly
+    spread over REGION. Uses its own rng, so the rows themselves don't depend on it."""
+    rng = random.Random(f"gazetteer-{seed}")
+    south, north, west, east = REGION
+    for city in city_names(rows):
+        yield city, round(rng.uniform(south, north), 5), round(rng.uniform(west, east), 5)
+
+
+def generate_rows(rows, seed=42, now=None, history=False):
+    """Yield (table, row tuple) in foreign-key order. Pure function of (rows, seed, now, history);
+    `now` defaults to midnight today."""
+    rng = random.Random(seed)
+    # the history dates come from their own rng and the main one still makes every draw, so all
+    # other values are the same as without history
+    history_rng = random.Random(f"history-{seed}") if history else None
+    n = counts(rows)
+    city = zipf(rng, city_names(rows))
+    food_name = zipf(rng, FOOD_NAMES)
+    provider_type, receiver_type = weighted(rng, PROVIDER_TYPES), weighted(rng, RECEIVER_TYPES)
+    food_type, meal_type, status = weighted(rng, FOOD_TYPES), weighted(rng, MEAL_TYPES), weighted(rng, STATUSES)
+    now = now or datetime.combine(datetime.now().date(), datetime.min.time())
+    claims_start = now - timedelta(days=365)
+
+    providers = {}
+    for pid in range(1, n["Providers"] + 1):
+        providers[pid] = (provider_type(), city())
+        yield "Providers", (pid, company_name(pid), providers[pid][0], f"{pid} Main Street",
+                            providers[pid][1], f"+1-555-{pid % 10_000_000:07d}")
+    for rid in range(1, n["Receivers"] + 1):
+        yield "Receivers", (rid, company_name(rid * 31 + 5), receiver_type(), city(), f"+1-555-{rid % 10_000_000:07d}")
+
+    quantities, expiries = {}, {}
+    for fid in range(1, n["Food_Listings"] + 1):
+        pid = rng.randint(1, n["Providers"])
+        quantities[fid] = rng.randint(1, 50)
+        # expiries from a month ago to a month ahead of `now`, so some listings are live
+        expiry = now + timedelta(minutes=rng.randint(-30 * 24 * 60, 30 * 24 * 60))
+        if history:
+            expiry = now + timedelta(minutes=history_rng.randint(-365 * 24 * 60, 30 * 24 * 60))
+            expiries[fid] = expiry
+        yield "Food_Listings", (fid, food_name(), quantities[fid], expiry.strftime(timeutil.FORMAT), pid,
+                                providers[pid][0], providers[pid][1], food_type(), meal_type())
+    del providers
+
+    for cid in range(1, n["Claims"] + 1):
+        fid = rng.randint(1, n["Food_Listings"])
+        stamp = claims_start + timedelta(seconds=rng.randrange(365 * 24 * 3600))
+        if history:
+            stamp = min(expiries[fid], now) - timedelta(seconds=history_rng.randrange(1, 3 * 24 * 3600))
+        partial = rng.random() < 0.5
+        yield "Claims", (cid, fid, rng.randint(1, n["Receivers"]), status(), stamp.strftime(timeutil.FORMAT),
+                         rng.randint(1, quantities[fid]) if partial else None)
+
+
+def insert_sql(table, width=None):
+    cols = crud.COLUMNS[table][:width]
+    return f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' for _ in cols)})"
+
+
+def generate(path, rows, seed=42, history=False):
+    """Build a synthetic database at `path` (which must not exist yet). Returns seconds taken."""
+    start = time.perf_counter()
+    migrate.upgrade(path)
+    db.close_all()
+    conn = sqlite3.connect(path, isolation_level=None)
+    try:
+        # a throwaway file until it is complete, so no journal and no fsyncs
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("PRAGMA cache_size = -262144")
+        conn.execute("BEGIN IMMEDIATE")
+        for (name,) in conn.execute("""SELECT name FROM sqlite_master WHERE type = 'trigger'
+                                       AND (name LIKE 'trg_summary_%' OR name LIKE 'trg_claims_hold_%'
+                                            OR name LIKE 'trg_export_%' OR name LIKE 'trg_search_%'
+                                            OR name LIKE 'trg_changelog_%')""").fetchall():
+            conn.execute(f"DROP TRIGGER {name}")
+        # building each index once after the load is much cheaper than maintaining it row by row
+        tables = ", ".join(f"'{table}'" for table in crud.COLUMNS)
+        indexes = conn.execute(f"""SELECT name, sql FROM sqlite_master
+                                   WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN ({tables})""").fetchall()
+        for name, _ in indexes:
+            conn.execute(f"DROP INDEX {name}")
+        batch, table = [], None
+        for row_table, row in generate_rows(rows, seed, history=history):
+            if row_table != table or len(batch) >= INSERT_BATCH:
+                if batch:
+                    conn.executemany(insert_sql(table, len(batch[0])), batch)
+                batch, table = [], row_table
+            batch.append(row)
+        if batch:
+            conn.executemany(insert_sql(table, len(batch[0])), batch)
+        for _, sql in indexes:
+            conn.execute(sql)
+        summary.install(conn)
+        availability.install(conn)
+        export.install(conn)   # no row versions for the generated rows: they predate any extract
+        search.install(conn)
+        changelog.install(conn)   # nor change log entries
+        geo.load(conn, city_coordinates(rows, seed))
+        conn.execute("COMMIT")
+        conn.execute("ANALYZE")
+        conn.execute("PRAGMA journal_mode = WAL")
+    finally:
+        conn.close()
+    return time.perf_counter() - start
+
+
+def database(scale, seed=42, data_dir=DATA_DIR, history=False):
+    """Path to the synthetic database for `scale` ('10k', '1m', '10m' or a row count), generating it once."""
+    rows = SCALES.get(str(scale).lower()) or int(scale)
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"synthetic_{scale}_{seed}_v{GENERATOR_VERSION}{'_history' if history else ''}.db")
+    if not os.path.exists(path):
+        partial = path + ".partial"
+        for leftover in (partial, partial + "-wal", partial + "-shm"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        print(f"generating {rows:,}-row synthetic database (seed {seed}) ...")
+        elapsed = generate(partial, rows, seed, history)
+        os.replace(partial, path)
+        print(f"✅ {path} in {elapsed:.1f}s")
+    else:
+        migrate.upgrade(path)   # a database generated before the latest migrations
+        db.close_all()
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic food_wastage database")
+    parser.add_argument("--scale", default="10k", help="10k, 1m, 10m or a row count")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--history", action="store_true", help="listings and claims spread over the past year")
+    args = parser.parse_args()
+    print(database(args.scale, args.seed, args.data_dir, args.history))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""In-process result cache for the analytics in queries.py.
+
+Entries are keyed on (database, SQL, params), evicted least-recently-used once the entry or
+byte budget is exceeded, and expire after a per-query TTL. Writes made through crud.py
+invalidate by table: every entry that read a table the write touched is dropped, including
+entries on the Summary_* tables the base table's triggers maintain.
+
+The cache is a plain module-level object, so it is shared by every Streamlit session in the
+process and works the same when queries is imported as a library. Writes made by another
+process (e.g. ingest.py run from cron) are only picked up when the TTL runs out.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import summary
+
+MAX_ENTRIES = 512
+MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL = 60   # seconds
+
+_READ_TABLES = re.compile(r"\b(?:FROM|JOIN)\s+(\w+)", re.IGNORECASE)
+_WRITE_TABLE = re.compile(r"^\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+(\w+)",
+                          re.IGNORECASE)
+
+# base table -> Summary_* tables its triggers keep up to date
+DERIVED = {}
+for _summary in summary.SUMMARIES:
+    for _table in summary.sources(_summary):
+        DERIVED.setdefault(_table, set()).add(_summary["name"])
+# availability.py's triggers keep Claimed_Quantity / Full_Claims on Food_Listings in step with Claims
+DERIVED["Claims"].add("Food_Listings")
+
+
+def tables_read(query):
+    return frozenset(_READ_TABLES.findall(query))
+
+
+def table_written(query):
+    """The table an INSERT/UPDATE/DELETE writes to, or None for anything else."""
+    match = _WRITE_TABLE.match(query)
+    return match.group(1) if match else None
+
+
+def size_of(value):
+    if isinstance(value, dict):   # queries' "columns" format: {column: NumPy array}
+        return sum(getattr(array, "nbytes", 0) for array in value.values())
+    try:
+        return int(value.memory_usage(index=True).sum())   # pandas DataFrame
+    except AttributeError:
+        return int(getattr(value, "nbytes", 0))            # pyarrow Table
+
+
+class QueryCache:
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES, default_ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()   # key -> (value, tables, expires_at, size)
+        self._by_table = {}             # table -> set of keys
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.version = 0                # bumped by every invalidation, see put()
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+
+    def get(self, key):
+        """Return the cached value or None. Counts a hit or a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[2] <= time.monotonic():
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, tables, ttl=None, version=None):
+        """Store `value`. Pass the `version` read before running the query: if a write invalidated
+        anything in the meantime the result may already be stale, so it is not cached."""
+        ttl = self.default_ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        size = size_of(value)
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (value, tables, time.monotonic() + ttl, size)
+            self._bytes += size
+            for table in tables:
+                self._by_table.setdefault(table, set()).add(key)
+            while len(self._entries) > self.max_entries or (self._bytes > self.max_bytes and len(self._entries) > 1):
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, tables):
+        """Drop every entry that read any of `tables` (or a summary derived from them)."""
+        affected = set(tables)
+        for table in tables:
+            affected |= DERIVED.get(table, set())
+        with self._lock:
+            self.version += 1
+            for table in affected:
+                for key in list(self._by_table.get(table, ())):
+                    self._drop(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_table.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+    def _drop(self, key):
+        value, tables, _, size = self._entries.pop(key)
+        self._bytes -= size
+        for table in tables:
+            keys = self._by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[table]
+
+
+# -------------------------
+# The shared cache and module-level shortcuts
+# -------------------------
+query_cache = QueryCache()
+
+
+def invalidate(tables):
+    query_cache.invalidate(tables)
+
+
+def invalidate_for(query):
+    """Invalidate whatever `query` writes to; a no-op for SELECTs."""
+    table = table_written(query)
+    if table:
+        query_cache.invalidate([table])
+
+
+def stats():
+    return query_cache.stats()
+
+
+def clear():
+    query_cache.clear()
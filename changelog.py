@@ -0,0 +1,282 @@
+"""Change-data capture: an append-only log of every insert, update and delete, for downstream consumers.
+
+Triggers on Providers, Receivers, Food_Listings and Claims append one Change_Log row per changed
+row, inside the transaction that changes it, so the log never shows a change that was rolled
+back and never misses one that committed. Seq comes from an AUTOINCREMENT key: it only grows and
+is never reused, even after the rows below it are truncated, and since SQLite commits one write
+transaction at a time a reader never sees seq n + 1 before n. Data is the row as JSON (its
+crud.COLUMNS), after the change, or before it for a delete.
+
+Rows that leave a table without being deleted in the app's sense are logged with their own op:
+"archive" for availability.py's sweeper and partitions.py's monthly archives, "move" for both
+sides of a shards.py move (a delete in one shard, an insert in the other). A sharded database
+has one log per shard file, each with its own sequence.
+
+Consumers are registered by name in the home database, which keeps each one's position (the last
+seq it has processed) in every shard. consume() yields the changes after it in batches and
+checkpoints a batch once the caller asks for the next one, so a consumer that crashes mid-batch
+sees that batch again: at-least-once delivery, O(changes) work. The log is kept in segments of
+SEGMENT_SIZE seqs; a segment is truncated once every registered consumer has passed it (with no
+consumers at all, once it is complete), whenever a checkpoint crosses a segment boundary or
+truncate() runs. A new consumer starts at the end of the log (take a full extract with export.py
+first) unless registered with from_start.
+
+    python changelog.py --status
+    python changelog.py --register notifications [--from-start]
+    python changelog.py --tail notifications [--tables Claims] [--follow]    # JSON lines, checkpointed
+    python changelog.py --unregister notifications
+"""
+import argparse
+import json
+import os
+import sqlite3
+import time
+from collections import namedtuple
+
+import crud
+import db
+import shards
+
+TABLES = list(crud.COLUMNS)
+BATCH_SIZE = 1000
+SEGMENT_SIZE = 10_000   # seqs per segment; truncation deletes whole segments
+POLL_SECONDS = 1.0      # --follow: wait between reads once caught up
+
+Change = namedtuple("Change", "shard seq table op row_id data changed_at")
+
+
+# -------------------------
+# Log
+# -------------------------
+def _trigger_sql(table):
+    key, cols = crud.COLUMNS[table][0], crud.COLUMNS[table]
+    data = lambda row: "json_object(" + ", ".join(f"'{col}', {row}.{col}" for col in cols) + ")"
+
+    def log(op, row, when="true"):
+        return (f"INSERT INTO Change_Log (Table_Name, Op, Row_ID, Data) "
+                f"SELECT '{table}', {op}, {row}.{key}, {data(row)} WHERE {when};")
+
+    # a changed primary key is the old row going away and a new one appearing
+    key_changed = f"OLD.{key} <> NEW.{key}"
+    insert, delete = "'insert'", "'delete'"
+    upsert = f"CASE WHEN {key_changed} THEN 'insert' ELSE 'update' END"
+    # only crud.py's columns count as a change (not e.g. availability.py's counters)
+    return [
+        f"CREATE TRIGGER trg_changelog_{table}_ins AFTER INSERT ON {table} BEGIN {log(insert, 'NEW')} END",
+        f"CREATE TRIGGER trg_changelog_{table}_upd AFTER UPDATE OF {', '.join(cols)} ON {table} BEGIN "
+        f"{log(delete, 'OLD', key_changed)} {log(upsert, 'NEW')} END",
+        f"CREATE TRIGGER trg_changelog_{table}_del AFTER DELETE ON {table} BEGIN {log(delete, 'OLD')} END",
+    ]
+
+
+def install(conn):
+    """Create Change_Log / Change_Consumers and (re)create the log triggers. Runs inside the caller's transaction."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS Change_Log (
+            Seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            Table_Name TEXT NOT NULL,
+            Op TEXT NOT NULL,
+            Row_ID INTEGER NOT NULL,
+            Data TEXT NOT NULL,
+            Changed_At TEXT NOT NULL DEFAULT (datetime('now', 'localtime'))
+        )""")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS Change_Consumers (
+            Name TEXT NOT NULL,
+            Shard TEXT NOT NULL,
+            Position INTEGER NOT NULL,
+            Updated_At TEXT NOT NULL,
+            PRIMARY KEY (Name, Shard)
+        ) WITHOUT ROWID""")
+    for table in TABLES:
+        for suffix in ("ins", "upd", "del"):
+            conn.execute(f"DROP TRIGGER IF EXISTS trg_changelog_{table}_{suffix}")
+        for statement in _trigger_sql(table):
+            conn.execute(statement)
+
+
+def last_seq(conn):
+    """The newest seq in conn's log (0 if it is empty), or None if the database has no log yet."""
+    try:
+        return conn.execute("SELECT IFNULL(MAX(Seq), 0) FROM Change_Log").fetchone()[0]
+    except sqlite3.OperationalError:
+        return None
+
+
+def relabel(conn, after, op):
+    """Give the changes logged after seq `after` -- in conn's open transaction -- the op `op`."""
+    if after is not None:
+        conn.execute("UPDATE Change_Log SET Op = ? WHERE Seq > ?", (op, after))
+
+
+def read(path=None, after=0, limit=BATCH_SIZE, tables=None, shard=shards.HOME):
+    """Up to `limit` Changes of the log in `path` with seq above `after`, oldest first."""
+    query = "SELECT Seq, Table_Name, Op, Row_ID, Data, Changed_At FROM Change_Log WHERE Seq > ?"
+    params = [after]
+    if tables:
+        query += f" AND Table_Name IN ({', '.join('?' for _ in tables)})"
+        params += list(tables)
+    with db.connection(path, readonly=True) as conn:
+        rows = conn.execute(query + " ORDER BY Seq LIMIT ?", params + [limit]).fetchall()
+    return [Change(shard, seq, table, op, row_id, json.loads(data), at) for seq, table, op, row_id, data, at in rows]
+
+
+# -------------------------
+# Consumers --
+# positions live in the home database, one row per (consumer, shard); a shard a consumer has no
+# row for yet (one created after it registered) is read from its start
+# -------------------------
+def _now():
+    return time.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def register(name, home=None, from_start=False):
+    """Add consumer `name`, positioned at the end of every shard's log (or its start). Re-registering
+    an existing consumer keeps its positions."""
+    rows = []
+    for shard in shards.names(home):
+        with db.connection(shards.shard_path(shard, home), readonly=True) as conn:
+            rows.append((name, shard, 0 if from_start else last_seq(conn) or 0, _now()))
+    with db.transaction(home) as conn:
+        conn.executemany("INSERT OR IGNORE INTO Change_Consumers (Name, Shard, Position, Updated_At) "
+                         "VALUES (?, ?, ?, ?)", rows)
+
+
+def unregister(name, home=None):
+    with db.transaction(home) as conn:
+        conn.execute("DELETE FROM Change_Consumers WHERE Name = ?", (name,))
+    truncate(home)
+
+
+def consumers(home=None):
+    """{name: {shard: position}} of every registered consumer."""
+    with db.connection(home, readonly=True) as conn:
+        found = {}
+        for name, shard, position in conn.execute("SELECT Name, Shard, Position FROM Change_Consumers"):
+            found.setdefault(name, {})[shard] = position
+    return found
+
+
+def checkpoint(name, shard, seq, home=None):
+    """Record that consumer `name` has processed shard `shard`'s log up to `seq`; never moves back.
+    Truncates the shard's log when this passes a segment boundary."""
+    with db.transaction(home) as conn:
+        row = conn.execute("SELECT Position FROM Change_Consumers WHERE Name = ? AND Shard = ?",
+                           (name, shard)).fetchone()
+        if row is None and not conn.execute("SELECT 1 FROM Change_Consumers WHERE Name = ?", (name,)).fetchone():
+            raise KeyError(f"no consumer named {name!r}; register() it first")
+        previous = row[0] if row else 0
+        if seq <= previous:
+            return
+        conn.execute("""INSERT INTO Change_Consumers (Name, Shard, Position, Updated_At) VALUES (?, ?, ?, ?)
+                        ON CONFLICT(Name, Shard) DO UPDATE SET Position = excluded.Position,
+                            Updated_At = excluded.Updated_At""", (name, shard, seq, _now()))
+    if previous // SEGMENT_SIZE != seq // SEGMENT_SIZE:
+        _truncate_shard(shard, home)
+
+
+def consume(name, batch_size=BATCH_SIZE, tables=None, home=None):
+    """Yield lists of up to batch_size Changes after consumer `name`'s positions, shard by shard, until
+    it has caught up. Each batch is checkpointed when the next one is asked for (or the generator
+    finishes), so stop early and that last batch comes again next time. With `tables`, only those
+    tables' changes come out, but the position still moves past the others."""
+    positions = consumers(home).get(name)
+    if positions is None:
+        raise KeyError(f"no consumer named {name!r}; register() it first")
+    # also shards no city maps to any more, for what was written there before they were emptied
+    names = shards.names(home)
+    for shard in names + [shard for shard in positions if shard not in names]:
+        path = shards.shard_path(shard, home)
+        if not os.path.exists(path):
+            continue
+        with db.connection(path, readonly=True) as conn:
+            end = last_seq(conn) or 0   # the changes committed by now; later ones wait for the next call
+        after = positions.get(shard, 0)
+        while after < end:
+            batch = [change for change in read(path, after, batch_size, tables, shard) if change.seq <= end]
+            if batch:
+                yield batch
+            after = batch[-1].seq if len(batch) == batch_size else end
+            checkpoint(name, shard, after, home)
+
+
+# -------------------------
+# Truncation
+# -------------------------
+def _truncate_shard(shard, home=None):
+    """Delete the segments of `shard`'s log that every consumer has passed. Returns rows deleted."""
+    with db.connection(home, readonly=True) as conn:
+        names = [name for (name,) in conn.execute("SELECT DISTINCT Name FROM Change_Consumers")]
+        positions = dict(conn.execute("SELECT Name, Position FROM Change_Consumers WHERE Shard = ?", (shard,)))
+    path = shards.shard_path(shard, home)
+    with db.connection(path, readonly=True) as conn:
+        end = last_seq(conn)
+    if not end:
+        return 0
+    passed = min((positions.get(name, 0) for name in names), default=end)
+    upto = passed // SEGMENT_SIZE * SEGMENT_SIZE   # the last seq of the last segment everyone has passed
+    deleted = 0
+    with db.connection(path) as conn:
+        first = conn.execute("SELECT MIN(Seq) FROM Change_Log").fetchone()[0]
+        # a segment per transaction, so writers never wait long on the log
+        for start in range((first - 1) // SEGMENT_SIZE * SEGMENT_SIZE, upto, SEGMENT_SIZE):
+            deleted += conn.execute("DELETE FROM Change_Log WHERE Seq > ? AND Seq <= ?",
+                                    (start, start + SEGMENT_SIZE)).rowcount
+            conn.commit()
+    return deleted
+
+
+def truncate(home=None):
+    """Delete every log segment all consumers have passed, in every shard. Returns rows deleted."""
+    return sum(_truncate_shard(shard, home) for shard in shards.names(home))
+
+
+def status(home=None):
+    """[(shard, first seq, last seq, rows, {consumer: lag})] for every shard."""
+    positions = consumers(home)
+    report = []
+    for shard in shards.names(home):
+        with db.connection(shards.shard_path(shard, home), readonly=True) as conn:
+            first, last, rows = conn.execute("SELECT MIN(Seq), MAX(Seq), COUNT(*) FROM Change_Log").fetchone()
+        lags = {name: (last or 0) - shard_positions.get(shard, 0) for name, shard_positions in positions.items()}
+        report.append((shard, first, last, rows, lags))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Change-data capture log: consumers, tailing, truncation")
+    parser.add_argument("--db", default=db.DB_NAME, help="the home database")
+    parser.add_argument("--status", action="store_true")
+    parser.add_argument("--register", metavar="NAME")
+    parser.add_argument("--from-start", action="store_true", help="--register: read the log from its start")
+    parser.add_argument("--unregister", metavar="NAME")
+    parser.add_argument("--tail", metavar="NAME", help="print the consumer's new changes as JSON lines")
+    parser.add_argument("--tables", nargs="+", choices=TABLES)
+    parser.add_argument("--follow", action="store_true", help="--tail: keep waiting for new changes")
+    parser.add_argument("--truncate", action="store_true")
+    args = parser.parse_args()
+
+    if args.register:
+        register(args.register, args.db, args.from_start)
+        print(f"✅ registered {args.register!r}")
+    if args.unregister:
+        unregister(args.unregister, args.db)
+        print(f"✅ unregistered {args.unregister!r}")
+    if args.truncate:
+        print(f"✅ truncated {truncate(args.db):,} changes")
+    while args.tail:
+        for batch in consume(args.tail, tables=args.tables, home=args.db):
+            for change in batch:
+                print(json.dumps(change._asdict()), flush=True)
+        if not args.follow:
+            return
+        time.sleep(POLL_SECONDS)
+    if args.status or not (args.register or args.unregister or args.truncate):
+        print(f"{'shard':<12}{'first':>12}{'last':>12}{'rows':>12}   consumer lag")
+        for shard, first, last, rows, lags in status(args.db):
+            print(f"{shard:<12}{first or '-':>12}{last or '-':>12}{rows:>12,}   "
+                  f"{', '.join(f'{name} {lag:,}' for name, lag in lags.items()) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
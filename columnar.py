@@ -0,0 +1,89 @@
+"""Columnar result path for queries.py: cursor.fetchmany() straight into column arrays.
+
+pd.read_sql_query fetches every row as a tuple, builds a list of them and then has pandas
+transpose and type-infer that list. Here each fetchmany() batch is transposed once with zip(),
+every column becomes a NumPy array (int64 / float64 when it holds only numbers, object
+otherwise), and the DataFrame is built over those arrays with copy=False. Nothing in this
+module needs pandas, so batch jobs can use the arrays (or a pyarrow Table, when pyarrow is
+installed) directly, or stream a large result batch by batch without holding all of it.
+"""
+import importlib.util
+import sys
+
+import numpy as np
+
+# optional, only needed for the "arrow" format; imported on first use, as it takes longer to load than numpy
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+FETCH_SIZE = 4096   # rows per fetchmany()
+
+_NUMERIC = {int, float}
+
+
+def _column(values):
+    """One batch of one column as a NumPy array. Numbers with NULLs become float64 with NaN, as in pandas."""
+    kinds = set(map(type, values))
+    if kinds == {int}:
+        return np.fromiter(values, np.int64, len(values))
+    if kinds and kinds <= _NUMERIC | {type(None)} and kinds & _NUMERIC:
+        return np.fromiter((np.nan if v is None else v for v in values), np.float64, len(values))
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def names(cursor):
+    return [d[0] for d in cursor.description]
+
+
+def iter_batches(cursor, batch_size=FETCH_SIZE):
+    """Yield {column: array} for each fetchmany() batch of `cursor`."""
+    cols = names(cursor)
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield {name: _column(values) for name, values in zip(cols, zip(*rows))}
+
+
+def fetch_columns(cursor, batch_size=FETCH_SIZE):
+    """The whole result as {column: array}."""
+    batches = list(iter_batches(cursor, batch_size))
+    if len(batches) == 1:
+        return batches[0]
+    if not batches:
+        return {name: np.empty(0, dtype=object) for name in names(cursor)}
+    return {name: np.concatenate([batch[name] for batch in batches]) for name in batches[0]}
+
+
+def fetch_arrow(cursor, batch_size=FETCH_SIZE):
+    """The whole result as a pyarrow Table (one record batch per fetchmany())."""
+    if not HAS_PYARROW:
+        raise ImportError("the arrow result format needs pyarrow (pip install pyarrow)")
+    import pyarrow as pa
+    cols = names(cursor)
+    batches = []
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        batches.append(pa.record_batch([pa.array(values) for values in zip(*rows)], names=cols))
+    if not batches:
+        return pa.table({name: pa.array([], pa.null()) for name in cols})
+    return pa.Table.from_batches(batches)
+
+
+def to_frame(columns):
+    """DataFrame over the arrays of fetch_columns() without copying them."""
+    import pandas as pd
+    return pd.DataFrame(columns, copy=False)
+
+
+def nbytes(columns):
+    """Approximate memory held by {column: array}: the arrays plus, for object columns, their values."""
+    total = 0
+    for array in columns.values():
+        total += array.nbytes
+        if array.dtype == object:
+            total += sum(map(sys.getsizeof, array))
+    return total
@@ -1,24 +1,400 @@
+import contextvars
+import random
 import sqlite3
-DB_NAME = "food_wastage.db"
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from itertools import islice
+
+import availability
+import cache
+import db
+import keys
+import metrics
+import search
+import shards
+import timeutil
+import writer
+
+DB_NAME = db.DB_NAME
+CHUNK_SIZE = 1000
+PAGE_SIZE = 50
+
+# column order of each table, primary key first -- also the whitelist for filter / sort column names
+COLUMNS = {
+    "Providers": ["Provider_ID", "Name", "Type", "Address", "City", "Contact"],
+    "Receivers": ["Receiver_ID", "Name", "Type", "City", "Contact"],
+    "Food_Listings": ["Food_ID", "Food_Name", "Quantity", "Expiry_Date", "Provider_ID", "Provider_Type",
+                      "Location", "Food_Type", "Meal_Type"],
+    "Claims": ["Claim_ID", "Food_ID", "Receiver_ID", "Status", "Timestamp", "Quantity"],
+}
+FOOD_COLUMNS = ", ".join(COLUMNS["Food_Listings"])   # Food_Listings also has availability.py's bookkeeping columns
+CLAIM_COLUMNS = ", ".join(COLUMNS["Claims"])         # ... and Claims the generated Claim_Month
+
+# stored as 'YYYY-MM-DD HH:MM:SS' text (see timeutil.py); values are normalized on the way in
+TIMESTAMP_COLUMNS = {"Expiry_Date", "Timestamp"}
 
 # -------------------------
 # Generic Helper -- 
-# this is to reduce the generic boilerplate code which is making connection to our DB, commiting changes and closing connection
-# -------------------------
-def run_query(query, params=(), fetchone=False, fetchall=False):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute(query, params)
-    conn.commit()
-    result = None
-    if fetchone:
-        result = cursor.fetchone()
-    elif fetchall:
-        result = cursor.fetchall()
-    conn.close()
+# this is to reduce the generic boilerplate code which is borrowing a pooled connection to our DB and commiting changes
+# (only when the statement actually wrote something)
+# -------------------------
+def run_query(query, params=(), fetchone=False, fetchall=False, path=None):
+    path = path or DB_NAME
+    captured = _captured.get()
+    if captured is not None:
+        captured.append((query, tuple(params)))
+        captured.path = path
+        return None
+    with metrics.timed(query, params, path) as timing:
+        result = db.execute(query, params, path=path, fetchone=fetchone, fetchall=fetchall)
+        timing.rows = len(result) if fetchall else int(result is not None) if fetchone else 0
+    cache.invalidate_for(query)
     return result
 
 
+_captured = contextvars.ContextVar("crud_captured", default=None)
+
+
+class Captured(list):
+    """[(query, params), ...] captured by capture_writes(); .path is the database they are for."""
+    path = None
+
+
+@contextmanager
+def capture_writes():
+    """Collect the (query, params) the single-row add / update / delete functions would run, without
+    running them -- writer.py executes them later in a grouped transaction.
+
+        with crud.capture_writes() as statements:
+            crud.add_claim(...)
+        writer.submit(statements, statements.path)
+    """
+    statements = Captured()
+    token = _captured.set(statements)
+    try:
+        yield statements
+    finally:
+        _captured.reset(token)
+
+
+def _normalize(values):
+    """{column: value} with any timestamp column converted to the canonical format."""
+    return {col: timeutil.to_timestamp(value) if col in TIMESTAMP_COLUMNS else value
+            for col, value in values.items()}
+
+
+def _normalize_rows(rows, position):
+    """Rows with the timestamp at `position` converted to the canonical format."""
+    for row in rows:
+        row = tuple(row)
+        yield row[:position] + (timeutil.to_timestamp(row[position]),) + row[position + 1:]
+
+
+# -------------------------
+# Batch Helpers --
+# the *_many style functions below (add_providers, update_claims, ...) run a whole batch in one transaction.
+# Each chunk goes through executemany inside a SAVEPOINT; if any row in it fails, the chunk is rolled back
+# and replayed row by row so the good rows still land and the bad ones are reported in BatchResult.failed.
+# -------------------------
+@dataclass
+class BatchResult:
+    applied: int = 0                             # rows inserted / updated / deleted
+    failed: list = field(default_factory=list)   # (position in input, row, error message)
+
+    @property
+    def ok(self):
+        return not self.failed
+
+
+def _chunks(items, chunk_size):
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _run_chunk(conn, query, chunk, offset, result):
+    conn.execute("SAVEPOINT batch_chunk")
+    try:
+        cursor = conn.executemany(query, [params for _, params in chunk])
+        result.applied += max(cursor.rowcount, 0)
+    except sqlite3.Error:
+        conn.execute("ROLLBACK TO batch_chunk")
+        for position, (row, params) in enumerate(chunk, offset):
+            try:
+                result.applied += max(conn.execute(query, params).rowcount, 0)
+            except sqlite3.Error as e:
+                result.failed.append((position, row, str(e)))
+    conn.execute("RELEASE batch_chunk")
+
+
+def run_many(query, rows, chunk_size=CHUNK_SIZE, path=None):
+    """executemany `query` over `rows` in a single transaction, chunk_size rows at a time."""
+    result = BatchResult()
+    with db.transaction(path or DB_NAME) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        offset = 0
+        for chunk in _chunks(rows, chunk_size):
+            _run_chunk(conn, query, [(row, tuple(row)) for row in chunk], offset, result)
+            offset += len(chunk)
+    cache.invalidate_for(query)
+    return result
+
+
+def update_many(table, key, changes, chunk_size=CHUNK_SIZE, path=None):
+    """Apply (id, {column: value}) pairs in one transaction.
+
+    Consecutive pairs that touch the same columns share one executemany, so a stream of
+    update_claims([(id, {"Status": "Completed"}), ...]) is a single prepared statement.
+    """
+    if path is None and _sharded(table):
+        changes = list(changes)
+        where = _locate_many(table, [row_id for row_id, _ in changes])
+        return _routed(changes, lambda change: where[change[0]],
+                       lambda path, part: update_many(table, key, part, chunk_size, path))
+    result = BatchResult()
+    with db.transaction(path or DB_NAME) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        offset = 0
+        for chunk in _chunks(changes, chunk_size):
+            run, cols = [], None
+            for position, (row_id, values) in enumerate(chunk, offset):
+                values = _normalize(values)
+                row_cols = tuple(values)
+                if run and row_cols != cols:
+                    _run_chunk(conn, _update_sql(table, key, cols), run, run_offset, result)
+                    run = []
+                if not run:
+                    cols, run_offset = row_cols, position
+                run.append(((row_id, values), tuple(values.values()) + (row_id,)))
+            if run:
+                _run_chunk(conn, _update_sql(table, key, cols), run, run_offset, result)
+            offset += len(chunk)
+    cache.invalidate([table])
+    return result
+
+
+def _update_sql(table, key, cols):
+    updates = ", ".join([f"{col} = ?" for col in cols])
+    return f"UPDATE {table} SET {updates} WHERE {key} = ?"
+
+
+def delete_many(table, key, ids, chunk_size=CHUNK_SIZE):
+    query = f"DELETE FROM {table} WHERE {key} = ?"
+    if not _sharded(table):
+        return run_many(query, ((row_id,) for row_id in ids), chunk_size)
+    ids = list(ids)
+    where = _locate_many(table, ids)
+    return _routed([(row_id,) for row_id in ids], lambda row: where[row[0]],
+                   lambda path, part: run_many(query, part, chunk_size, path))
+
+
+# -------------------------
+# Shard routing --
+# with a shard map (see shards.py), Food_Listings rows live in the shard of their Location and Claims
+# in the shard of their listing; Providers and Receivers always in the home database. Without one,
+# every path below is DB_NAME and nothing is looked up. A batch spanning several shards commits
+# shard by shard, so it is only atomic per shard.
+# -------------------------
+SHARDED_TABLES = ("Food_Listings", "Claims")
+
+
+def _sharded(table):
+    return table in SHARDED_TABLES and shards.active(DB_NAME)
+
+
+def _city_path(location):
+    return shards.path_for_city(location, DB_NAME) if shards.active(DB_NAME) else DB_NAME
+
+
+def _row_path(table, row_id):
+    """The shard holding `table` row row_id (home if none does; ValueError if several do)."""
+    return shards.locate(table, COLUMNS[table][0], row_id, DB_NAME) if _sharded(table) else DB_NAME
+
+
+def _locate_many(table, ids):
+    """{id: shard path} for `ids` of `table`; ids no shard holds map to the home database, and an id
+    several shards hold raises ValueError."""
+    key = COLUMNS[table][0]
+    ids = list(dict.fromkeys(ids))
+    found = {}
+    for path in shards.paths(DB_NAME):
+        with db.connection(path, readonly=True) as conn:
+            for chunk in _chunks(ids, CHUNK_SIZE):
+                for (row_id,) in conn.execute(
+                        f"SELECT {key} FROM {table} WHERE {key} IN ({', '.join('?' for _ in chunk)})", chunk):
+                    if row_id in found:
+                        raise ValueError(f"{table} {key} {row_id} is in more than one shard: {found[row_id]}, {path}")
+                    found[row_id] = path
+    home = shards.shard_path(shards.HOME, DB_NAME)
+    return {row_id: found.get(row_id, home) for row_id in ids}
+
+
+def _new_key(table, row_id):
+    """The id of a new `table` row. Unsharded, the file's primary key and Key_Sequence take care of it
+    (None: the next id, see keys.py); with shards it must be unique across every shard file, so None
+    is taken from ids allocated in the home database and a given id is checked against every shard."""
+    if not _sharded(table):
+        return row_id
+    if row_id is None:
+        return keys.take(table, DB_NAME)
+    if keys.claim(table, [row_id], DB_NAME):
+        raise sqlite3.IntegrityError(f"UNIQUE constraint failed: {table}.{COLUMNS[table][0]} (in another shard)")
+    return row_id
+
+
+def _add_routed(table, rows, path_of, run):
+    """_routed() for new rows (key first) with _new_key()'s checks: None keys are allocated, and rows
+    whose key another shard already holds are reported as failed instead of being inserted."""
+    rows = [tuple(row) for row in rows]
+    missing = [position for position, row in enumerate(rows) if row[0] is None]
+    if missing:
+        first = keys.allocate(table, len(missing), DB_NAME)
+        for n, position in enumerate(missing):
+            rows[position] = (first + n,) + rows[position][1:]
+    taken = keys.claim(table, [row[0] for row in rows], DB_NAME)
+    keep = [position for position, row in enumerate(rows) if row[0] not in taken]
+    result = _routed([rows[p] for p in keep], path_of, run)
+    error = f"UNIQUE constraint failed: {table}.{COLUMNS[table][0]} (in another shard)"
+    result.failed = sorted([(keep[p], row, message) for p, row, message in result.failed] +
+                           [(p, row, error) for p, row in enumerate(rows) if row[0] in taken],
+                           key=lambda failure: failure[0])
+    return result
+
+
+def _routed(rows, path_of, run):
+    """run(path, rows of that shard) for each shard path_of(row) sends rows to; returns the combined
+    BatchResult with failure positions counted in `rows`."""
+    groups = {}
+    for position, row in enumerate(rows):
+        groups.setdefault(path_of(row), []).append(position)
+    result = BatchResult()
+    for path, positions in groups.items():
+        part = run(path, [rows[p] for p in positions])
+        result.applied += part.applied
+        result.failed += [(positions[i], row, error) for i, row, error in part.failed]
+    result.failed.sort(key=lambda failure: failure[0])
+    return result
+
+
+def _read_shards(table, query, params=(), merge=None):
+    """Rows of a read over every shard, combined by `merge` (a shards.Merge; default: concatenated)."""
+    merge = merge or shards.Merge("SELECT * FROM part")
+    if not _sharded(table):
+        return run_query(query, params, fetchall=True)
+    conn = shards.gather(query, params, merge, shards.paths(DB_NAME))
+    try:
+        return conn.execute(merge.combine).fetchall()
+    finally:
+        conn.close()
+
+
+# -------------------------
+# Filtered / Paginated Reads --
+# filters and sort order are pushed into SQL, and paging is keyset based: the cursor is the sort key of
+# the last row already shown, so page N costs the same as page 1 (no OFFSET scan).
+# -------------------------
+def _check_columns(table, names):
+    unknown = [name for name in names if name not in COLUMNS[table]]
+    if unknown:
+        raise ValueError(f"unknown {table} column(s): {', '.join(unknown)}")
+
+
+def find_rows(table, filters=None, order_by=None, descending=False, after=None, limit=PAGE_SIZE):
+    """One page of `table` matching `filters`. Returns (rows, next_cursor); next_cursor is None on the last page.
+
+    filters:  {column: value} for equality, {column: [v1, v2]} for IN; None values are ignored.
+    order_by: any column of the table; ties are broken by the primary key.
+    after:    the next_cursor returned by the previous call.
+    """
+    key = COLUMNS[table][0]
+    filters = {col: value for col, value in (filters or {}).items() if value is not None}
+    order_by = order_by or key
+    _check_columns(table, list(filters) + [order_by])
+    order_cols = [key] if order_by == key else [order_by, key]
+
+    where, params = [], []
+    for col, value in filters.items():
+        if isinstance(value, (list, tuple, set)):
+            values = list(value)
+            where.append(f"{col} IN ({', '.join('?' for _ in values)})")
+            params.extend(values)
+        else:
+            where.append(f"{col} = ?")
+            params.append(value)
+    if after is not None:
+        op = "<" if descending else ">"
+        where.append(f"({', '.join(order_cols)}) {op} ({', '.join('?' for _ in order_cols)})")
+        params.extend(after)
+
+    direction = " DESC" if descending else ""
+    query = f"SELECT {', '.join(COLUMNS[table])} FROM {table}"
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    order = ", ".join(col + direction for col in order_cols)
+    query += f" ORDER BY {order} LIMIT ?"
+    params = tuple(params) + (limit + 1,)
+    location = filters.get("Location")
+    if table == "Food_Listings" and location is not None and not isinstance(location, (list, tuple, set)):
+        rows = run_query(query, params, fetchall=True, path=_city_path(location))
+    else:
+        rows = _read_shards(table, query, params, shards.concat(order, limit + 1))
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        positions = [COLUMNS[table].index(col) for col in order_cols]
+        next_cursor = tuple(rows[-1][i] for i in positions)
+    return rows, next_cursor
+
+
+# distinct values that a summary table already holds one row per value for
+DISTINCT_SOURCES = {
+    ("Providers", "City"): ("Summary_Providers_City", "Provider_Count"),
+    ("Receivers", "City"): ("Summary_Receivers_City", "Receiver_Count"),
+    ("Food_Listings", "Location"): ("Summary_Locations", "Listing_Count"),
+    ("Food_Listings", "Food_Type"): ("Summary_Food_Types", "Listing_Count"),
+    ("Food_Listings", "Food_Name"): ("Summary_Food_Names", "Listing_Count"),
+    ("Food_Listings", "Provider_Type"): ("Summary_Provider_Types", "Listing_Count"),
+    ("Claims", "Status"): ("Summary_Claim_Status", "Claim_Count"),
+}
+
+
+def distinct_values(table, column):
+    """Sorted distinct non-NULL values of table.column, for filter dropdowns."""
+    _check_columns(table, [column])
+    source = DISTINCT_SOURCES.get((table, column))
+    if source:
+        summary_table, count_col = source
+        query = f"SELECT {column} FROM {summary_table} WHERE {count_col} > 0 AND {column} IS NOT NULL ORDER BY {column}"
+    else:
+        query = f"SELECT DISTINCT {column} FROM {table} WHERE {column} IS NOT NULL ORDER BY {column}"
+    merge = shards.Merge(f"SELECT DISTINCT {column} FROM part ORDER BY {column}")
+    return [row[0] for row in _read_shards(table, query, merge=merge)]
+
+
+# -------------------------
+# Search --
+# ranked prefix search over Food_Name / Name through the FTS5 indexes in search.py; `text` is whatever
+# the user typed, and every word in it must match the start of a word in the name
+# -------------------------
+def search_rows(table, text, limit=PAGE_SIZE):
+    match = search.match_expression(text)
+    if match is None:
+        return []
+    params = (match, search.RANK_CANDIDATES, limit)
+    if not _sharded(table):
+        return run_query(search.search_sql(table, COLUMNS[table]), params, fetchall=True)
+    # each shard ranks against its own index statistics, so the merged order is close to, not
+    # exactly, that of a single index
+    cols = ", ".join(COLUMNS[table])
+    return _read_shards(table, search.search_sql(table, COLUMNS[table], with_rank=True), params,
+                        shards.Merge(f"SELECT {cols} FROM part ORDER BY Rank, {COLUMNS[table][0]} DESC LIMIT {int(limit)}"))
+
+
 # -------------------------
 # Providers CRUD
 # -------------------------
@@ -34,6 +410,12 @@ def get_provider_by_id(provider_id):
 def get_providers():
     return run_query("SELECT * FROM Providers", fetchall=True)
 
+def find_providers(filters=None, order_by=None, descending=False, after=None, limit=PAGE_SIZE):
+    return find_rows("Providers", filters, order_by, descending, after, limit)
+
+def search_providers(text, limit=PAGE_SIZE):
+    return search_rows("Providers", text, limit)
+
 def update_provider(provider_id, **kwargs):
     updates = ", ".join([f"{col} = ?" for col in kwargs.keys()])
     values = list(kwargs.values())
@@ -44,6 +426,19 @@ def update_provider(provider_id, **kwargs):
 def delete_provider(provider_id):
     run_query("DELETE FROM Providers WHERE Provider_ID = ?", (provider_id,))
 
+# batch variants -- rows are tuples in add_provider's argument order, changes are (provider_id, {column: value})
+def add_providers(rows, chunk_size=CHUNK_SIZE):
+    return run_many("""
+        INSERT INTO Providers (Provider_ID, Name, Type, Address, City, Contact)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, rows, chunk_size)
+
+def update_providers(changes, chunk_size=CHUNK_SIZE):
+    return update_many("Providers", "Provider_ID", changes, chunk_size)
+
+def delete_providers(provider_ids, chunk_size=CHUNK_SIZE):
+    return delete_many("Providers", "Provider_ID", provider_ids, chunk_size)
+
 
 # -------------------------
 # Receivers CRUD
@@ -60,6 +455,12 @@ def get_receiver_by_id(receiver_id):
 def get_receivers():
     return run_query("SELECT * FROM Receivers", fetchall=True)
 
+def find_receivers(filters=None, order_by=None, descending=False, after=None, limit=PAGE_SIZE):
+    return find_rows("Receivers", filters, order_by, descending, after, limit)
+
+def search_receivers(text, limit=PAGE_SIZE):
+    return search_rows("Receivers", text, limit)
+
 def update_receiver(receiver_id, **kwargs):
     updates = ", ".join([f"{col} = ?" for col in kwargs.keys()])
     values = list(kwargs.values())
@@ -70,54 +471,225 @@ def update_receiver(receiver_id, **kwargs):
 def delete_receiver(receiver_id):
     run_query("DELETE FROM Receivers WHERE Receiver_ID = ?", (receiver_id,))
 
+# batch variants -- rows are tuples in add_receiver's argument order, changes are (receiver_id, {column: value})
+def add_receivers(rows, chunk_size=CHUNK_SIZE):
+    return run_many("""
+        INSERT INTO Receivers (Receiver_ID, Name, Type, City, Contact)
+        VALUES (?, ?, ?, ?, ?)
+    """, rows, chunk_size)
+
+def update_receivers(changes, chunk_size=CHUNK_SIZE):
+    return update_many("Receivers", "Receiver_ID", changes, chunk_size)
+
+def delete_receivers(receiver_ids, chunk_size=CHUNK_SIZE):
+    return delete_many("Receivers", "Receiver_ID", receiver_ids, chunk_size)
+
 
 # -------------------------
 # Food Listings CRUD
 # -------------------------
 def add_food(food_id, food_name, quantity, expiry_date, provider_id, provider_type, location, food_type, meal_type):
-    run_query("""
+    # food_id=None takes the next id of the file's Key_Sequence, never one an archived listing had (see keys.py)
+    path = _city_path(location)
+    food_id = _new_key("Food_Listings", food_id)
+    run_query(f"""
         INSERT INTO Food_Listings (Food_ID, Food_Name, Quantity, Expiry_Date, Provider_ID, Provider_Type, Location, Food_Type, Meal_Type)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (food_id, food_name, quantity, expiry_date, provider_id, provider_type, location, food_type, meal_type))
+        VALUES (IFNULL(?, {keys.next_id("Food_Listings")}), ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (food_id, food_name, quantity, timeutil.to_timestamp(expiry_date), provider_id, provider_type, location, food_type, meal_type),
+        path=path)
 
 def get_food_by_id(food_id):
-    return run_query("SELECT * FROM Food_Listings WHERE Food_ID = ?", (food_id,), fetchone=True)
+    return run_query(f"SELECT {FOOD_COLUMNS} FROM Food_Listings WHERE Food_ID = ?", (food_id,), fetchone=True,
+                     path=_row_path("Food_Listings", food_id))
 
 def get_food_listings():
-    return run_query("SELECT * FROM Food_Listings", fetchall=True)
+    return _read_shards("Food_Listings", f"SELECT {FOOD_COLUMNS} FROM Food_Listings")
+
+def find_food_listings(filters=None, order_by=None, descending=False, after=None, limit=PAGE_SIZE):
+    return find_rows("Food_Listings", filters, order_by, descending, after, limit)
+
+def search_food_listings(text, limit=PAGE_SIZE):
+    return search_rows("Food_Listings", text, limit)
 
 def update_food(food_id, **kwargs):
+    kwargs = _normalize(kwargs)
     updates = ", ".join([f"{col} = ?" for col in kwargs.keys()])
     values = list(kwargs.values())
     values.append(food_id)
     query = f"UPDATE Food_Listings SET {updates} WHERE Food_ID = ?"
-    run_query(query, tuple(values))
+    path = _row_path("Food_Listings", food_id)
+    if "Location" in kwargs and _city_path(kwargs["Location"]) != path:
+        raise ValueError(f"{kwargs['Location']!r} is in another shard; move the city (shards.py) or re-add the listing")
+    run_query(query, tuple(values), path=path)
 
 def delete_food(food_id):
-    run_query("DELETE FROM Food_Listings WHERE Food_ID = ?", (food_id,))
+    run_query("DELETE FROM Food_Listings WHERE Food_ID = ?", (food_id,), path=_row_path("Food_Listings", food_id))
+
+# batch variants -- rows are tuples in add_food's argument order, changes are (food_id, {column: value})
+def add_food_listings(rows, chunk_size=CHUNK_SIZE):
+    query = f"""
+        INSERT INTO Food_Listings (Food_ID, Food_Name, Quantity, Expiry_Date, Provider_ID, Provider_Type, Location, Food_Type, Meal_Type)
+        VALUES (IFNULL(?, {keys.next_id("Food_Listings")}), ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+    if not _sharded("Food_Listings"):
+        return run_many(query, _normalize_rows(rows, 3), chunk_size)
+    return _add_routed("Food_Listings", _normalize_rows(rows, 3), lambda row: _city_path(row[6]),
+                       lambda path, part: run_many(query, part, chunk_size, path))
+
+def update_food_listings(changes, chunk_size=CHUNK_SIZE):
+    return update_many("Food_Listings", "Food_ID", changes, chunk_size)
+
+def delete_food_listings(food_ids, chunk_size=CHUNK_SIZE):
+    return delete_many("Food_Listings", "Food_ID", food_ids, chunk_size)
 
 
 # -------------------------
 # Claims CRUD
 # -------------------------
-def add_claim(claim_id, food_id, receiver_id, status, timestamp):
-    run_query("""
-        INSERT INTO Claims (Claim_ID, Food_ID, Receiver_ID, Status, Timestamp)
-        VALUES (?, ?, ?, ?, ?)
-    """, (claim_id, food_id, receiver_id, status, timestamp))
+def add_claim(claim_id, food_id, receiver_id, status, timestamp, quantity=None):
+    # quantity=None means the claim is for the whole listing; claim_id=None takes the next id (see keys.py)
+    path = _row_path("Food_Listings", food_id)
+    claim_id = _new_key("Claims", claim_id)
+    run_query(f"""
+        INSERT INTO Claims (Claim_ID, Food_ID, Receiver_ID, Status, Timestamp, Quantity)
+        VALUES (IFNULL(?, {keys.next_id("Claims")}), ?, ?, ?, ?, ?)
+    """, (claim_id, food_id, receiver_id, status, timeutil.to_timestamp(timestamp), quantity), path=path)
 
 def get_claim_by_id(claim_id):
-    return run_query("SELECT * FROM Claims WHERE Claim_ID = ?", (claim_id,), fetchone=True)
+    return run_query(f"SELECT {CLAIM_COLUMNS} FROM Claims WHERE Claim_ID = ?", (claim_id,), fetchone=True,
+                     path=_row_path("Claims", claim_id))
 
 def get_claims():
-    return run_query("SELECT * FROM Claims", fetchall=True)
+    return _read_shards("Claims", f"SELECT {CLAIM_COLUMNS} FROM Claims")
+
+def find_claims(filters=None, order_by=None, descending=False, after=None, limit=PAGE_SIZE):
+    return find_rows("Claims", filters, order_by, descending, after, limit)
 
 def update_claim(claim_id, **kwargs):
+    kwargs = _normalize(kwargs)
     updates = ", ".join([f"{col} = ?" for col in kwargs.keys()])
     values = list(kwargs.values())
     values.append(claim_id)
     query = f"UPDATE Claims SET {updates} WHERE Claim_ID = ?"
-    run_query(query, tuple(values))
+    if "Food_ID" in kwargs and _row_path("Food_Listings", kwargs["Food_ID"]) != _row_path("Claims", claim_id):
+        raise ValueError(f"listing {kwargs['Food_ID']} is in another shard than claim {claim_id}")
+    run_query(query, tuple(values), path=_row_path("Claims", claim_id))
 
 def delete_claim(claim_id):
-    run_query("DELETE FROM Claims WHERE Claim_ID = ?", (claim_id,))
\ No newline at end of file
+    run_query("DELETE FROM Claims WHERE Claim_ID = ?", (claim_id,), path=_row_path("Claims", claim_id))
+
+# batch variants -- rows are tuples in add_claim's argument order (quantity may be left off),
+# changes are (claim_id, {column: value})
+def add_claims(rows, chunk_size=CHUNK_SIZE):
+    query = f"""
+        INSERT INTO Claims (Claim_ID, Food_ID, Receiver_ID, Status, Timestamp, Quantity)
+        VALUES (IFNULL(?, {keys.next_id("Claims")}), ?, ?, ?, ?, ?)
+    """
+    rows = _normalize_rows((tuple(row) + (None,) * (6 - len(row)) for row in rows), 4)
+    if not _sharded("Claims"):
+        return run_many(query, rows, chunk_size)
+    rows = list(rows)
+    where = _locate_many("Food_Listings", [row[1] for row in rows])
+    return _add_routed("Claims", rows, lambda row: where[row[1]],
+                       lambda path, part: run_many(query, part, chunk_size, path))
+
+def update_claims(changes, chunk_size=CHUNK_SIZE):
+    return update_many("Claims", "Claim_ID", changes, chunk_size)
+
+def delete_claims(claim_ids, chunk_size=CHUNK_SIZE):
+    return delete_many("Claims", "Claim_ID", claim_ids, chunk_size)
+
+# queued variants -- for bursts of claims (e.g. right after a large donation is posted): the write goes
+# through writer.py's single writer thread and commits together with whatever else arrived within a
+# few milliseconds. They return a Future that resolves once the claim is durably committed (its
+# .result() raises e.g. sqlite3.IntegrityError on a duplicate Claim_ID); writes submitted from one
+# thread are applied in order, so a claim and its later status change never swap.
+def submit_claim(claim_id, food_id, receiver_id, status, timestamp, quantity=None):
+    return _submit(add_claim, claim_id, food_id, receiver_id, status, timestamp, quantity)
+
+def submit_claim_update(claim_id, **kwargs):
+    return _submit(update_claim, claim_id, **kwargs)
+
+def _submit(fn, *args, **kwargs):
+    with capture_writes() as statements:
+        fn(*args, **kwargs)
+    return writer.submit(statements, statements.path)
+
+
+# -------------------------
+# Reservations --
+# reserve() checks what is left of a listing and claims it in one guarded INSERT ... SELECT, inside a
+# BEGIN IMMEDIATE transaction that holds the write lock only for that statement, so concurrent
+# reservations (threads or processes) can never hand out more than the listing has. The claim is
+# Pending and holds its quantity from then on (see availability.HOLDING); update_claim() to Cancelled
+# or Rejected gives it back. A busy database is retried a few times after a short, jittered sleep
+# instead of waiting out the 5 s busy_timeout, so a crowd of reservers doesn't wake up in lockstep.
+# -------------------------
+RESERVE_ATTEMPTS = 8        # tries before "database is locked" is raised
+RESERVE_BUSY_MS = 20        # busy_timeout of each try
+RESERVE_BACKOFF = 0.002     # s; the sleep after busy try n is uniform in [0, RESERVE_BACKOFF * 2**n)
+
+
+@dataclass
+class Reservation:
+    claim_id: int
+    food_id: int
+    receiver_id: int
+    quantity: int    # what was reserved, <= the quantity asked for
+    attempts: int    # 1 unless the database was busy
+
+
+def _reserve_sql():
+    return f"""
+        INSERT INTO Claims (Claim_ID, Food_ID, Receiver_ID, Status, Timestamp, Quantity)
+        SELECT IFNULL(?, {keys.next_id("Claims")}), Food_ID, ?, 'Pending', ?, MIN(?, Quantity - Claimed_Quantity)
+        FROM Food_Listings
+        WHERE Food_ID = ? AND {availability.LIVE} AND Expiry_Date >= ? AND Quantity - Claimed_Quantity >= ?
+    """
+
+
+def _busy(error):
+    return "locked" in str(error) or getattr(error, "sqlite_errorname", "").startswith("SQLITE_BUSY")
+
+
+def reserve(food_id, receiver_id, quantity, min_quantity=None, claim_id=None, timestamp=None):
+    """Reserve `quantity` of listing food_id for receiver_id as a Pending claim.
+
+    With less than `quantity` left, the claim takes what is left as long as that is at least
+    min_quantity (default: all of `quantity`, i.e. no partial fill). Returns a Reservation, or None
+    if the listing is gone, expired or has too little left. claim_id=None takes the next id (see keys.py).
+    """
+    if quantity < 1 or (min_quantity is not None and not 1 <= min_quantity <= quantity):
+        raise ValueError("need 1 <= min_quantity <= quantity")
+    path = _row_path("Food_Listings", food_id)
+    claim_id = _new_key("Claims", claim_id)
+    query = _reserve_sql()
+    params = (claim_id, receiver_id, timeutil.to_timestamp(timestamp or timeutil.now()), quantity,
+              food_id, availability.now(), quantity if min_quantity is None else min_quantity)
+    with metrics.timed(query, params, path) as timing, db.connection(path) as conn:
+        previous = conn.execute("PRAGMA busy_timeout").fetchone()[0]
+        conn.execute(f"PRAGMA busy_timeout = {RESERVE_BUSY_MS}")
+        try:
+            for attempt in range(1, RESERVE_ATTEMPTS + 1):
+                try:
+                    conn.execute("BEGIN IMMEDIATE")
+                    cursor = conn.execute(query, params)
+                    reserved = 0
+                    if cursor.rowcount:
+                        reserved = conn.execute("SELECT Quantity FROM Claims WHERE Claim_ID = ?",
+                                                (cursor.lastrowid,)).fetchone()[0]
+                    conn.commit()
+                    break
+                except sqlite3.OperationalError as e:
+                    if conn.in_transaction:
+                        conn.rollback()
+                    if not _busy(e) or attempt == RESERVE_ATTEMPTS:
+                        raise
+                    time.sleep(random.uniform(0, RESERVE_BACKOFF * 2 ** attempt))
+        finally:
+            conn.execute(f"PRAGMA busy_timeout = {previous}")
+        timing.rows = int(bool(reserved))
+    if not reserved:
+        return None
+    cache.invalidate(["Claims"])
+    return Reservation(cursor.lastrowid, food_id, receiver_id, reserved, attempt)
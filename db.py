@@ -0,0 +1,227 @@
+import math
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+DB_NAME = "food_wastage.db"
+
+# -------------------------
+# Connection settings --
+# applied to every new connection. WAL lets the analytics readers run while a write is in progress,
+# synchronous=NORMAL only fsyncs at checkpoints, and cache_size / mmap_size keep hot pages in memory.
+# Change them with configure(), which also drops the existing pools so new connections pick them up.
+# -------------------------
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -32000,       # negative = KiB, so ~32 MB of page cache per connection
+    "mmap_size": 268435456,     # 256 MB
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,       # ms to wait on a locked database before raising
+}
+# and on DB_NAME only, the home database, which holds every table the FOREIGN KEY clauses point at.
+# A shard or monthly archive file has claims whose receiver (and listings whose provider) are in
+# the home database, so its references are left to crud.py and shards.py.
+HOME_PRAGMAS = {
+    "foreign_keys": "ON",
+}
+
+# SQL math functions used by queries (geo.py's distances); SQLite builds without
+# SQLITE_ENABLE_MATH_FUNCTIONS get these Python versions instead
+MATH_FUNCTIONS = {name: getattr(math, name) for name in ("sin", "cos", "asin", "sqrt", "radians")}
+
+POOL_SIZE = 8          # max connections per (database, mode)
+ACQUIRE_TIMEOUT = 30   # seconds to wait for a free connection
+PROGRESS_STEPS = 10000 # VM instructions between deadline checks, see deadline()
+
+
+class ConnectionPool:
+    """A bounded pool of SQLite connections to one database file, shared between threads."""
+
+    def __init__(self, path, readonly=False, size=None, pragmas=None):
+        self.path = os.path.abspath(path)
+        self.readonly = readonly
+        self.size = POOL_SIZE if size is None else size   # read now, so configure(pool_size=...) applies
+        self.pragmas = dict(PRAGMAS if pragmas is None else pragmas)
+        self.pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._all = []
+
+    def _connect(self):
+        if self.readonly:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+        for name, value in self.pragmas.items():
+            # journal_mode is a property of the file and can only be changed by a writer
+            if self.readonly and name == "journal_mode":
+                continue
+            conn.execute(f"PRAGMA {name} = {value}")
+        try:
+            conn.execute("SELECT sqrt(1)")
+        except sqlite3.OperationalError:
+            for name, fn in MATH_FUNCTIONS.items():
+                conn.create_function(name, 1, lambda x, fn=fn: None if x is None else fn(x), deterministic=True)
+        hook = _connect_hooks.get(self.path)
+        if hook is not None:
+            hook(conn, self.readonly)
+        return conn
+
+    def acquire(self, timeout=ACQUIRE_TIMEOUT):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    conn = self._connect()
+                except Exception:
+                    self._created -= 1
+                    raise
+                self._all.append(conn)
+                return conn
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"no free connection to {self.path} after {timeout}s") from None
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    def close(self):
+        with self._lock:
+            for conn in self._all:
+                conn.close()
+            self._all = []
+            self._created = 0
+            self._idle = queue.LifoQueue()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_connect_hooks = {}
+
+
+def on_connect(path, hook):
+    """Run hook(conn, readonly) on every new connection to `path` (None removes it), e.g. to ATTACH
+    another database. Existing pooled connections to `path` are closed so they pick it up."""
+    path = os.path.abspath(path)
+    if hook is None:
+        _connect_hooks.pop(path, None)
+    else:
+        _connect_hooks[path] = hook
+    with _pools_lock:
+        for readonly in (False, True):
+            pool = _pools.pop((path, readonly), None)
+            if pool is not None:
+                pool.close()
+
+
+def get_pool(path=None, readonly=False):
+    path = os.path.abspath(path or DB_NAME)
+    key = (path, readonly)
+    pool = _pools.get(key)
+    # a pool inherited through fork() shares file handles with the parent, so start a fresh one
+    if pool is None or pool.pid != os.getpid():
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None or pool.pid != os.getpid():
+                pragmas = {**PRAGMAS, **HOME_PRAGMAS} if path == os.path.abspath(DB_NAME) else None
+                pool = _pools[key] = ConnectionPool(path, readonly=readonly, pragmas=pragmas)
+    return pool
+
+
+_local = threading.local()
+
+
+def last_acquire_seconds():
+    """How long the calling thread's most recent connection() waited for its connection."""
+    return getattr(_local, "acquire_seconds", 0.0)
+
+
+@contextmanager
+def deadline(seconds):
+    """Interrupt any statement this thread runs inside the block once `seconds` have passed.
+
+    A statement cut short raises sqlite3.OperationalError("interrupted"); nested deadlines keep
+    the earlier of the two.
+    """
+    previous = getattr(_local, "deadline", None)
+    _local.deadline = time.monotonic() + seconds if previous is None else min(previous, time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _local.deadline = previous
+
+
+@contextmanager
+def connection(path=None, readonly=False):
+    """Borrow a pooled connection. Anything left uncommitted is rolled back when it is returned."""
+    pool = get_pool(path, readonly)
+    start = time.perf_counter()
+    conn = pool.acquire()
+    _local.acquire_seconds = time.perf_counter() - start
+    until = getattr(_local, "deadline", None)
+    if until is not None:
+        conn.set_progress_handler(lambda: time.monotonic() > until, PROGRESS_STEPS)
+    try:
+        yield conn
+    finally:
+        if until is not None:
+            conn.set_progress_handler(None, 0)
+        pool.release(conn)
+
+
+@contextmanager
+def transaction(path=None):
+    """Borrow a write connection and commit everything done with it as one transaction."""
+    with connection(path) as conn:
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+
+def execute(query, params=(), path=None, fetchone=False, fetchall=False):
+    """Run one statement on a pooled connection; commits only if the statement opened a write."""
+    with connection(path) as conn:
+        cursor = conn.execute(query, params)
+        result = None
+        if fetchone:
+            result = cursor.fetchone()
+        elif fetchall:
+            result = cursor.fetchall()
+        # sqlite3 only opens an implicit transaction for INSERT/UPDATE/DELETE/REPLACE,
+        # so SELECTs never pay for a commit
+        if conn.in_transaction:
+            conn.commit()
+        return result
+
+
+def configure(pool_size=None, **pragmas):
+    """Override pragmas (e.g. configure(synchronous="FULL")) and/or the pool size."""
+    global POOL_SIZE
+    if pool_size is not None:
+        POOL_SIZE = pool_size
+    PRAGMAS.update(pragmas)
+    close_all()
+
+
+def close_all():
+    with _pools_lock:
+        # readers first: only a write connection can checkpoint the WAL into the file as the last one closes
+        for pool in sorted(_pools.values(), key=lambda pool: not pool.readonly):
+            pool.close()
+        _pools.clear()
@@ -0,0 +1,222 @@
+"""Parquet / gzip CSV extracts of Providers, Receivers, Food_Listings and Claims for reporting.
+
+Each table is streamed with fetchmany() straight into the output file, one chunk at a time
+(one Parquet row group per chunk), so memory stays at about one chunk whatever the table size.
+All tables are read inside a single read transaction, so an extract is one consistent snapshot
+even while the app keeps writing (WAL readers see the database as of their first read).
+
+Incremental extracts rely on Row_Versions: triggers record, per table row, a version number
+that grows with every insert / update / delete (deletes are kept as Deleted = 1 tombstones).
+An extract stores the highest version it saw per table in <out_dir>/watermark.json, and an
+incremental extract writes only the rows whose version is above it, plus a Deleted column.
+Rows untouched since tracking started have no version, so a table's first extract into a
+directory is always a full one.
+
+    python export.py exports/                       # full extract (Parquet if pyarrow is installed)
+    python export.py exports/ --format csv          # gzip CSV
+    python export.py exports/ --incremental         # only what changed since the last extract
+"""
+import argparse
+import csv
+import gzip
+import json
+import os
+import time
+import tracemalloc
+from datetime import datetime
+
+import crud
+import db
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:   # optional: only needed for the parquet format
+    pa = pq = None
+
+TABLES = list(crud.COLUMNS)
+FORMATS = ("parquet", "csv")
+CHUNK_SIZE = 50000   # rows per fetchmany() and per Parquet row group
+WATERMARK_FILE = "watermark.json"
+
+
+# -------------------------
+# Change tracking
+# -------------------------
+def _trigger_sql(table):
+    key, cols = crud.COLUMNS[table][0], crud.COLUMNS[table]
+    version = f"(SELECT IFNULL(MAX(Version), 0) + 1 FROM Row_Versions WHERE Table_Name = '{table}')"
+
+    def touch(row, deleted, when="true"):
+        return (f"INSERT INTO Row_Versions (Table_Name, Row_ID, Version, Deleted) "
+                f"SELECT '{table}', {row}.{key}, {version}, {deleted} WHERE {when} "
+                f"ON CONFLICT(Table_Name, Row_ID) DO UPDATE SET Version = excluded.Version, Deleted = excluded.Deleted;")
+
+    # only the exported columns count as a change (not e.g. availability.py's counters)
+    return [
+        f"CREATE TRIGGER trg_export_{table}_ins AFTER INSERT ON {table} BEGIN {touch('NEW', 0)} END",
+        f"CREATE TRIGGER trg_export_{table}_upd AFTER UPDATE OF {', '.join(cols)} ON {table} BEGIN "
+        f"{touch('OLD', 1, f'OLD.{key} <> NEW.{key}')} {touch('NEW', 0)} END",
+        f"CREATE TRIGGER trg_export_{table}_del AFTER DELETE ON {table} BEGIN {touch('OLD', 1)} END",
+    ]
+
+
+def install(conn):
+    """Create Row_Versions and (re)create its triggers. Runs inside the caller's transaction."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS Row_Versions (
+            Table_Name TEXT NOT NULL,
+            Row_ID INTEGER NOT NULL,
+            Version INTEGER NOT NULL,
+            Deleted INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (Table_Name, Row_ID)
+        ) WITHOUT ROWID""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_row_versions ON Row_Versions(Table_Name, Version)")
+    for table in TABLES:
+        for suffix in ("ins", "upd", "del"):
+            conn.execute(f"DROP TRIGGER IF EXISTS trg_export_{table}_{suffix}")
+        for statement in _trigger_sql(table):
+            conn.execute(statement)
+
+
+def load_watermark(out_dir):
+    """{table: version} of the last extract written to out_dir, or None if there is none."""
+    try:
+        with open(os.path.join(out_dir, WATERMARK_FILE)) as f:
+            return json.load(f)["versions"]
+    except FileNotFoundError:
+        return None
+
+
+def _save_watermark(out_dir, versions, run_dir):
+    path = os.path.join(out_dir, WATERMARK_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump({"versions": versions, "extract": os.path.basename(run_dir)}, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+# -------------------------
+# Writers -- each takes a cursor and streams it to `path` chunk by chunk; returns rows written
+# -------------------------
+_ARROW_TYPES = {"INTEGER": "int64", "REAL": "float64"}   # everything else (TEXT, TIMESTAMP) is a string
+
+
+def _arrow_schema(conn, table, cols):
+    declared = {name: (kind or "").upper() for _, name, kind, *_ in conn.execute(f"PRAGMA table_info({table})")}
+    declared["Deleted"] = "INTEGER"
+    return pa.schema([(col, getattr(pa, _ARROW_TYPES.get(declared[col], "string"))()) for col in cols])
+
+
+def write_parquet(cursor, path, schema, chunk_size=CHUNK_SIZE):
+    if pq is None:
+        raise ImportError("the parquet format needs pyarrow (pip install pyarrow)")
+    rows_written = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        while rows := cursor.fetchmany(chunk_size):
+            columns = zip(*rows)
+            writer.write_batch(pa.record_batch([pa.array(values, field.type) for values, field in zip(columns, schema)],
+                                               schema=schema), row_group_size=chunk_size)
+            rows_written += len(rows)
+    return rows_written
+
+
+def write_csv(cursor, path, schema=None, chunk_size=CHUNK_SIZE):
+    rows_written = 0
+    with gzip.open(path, "wt", newline="", encoding="utf-8", compresslevel=6) as f:
+        out = csv.writer(f)
+        out.writerow([d[0] for d in cursor.description])
+        while rows := cursor.fetchmany(chunk_size):
+            out.writerows(rows)
+            rows_written += len(rows)
+    return rows_written
+
+
+WRITERS = {"parquet": (write_parquet, ".parquet"), "csv": (write_csv, ".csv.gz")}
+
+
+# -------------------------
+# Export
+# -------------------------
+def _select_sql(table, incremental):
+    key, cols = crud.COLUMNS[table][0], crud.COLUMNS[table]
+    if not incremental:
+        return f"SELECT {', '.join(cols)} FROM {table} ORDER BY {key}", cols
+    cols = cols + ["Deleted"]
+    # deleted rows come out with only the key filled in
+    select = ", ".join([f"v.Row_ID AS {key}"] + [f"t.{col}" for col in crud.COLUMNS[table][1:]] + ["v.Deleted"])
+    return (f"SELECT {select} FROM Row_Versions v LEFT JOIN {table} t ON t.{key} = v.Row_ID "
+            f"WHERE v.Table_Name = '{table}' AND v.Version > ? ORDER BY v.Version"), cols
+
+
+def export(out_dir, fmt=None, tables=None, incremental=False, chunk_size=CHUNK_SIZE, path=None,
+           trace_memory=False):
+    """Write one extract of `tables` into a new directory under out_dir and advance the watermark.
+    With incremental=True a table is extracted incrementally if out_dir already has a watermark for it.
+    Returns {"dir", "tables": [{table, incremental, rows, bytes, seconds}, ...], "peak_bytes"}."""
+    fmt = fmt or ("parquet" if pq is not None else "csv")
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown export format {fmt!r}; expected one of {FORMATS}")
+    write, suffix = WRITERS[fmt]
+    tables = tables or TABLES
+    watermark = load_watermark(out_dir) or {}
+    run_dir = os.path.join(out_dir, datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+                           + ("_incremental" if incremental and watermark else "_full"))
+    os.makedirs(run_dir)
+    report = {"dir": run_dir, "tables": [], "peak_bytes": None}
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        with db.connection(path, readonly=True) as conn:
+            conn.execute("BEGIN")   # one snapshot for every table, taken at the first read below
+            try:
+                versions = dict(conn.execute("SELECT Table_Name, MAX(Version) FROM Row_Versions "
+                                             "GROUP BY Table_Name").fetchall())
+                for table in tables:
+                    since = watermark.get(table) if incremental else None
+                    query, cols = _select_sql(table, since is not None)
+                    target = os.path.join(run_dir, table + suffix)
+                    start = time.perf_counter()
+                    cursor = conn.execute(query, () if since is None else (since,))
+                    schema = _arrow_schema(conn, table, cols) if fmt == "parquet" else None
+                    rows = write(cursor, target + ".partial", schema, chunk_size)
+                    os.replace(target + ".partial", target)
+                    report["tables"].append({"table": table, "incremental": since is not None, "rows": rows,
+                                             "bytes": os.path.getsize(target),
+                                             "seconds": time.perf_counter() - start})
+                    watermark[table] = versions.get(table, 0)
+            finally:
+                conn.rollback()
+        if trace_memory:
+            report["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+    _save_watermark(out_dir, watermark, run_dir)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the main tables to Parquet or gzip CSV")
+    parser.add_argument("out_dir", help="directory holding the extracts and the watermark")
+    parser.add_argument("--db", default=db.DB_NAME)
+    parser.add_argument("--format", choices=FORMATS, help="default: parquet if pyarrow is installed, else csv")
+    parser.add_argument("--tables", nargs="+", choices=TABLES)
+    parser.add_argument("--incremental", action="store_true", help="only rows changed since the last extract")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--memory", action="store_true", help="trace peak Python memory (slower)")
+    args = parser.parse_args()
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    report = export(args.out_dir, args.format, args.tables, args.incremental, args.chunk_size, args.db, args.memory)
+    for t in report["tables"]:
+        seconds = max(t["seconds"], 1e-9)
+        print(f"✅ {t['table']:<15}{'incremental' if t['incremental'] else 'full':<13}{t['rows']:>12,} rows"
+              f"{t['bytes'] / 1e6:>10.1f} MB{t['seconds']:>8.2f}s{t['bytes'] / seconds / 1e6:>8.1f} MB/s"
+              f"{t['rows'] / seconds:>12,.0f} rows/s")
+    if report["peak_bytes"] is not None:
+        print(f"peak Python memory: {report['peak_bytes'] / 1e6:.1f} MB")
+    print(f"extract written to {report['dir']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Offline geocoding of city names and the R-tree index behind the "near a receiver" queries.
+
+Gazetteer maps each city name used in Providers.City, Receivers.City and Food_Listings.Location
+to a latitude / longitude, loaded from a local gazetteer file; nothing is looked up online.
+Every gazetteer row is mirrored as a point in Gazetteer_Index (SQLite's rtree module) by
+triggers, so "cities within K km" is a bounding-box search of the R-tree followed by an exact
+haversine check on the few cities inside the box, and the providers / listings of those cities
+are then read through their City / Location indexes. Rows whose city isn't in the gazetteer have
+no position and are left out of distance queries.
+
+The gazetteer file is a CSV with a header row naming the city, latitude and longitude columns
+(City / Name, Latitude / Lat, Longitude / Lon / Lng; any other columns are ignored):
+
+    python geo.py gazetteer.csv                # load or update coordinates
+    python geo.py --missing                    # list the cities that have no coordinates yet
+"""
+import argparse
+import csv
+import math
+
+import db
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 2 * math.pi * EARTH_RADIUS_KM / 360   # of latitude, and of longitude at the equator
+BOX_SLACK = 1.01   # widens the R-tree box over the R-tree's float32 rounding and the circle's bulge in longitude
+
+CITY_COLUMNS = ("city", "name")
+LATITUDE_COLUMNS = ("latitude", "lat")
+LONGITUDE_COLUMNS = ("longitude", "lon", "lng")
+
+# the cities used by each table, for --missing
+CITY_SOURCES = [("Providers", "City"), ("Receivers", "City"), ("Food_Listings", "Location")]
+
+
+def haversine_sql(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km between two points given as SQL expressions in degrees."""
+    return (f"2 * {EARTH_RADIUS_KM} * asin(sqrt("
+            f"sin(radians({lat2} - {lat1}) / 2) * sin(radians({lat2} - {lat1}) / 2) + "
+            f"cos(radians({lat1})) * cos(radians({lat2})) * "
+            f"sin(radians({lon2} - {lon1}) / 2) * sin(radians({lon2} - {lon1}) / 2)))")
+
+
+def near_cities_sql(origin):
+    """CTEs `origin` (Lat, Lon, Km of the starting point) and `near` (City, Distance_Km of every
+    gazetteer city within Km of it). `origin` is a SELECT returning Lat, Lon, Km. The box handed to
+    the R-tree is widened by 1/cos(latitude) in longitude; it doesn't wrap around the antimeridian."""
+    lat_span = f"o.Km * {BOX_SLACK} / {KM_PER_DEGREE}"
+    lon_span = f"o.Km * {BOX_SLACK} / ({KM_PER_DEGREE} * max(cos(radians(o.Lat)), 0.01))"
+    return f"""
+        WITH origin AS ({origin}),
+        near AS (
+            SELECT g.City, {haversine_sql('o.Lat', 'o.Lon', 'g.Latitude', 'g.Longitude')} AS Distance_Km, o.Km
+            FROM origin o
+            JOIN Gazetteer_Index i ON i.Min_Lat >= o.Lat - {lat_span} AND i.Max_Lat <= o.Lat + {lat_span}
+                                  AND i.Min_Lon >= o.Lon - {lon_span} AND i.Max_Lon <= o.Lon + {lon_span}
+            JOIN Gazetteer g ON g.City_ID = i.City_ID
+        )"""
+
+
+# -------------------------
+# Schema
+# -------------------------
+def install(conn):
+    """Create Gazetteer, its R-tree and the triggers that keep them in step. Runs inside the caller's
+    transaction."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS Gazetteer (
+            City_ID INTEGER PRIMARY KEY,
+            City TEXT NOT NULL UNIQUE,
+            Latitude REAL NOT NULL CHECK (Latitude BETWEEN -90 AND 90),
+            Longitude REAL NOT NULL CHECK (Longitude BETWEEN -180 AND 180)
+        )""")
+    conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS Gazetteer_Index USING rtree(City_ID, Min_Lat, Max_Lat, Min_Lon, Max_Lon)")
+    point = "(NEW.City_ID, NEW.Latitude, NEW.Latitude, NEW.Longitude, NEW.Longitude)"
+    for suffix in ("ins", "del", "upd"):
+        conn.execute(f"DROP TRIGGER IF EXISTS trg_gazetteer_{suffix}")
+    conn.execute(f"""CREATE TRIGGER trg_gazetteer_ins AFTER INSERT ON Gazetteer BEGIN
+                     INSERT INTO Gazetteer_Index VALUES {point}; END""")
+    conn.execute("""CREATE TRIGGER trg_gazetteer_del AFTER DELETE ON Gazetteer BEGIN
+                    DELETE FROM Gazetteer_Index WHERE City_ID = OLD.City_ID; END""")
+    conn.execute(f"""CREATE TRIGGER trg_gazetteer_upd AFTER UPDATE OF City_ID, Latitude, Longitude ON Gazetteer BEGIN
+                     DELETE FROM Gazetteer_Index WHERE City_ID = OLD.City_ID;
+                     INSERT INTO Gazetteer_Index VALUES {point}; END""")
+
+
+# -------------------------
+# Loading
+# -------------------------
+def _column(header, names, path):
+    for i, col in enumerate(header):
+        if col.strip().lower() in names:
+            return i
+    raise ValueError(f"{path}: no {names[0]} column (expected one of {', '.join(names)})")
+
+
+def read_gazetteer(path):
+    """Yield (city, latitude, longitude) from a gazetteer CSV."""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        rows = csv.reader(f)
+        header = next(rows)
+        city, lat, lon = (_column(header, names, path) for names in (CITY_COLUMNS, LATITUDE_COLUMNS, LONGITUDE_COLUMNS))
+        for line, row in enumerate(rows, start=2):
+            if not row or not row[city].strip():
+                continue
+            try:
+                yield row[city].strip(), float(row[lat]), float(row[lon])
+            except (ValueError, IndexError):
+                raise ValueError(f"{path}:{line}: bad coordinates {row!r}") from None
+
+
+def load(conn, rows):
+    """Insert or update (city, latitude, longitude) rows. Returns the number of rows written."""
+    cursor = conn.executemany("""
+        INSERT INTO Gazetteer (City, Latitude, Longitude) VALUES (?, ?, ?)
+        ON CONFLICT(City) DO UPDATE SET Latitude = excluded.Latitude, Longitude = excluded.Longitude
+    """, rows)
+    return cursor.rowcount
+
+
+def missing_cities(conn):
+    """{city: number of rows using it} for every city in the data that has no coordinates."""
+    missing = {}
+    for table, column in CITY_SOURCES:
+        for city, n in conn.execute(f"""
+                SELECT t.{column}, COUNT(*) FROM {table} t
+                WHERE t.{column} IS NOT NULL AND NOT EXISTS (SELECT 1 FROM Gazetteer g WHERE g.City = t.{column})
+                GROUP BY t.{column}"""):
+            missing[city] = missing.get(city, 0) + n
+    return missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load a local gazetteer for the distance queries")
+    parser.add_argument("gazetteer", nargs="?", help="CSV with city, latitude and longitude columns")
+    parser.add_argument("--db", default=db.DB_NAME)
+    parser.add_argument("--missing", action="store_true", help="list cities without coordinates")
+    args = parser.parse_args()
+    if not args.gazetteer and not args.missing:
+        parser.error("give a gazetteer file to load and/or --missing")
+
+    if args.gazetteer:
+        with db.transaction(args.db) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            written = load(conn, read_gazetteer(args.gazetteer))
+        print(f"✅ {written:,} gazetteer rows loaded from {args.gazetteer}")
+    with db.connection(args.db, readonly=True) as conn:
+        missing = missing_cities(conn)
+        located = conn.execute("SELECT COUNT(*) FROM Gazetteer").fetchone()[0]
+    if args.missing:
+        for city, n in sorted(missing.items(), key=lambda item: -item[1]):
+            print(f"{n:>8,}  {city}")
+    print(f"{located:,} cities have coordinates; {len(missing):,} used in the data don't")
+
+
+if __name__ == "__main__":
+    main()
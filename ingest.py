@@ -0,0 +1,165 @@
+"""Stream the *_data.csv feeds into food_wastage.db in batches.
+
+Each CSV is read with the csv module (so the multi-line quoted addresses in providers_data.csv
+are handled) and written with executemany, one transaction per batch. The number of rows
+committed per file is recorded in Ingest_Progress inside the same transaction, so a run that
+dies half way resumes from the last committed batch.
+
+    python ingest.py                                  # the four bundled CSVs
+    python ingest.py --batch-size 100000 feeds/claims_2025_04.csv:Claims
+    python ingest.py --restart                        # ignore saved progress
+"""
+import argparse
+import csv
+import os
+import time
+
+import cache
+import db
+import migrate
+import timeutil
+
+BATCH_SIZE = 50000
+
+# load order matters for the foreign keys: parents first
+SOURCES = [
+    ("Providers", "providers_data.csv"),
+    ("Receivers", "receivers_data.csv"),
+    ("Food_Listings", "food_listings_data.csv"),
+    ("Claims", "claims_data.csv"),
+]
+
+
+def to_int(value):
+    value = value.strip()
+    return int(value) if value else None
+
+
+CONVERTERS = {
+    "Provider_ID": to_int,
+    "Receiver_ID": to_int,
+    "Food_ID": to_int,
+    "Claim_ID": to_int,
+    "Quantity": to_int,
+    "Expiry_Date": timeutil.to_timestamp,   # '3/5/2025 5:26' -> '2025-03-05 05:26:00'
+    "Timestamp": timeutil.to_timestamp,
+}
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return f"{stat.st_size}:{int(stat.st_mtime)}"
+
+
+def build_insert(table, cols, mode):
+    placeholders = ", ".join("?" for _ in cols)
+    query = f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({placeholders})"
+    if mode == "upsert":
+        updates = ", ".join(f"{col} = excluded.{col}" for col in cols[1:])
+        query += f" ON CONFLICT({cols[0]}) DO UPDATE SET {updates}"
+    elif mode == "ignore":
+        query += f" ON CONFLICT({cols[0]}) DO NOTHING"
+    return query
+
+
+def read_batches(path, batch_size, skip=0):
+    """Yield (header, rows) with at most batch_size converted rows each, after skipping `skip` records."""
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = [col.strip() for col in next(reader)]
+        converters = [CONVERTERS.get(col, str) for col in header]
+        for _ in range(skip):
+            if next(reader, None) is None:
+                return
+        batch = []
+        for record in reader:
+            if not record:
+                continue
+            batch.append(tuple(convert(value) for convert, value in zip(converters, record)))
+            if len(batch) >= batch_size:
+                yield header, batch
+                batch = []
+        if batch:
+            yield header, batch
+
+
+def ingest_file(table, path, db_path=None, batch_size=BATCH_SIZE, mode="upsert", restart=False):
+    """Load one CSV into `table`. Returns (rows_written, seconds)."""
+    source = os.path.abspath(path)
+    signature = file_signature(path)
+
+    with db.connection(db_path) as conn:
+        expected = migrate.columns(conn, table)
+        row = conn.execute(
+            "SELECT Signature, Rows_Committed FROM Ingest_Progress WHERE Source = ? AND Table_Name = ?",
+            (source, table),
+        ).fetchone()
+        done = row[1] if row and row[0] == signature and not restart else 0
+        if done:
+            print(f"↪️ {table}: resuming {os.path.basename(path)} after {done:,} committed rows")
+
+        written = 0
+        start = time.perf_counter()
+        for header, batch in read_batches(path, batch_size, skip=done):
+            unknown = set(header) - set(expected)
+            if unknown:
+                raise ValueError(f"{path}: columns {sorted(unknown)} are not in {table}")
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(build_insert(table, header, mode), batch)
+                done += len(batch)
+                conn.execute(
+                    """INSERT INTO Ingest_Progress (Source, Table_Name, Signature, Rows_Committed, Updated_At)
+                       VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                       ON CONFLICT(Source, Table_Name) DO UPDATE SET
+                           Signature = excluded.Signature,
+                           Rows_Committed = excluded.Rows_Committed,
+                           Updated_At = excluded.Updated_At""",
+                    (source, table, signature, done),
+                )
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            written += len(batch)
+        elapsed = time.perf_counter() - start
+    return written, elapsed
+
+
+def ingest(sources=SOURCES, db_path=None, batch_size=BATCH_SIZE, mode="upsert", restart=False):
+    migrate.upgrade(db_path)
+    totals = []
+    for table, path in sources:
+        written, elapsed = ingest_file(table, path, db_path, batch_size, mode, restart)
+        cache.invalidate([table])
+        rate = written / elapsed if elapsed else 0.0
+        print(f"✅ {table}: {written:,} rows from {os.path.basename(path)} in {elapsed:.2f}s ({rate:,.0f} rows/sec)")
+        totals.append((table, written, elapsed))
+    return totals
+
+
+def parse_source(spec):
+    """'path.csv:Table' -> (Table, path); a bare path is matched against the bundled file names."""
+    if ":" in spec:
+        path, table = spec.rsplit(":", 1)
+        return table, path
+    for table, default in SOURCES:
+        if os.path.basename(spec) == default:
+            return table, spec
+    raise argparse.ArgumentTypeError(f"can't tell which table {spec} belongs to; use path.csv:Table")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-load CSV feeds into food_wastage.db")
+    parser.add_argument("sources", nargs="*", type=parse_source, help="path.csv[:Table] (default: bundled CSVs)")
+    parser.add_argument("--db", default=db.DB_NAME)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--mode", choices=["upsert", "ignore", "insert"], default="upsert",
+                        help="what to do with rows whose primary key already exists")
+    parser.add_argument("--restart", action="store_true", help="ignore saved progress and reload from the top")
+    args = parser.parse_args()
+    ingest(args.sources or SOURCES, args.db, args.batch_size, args.mode, args.restart)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Primary keys that are never handed out twice.
+
+SQLite gives a row inserted without an id one more than the largest id left in its table, so the
+ids of rows that leave the file -- months compacted into archives (partitions.py), expired
+listings swept into Food_Listings_Archive (availability.py), cities moved to a shard (shards.py)
+-- would be handed out again, to rows that then collide with the archived or moved ones.
+Key_Sequence keeps, for Food_Listings and Claims, one more than the largest id the file has ever
+held, raised by a trigger on every insert, and inserts that let the database pick the id use
+next_id() instead of NULL.
+
+With shards (see shards.py) an id must also be unique across the shard files. allocate() hands out
+ids from the home database's sequence, first raised past every shard's (take() hands them out one
+at a time from blocks, for callers like crud.reserve() that add a row per call), and claim() checks ids
+the caller chose against every shard and raises the home sequence past them, so allocate() never
+hands them out. Two processes adding the same chosen id to two different shards at the same
+moment can still both succeed; shards.locate() then refuses the id as ambiguous instead of acting
+on one of the rows.
+"""
+import os
+import threading
+
+import db
+import shards
+
+# table -> (primary key, tables of the same file whose ids it must not reuse)
+TABLES = {
+    "Food_Listings": ("Food_ID", ["Food_Listings", "Food_Listings_Archive"]),
+    "Claims": ("Claim_ID", ["Claims"]),
+}
+
+
+def next_id(table):
+    """SQL for the next unused id of `table` in the file the statement runs on."""
+    return f"(SELECT Next_ID FROM Key_Sequence WHERE Table_Name = '{table}')"
+
+
+def _highest(conn, table):
+    key, tables = TABLES[table]
+    return max(conn.execute(f"SELECT IFNULL(MAX({key}), 0) FROM {name}").fetchone()[0] for name in tables)
+
+
+def install(conn):
+    """Create Key_Sequence, start it past every id in the file and its monthly archives, and
+    (re)create the triggers. Runs inside the caller's transaction."""
+    import partitions
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS Key_Sequence (
+            Table_Name TEXT PRIMARY KEY,
+            Next_ID INTEGER NOT NULL
+        ) WITHOUT ROWID""")
+    path = conn.execute("PRAGMA database_list").fetchone()[2]
+    archives = partitions.archive_paths(path) if path else []
+    for table, (key, _) in TABLES.items():
+        highest = _highest(conn, table)
+        for archive in archives:
+            with db.connection(archive, readonly=True) as other:
+                highest = max(highest, _highest(other, table))
+        conn.execute("""INSERT INTO Key_Sequence (Table_Name, Next_ID) VALUES (?, ?)
+                        ON CONFLICT(Table_Name) DO UPDATE SET Next_ID = MAX(Next_ID, excluded.Next_ID)""",
+                     (table, highest + 1))
+        raise_to = f"BEGIN UPDATE Key_Sequence SET Next_ID = NEW.{key} + 1 WHERE Table_Name = '{table}'; END"
+        for suffix in ("ins", "upd"):
+            conn.execute(f"DROP TRIGGER IF EXISTS trg_keys_{table}_{suffix}")
+        conn.execute(f"CREATE TRIGGER trg_keys_{table}_ins AFTER INSERT ON {table} "
+                     f"WHEN NEW.{key} >= {next_id(table)} {raise_to}")
+        conn.execute(f"CREATE TRIGGER trg_keys_{table}_upd AFTER UPDATE OF {key} ON {table} "
+                     f"WHEN NEW.{key} >= {next_id(table)} {raise_to}")
+
+
+# -------------------------
+# Across shards
+# -------------------------
+IN_CHUNK = 900    # values per IN (...) list
+BLOCK_SIZE = 100  # ids take() allocates at a time
+
+
+def allocate(table, n=1, home=None):
+    """Reserve n new ids of `table` that no shard holds or will hand out. Returns the first."""
+    home = os.path.abspath(home or db.DB_NAME)
+    highest = 0
+    for path in shards.paths(home)[1:]:
+        with db.connection(path, readonly=True) as conn:
+            highest = max(highest, conn.execute(f"SELECT {next_id(table)}").fetchone()[0] or 0)
+    with db.transaction(home) as conn:
+        conn.execute("UPDATE Key_Sequence SET Next_ID = MAX(Next_ID, ?) + ? WHERE Table_Name = ?", (highest, n, table))
+        return conn.execute(f"SELECT {next_id(table)} - ?", (n,)).fetchone()[0]
+
+
+_blocks = {}
+_blocks_lock = threading.Lock()
+
+
+def take(table, home=None):
+    """One new id of `table`, from a block of BLOCK_SIZE this process allocate()d, so that most calls
+    don't write to the home database. Ids left in a block when the process exits are never used."""
+    key = (os.path.abspath(home or db.DB_NAME), table, os.getpid())
+    with _blocks_lock:
+        block = _blocks.get(key)
+        if block is None or block[0] == block[1]:
+            first = allocate(table, BLOCK_SIZE, home)
+            block = _blocks[key] = [first, first + BLOCK_SIZE]
+        block[0] += 1
+        return block[0] - 1
+
+
+def existing(table, ids, home=None):
+    """The ids of `ids` some shard already holds a `table` row (or a swept listing) with."""
+    key, tables = TABLES[table]
+    ids = list(ids)
+    found = set()
+    for path in shards.paths(home):
+        with db.connection(path, readonly=True) as conn:
+            for start in range(0, len(ids), IN_CHUNK):
+                chunk = ids[start:start + IN_CHUNK]
+                marks = ", ".join("?" for _ in chunk)
+                query = " UNION ".join(f"SELECT {key} FROM {name} WHERE {key} IN ({marks})" for name in tables)
+                found.update(row_id for (row_id,) in conn.execute(query, chunk * len(tables)))
+    return found
+
+
+def claim(table, ids, home=None):
+    """Check ids chosen for new `table` rows against every shard and keep allocate() from handing
+    them out. Returns the ones already taken."""
+    taken = existing(table, ids, home)
+    highest = max((row_id for row_id in ids if row_id not in taken), default=None)
+    if highest is None:
+        return taken
+    with db.connection(home, readonly=True) as conn:
+        current = conn.execute(f"SELECT {next_id(table)}").fetchone()[0]
+    # only take the write lock when the sequence actually has to move
+    if highest >= current:
+        with db.transaction(home) as conn:
+            conn.execute("UPDATE Key_Sequence SET Next_ID = MAX(Next_ID, ? + 1) WHERE Table_Name = ?", (highest, table))
+    return taken
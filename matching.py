@@ -0,0 +1,157 @@
+"""Bulk allocation of available food to receivers' requests.
+
+Listings are bucketed by (Location, Food_Type, Meal_Type), each bucket a min-heap on
+Expiry_Date, and a location -> buckets map answers a request in its receiver's City without
+looking at any other city. Each request is filled from the soonest-expiring listing among its
+candidate buckets, splitting across listings when one is not enough, so a batch of R requests
+over L listings costs O((R + L) log L) instead of the O(R * L) of checking every pair.
+
+Allocations are written as Pending claims with a single executemany, inside the same
+BEGIN IMMEDIATE transaction that read the listings, so two runs can never hand out the same food.
+
+    python matching.py requests.csv      # CSV with Receiver_ID, Quantity[, Food_Type, Meal_Type]
+"""
+import argparse
+import csv
+import heapq
+from collections import namedtuple
+
+import availability
+import cache
+import db
+import keys
+
+Request = namedtuple("Request", "receiver_id quantity food_type meal_type", defaults=(None, None))
+Listing = namedtuple("Listing", "food_id location food_type meal_type expiry_date available")
+Allocation = namedtuple("Allocation", "food_id receiver_id quantity")
+
+
+class ListingIndex:
+    """Bucketed, expiry-ordered view of the listings that still have food to give."""
+
+    def __init__(self, listings):
+        self.buckets = {}      # (location, food_type, meal_type) -> heap of [expiry, food_id, available]
+        self.by_location = {}  # location -> [bucket keys]
+        for listing in listings:
+            if listing.available <= 0:
+                continue
+            key = (listing.location, listing.food_type, listing.meal_type)
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = []
+                self.by_location.setdefault(listing.location, []).append(key)
+            bucket.append([listing.expiry_date or "", listing.food_id, listing.available])
+        for bucket in self.buckets.values():
+            heapq.heapify(bucket)
+
+    def candidates(self, location, food_type=None, meal_type=None):
+        return [
+            self.buckets[key] for key in self.by_location.get(location, ())
+            if (food_type is None or key[1] == food_type) and (meal_type is None or key[2] == meal_type)
+        ]
+
+    def take(self, location, quantity, food_type=None, meal_type=None):
+        """Allocate up to `quantity` from the soonest-expiring matching listings. Yields (food_id, amount)."""
+        buckets = [bucket for bucket in self.candidates(location, food_type, meal_type) if bucket]
+        while quantity > 0 and buckets:
+            bucket = min(buckets, key=lambda b: b[0][0])
+            entry = bucket[0]
+            amount = min(entry[2], quantity)
+            entry[2] -= amount
+            quantity -= amount
+            yield entry[1], amount
+            if entry[2] == 0:
+                heapq.heappop(bucket)
+                if not bucket:
+                    buckets.remove(bucket)
+
+
+def match(requests, listings, cities):
+    """Pure allocation step. `cities` maps Receiver_ID -> City. Returns [Allocation] in request order."""
+    index = ListingIndex(listings)
+    allocations = []
+    for request in requests:
+        city = cities.get(request.receiver_id)
+        if city is None:
+            continue
+        for food_id, amount in index.take(city, request.quantity, request.food_type, request.meal_type):
+            allocations.append(Allocation(food_id, request.receiver_id, amount))
+    return allocations
+
+
+# -------------------------
+# Database side
+# -------------------------
+IN_CHUNK = 900   # values per IN (...) list
+
+
+def _select_in(conn, query, values, *params):
+    """Run `query` (with one {marks} placeholder for an IN list) over `values` in chunks."""
+    values = list(values)
+    for start in range(0, len(values), IN_CHUNK):
+        chunk = values[start:start + IN_CHUNK]
+        yield from conn.execute(query.format(marks=", ".join("?" for _ in chunk)), (*params, *chunk))
+
+
+def load_listings(conn, locations, as_of):
+    """Live listings in `locations`, net of the claims holding food (Pending ones included)."""
+    query = f"""
+        SELECT Food_ID, Location, Food_Type, Meal_Type, Expiry_Date, Quantity - Claimed_Quantity
+        FROM Food_Listings
+        WHERE {availability.LIVE} AND Expiry_Date >= ? AND Location IN ({{marks}})
+    """
+    return [Listing(*row) for row in _select_in(conn, query, locations, as_of)]
+
+
+def load_cities(conn, receiver_ids):
+    query = "SELECT Receiver_ID, City FROM Receivers WHERE Receiver_ID IN ({marks})"
+    return dict(_select_in(conn, query, receiver_ids))
+
+
+def run(requests, path=None, dry_run=False):
+    """Match `requests` against the live listings and insert the allocations as Pending claims."""
+    requests = [Request(*r) if not isinstance(r, Request) else r for r in requests]
+    as_of = availability.now()
+    with db.connection(path) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cities = load_cities(conn, {r.receiver_id for r in requests})
+            listings = load_listings(conn, sorted(set(cities.values())), as_of) if cities else []
+            allocations = match(requests, listings, cities)
+            if allocations and not dry_run:
+                conn.executemany(
+                    f"INSERT INTO Claims (Claim_ID, Food_ID, Receiver_ID, Status, Timestamp, Quantity) "
+                    f"VALUES ({keys.next_id('Claims')}, ?, ?, 'Pending', ?, ?)",
+                    [(a.food_id, a.receiver_id, as_of, a.quantity) for a in allocations],
+                )
+                conn.commit()
+            else:
+                conn.rollback()
+        except BaseException:
+            conn.rollback()
+            raise
+    if allocations and not dry_run:
+        cache.invalidate(["Claims"])
+    return allocations
+
+
+def read_requests(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            yield Request(int(row["Receiver_ID"]), int(row["Quantity"]),
+                          row.get("Food_Type") or None, row.get("Meal_Type") or None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Allocate available food to receiver requests")
+    parser.add_argument("requests", help="CSV with Receiver_ID, Quantity and optional Food_Type, Meal_Type")
+    parser.add_argument("--db", default=db.DB_NAME)
+    parser.add_argument("--dry-run", action="store_true", help="print the allocation without writing claims")
+    args = parser.parse_args()
+    allocations = run(read_requests(args.requests), args.db, args.dry_run)
+    total = sum(a.quantity for a in allocations)
+    print(f"{'🔎' if args.dry_run else '✅'} {len(allocations):,} allocation(s), {total:,} kg in total")
+
+
+if __name__ == "__main__":
+    main()
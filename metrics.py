@@ -0,0 +1,344 @@
+"""Per-statement timings for crud.run_query and queries.run_sql.
+
+Every execution is recorded under its normalized SQL (literals replaced by ?, whitespace
+collapsed) with its wall time, rows returned, parameter count and the time spent waiting for a
+pooled connection. Each statement keeps a latency histogram over the life of the process
+(exported as Prometheus counters) and a rolling one over the last WINDOW seconds, which the
+p50 / p95 / p99 on the diagnostics page come from. Executions slower than SLOW_QUERY_SECONDS go
+to the slow-query log together with their EXPLAIN QUERY PLAN.
+
+Like cache.py this is a plain module-level registry, so it covers every Streamlit session in the
+process. app.py shows it on a hidden page (?diagnostics=1) and, when FOOD_WASTAGE_METRICS_PORT
+is set, serves it over HTTP:
+
+    FOOD_WASTAGE_METRICS_PORT=9108 streamlit run app.py
+    curl localhost:9108/metrics          # Prometheus text format
+    curl localhost:9108/metrics.json
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import cache
+import db
+
+ENABLED = True
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)   # seconds
+WINDOW = 600            # seconds covered by the rolling histograms ...
+SLICES = 10             # ... kept as this many slices, the oldest dropped as time moves on
+SLOW_QUERY_SECONDS = 0.25
+SLOW_LOG_SIZE = 200     # slow queries kept in memory
+SLOW_LOG_PATH = None    # also append them to this file as JSON lines
+PLAN_TTL = 300          # seconds before a statement's captured query plan is refreshed
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTS = re.compile(r"\?(?:\s*,\s*\?)+")
+_SPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def normalize(query):
+    """'SELECT * FROM Claims  WHERE Claim_ID = 5;' -> 'SELECT * FROM Claims WHERE Claim_ID = ?'"""
+    sql = _LITERALS.sub("?", query)
+    sql = _LISTS.sub("?, ...", sql)
+    return _SPACE.sub(" ", sql).strip().rstrip(";").rstrip()
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)   # the last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def merge(self, other):
+        for i, n in enumerate(other.counts):
+            self.counts[i] += n
+        self.count += other.count
+        self.sum += other.sum
+
+    def quantile(self, q):
+        """Estimated q-quantile in seconds, interpolating inside the bucket like Prometheus does."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                if i == len(BUCKETS):
+                    return BUCKETS[-1]
+                lower = BUCKETS[i - 1] if i else 0.0
+                return lower + (BUCKETS[i] - lower) * (rank - seen) / n
+            seen += n
+        return BUCKETS[-1]
+
+
+class StatementStats:
+    def __init__(self, sql):
+        self.sql = sql
+        self.id = hashlib.sha1(sql.encode()).hexdigest()[:12]
+        self.total = Histogram()
+        self.slices = deque()   # (slice start, Histogram)
+        self.rows = 0
+        self.params = 0
+        self.acquire = 0.0
+        self.errors = 0
+        self.max = 0.0
+        self.last_seen = None
+
+    def observe(self, seconds, rows, params, acquire, error, now):
+        self.total.observe(seconds)
+        start = now - now % (WINDOW / SLICES)
+        if not self.slices or self.slices[-1][0] != start:
+            self.slices.append((start, Histogram()))
+        self.slices[-1][1].observe(seconds)
+        self._expire(now)
+        self.rows += rows or 0
+        self.params = params
+        self.acquire += acquire
+        self.errors += error
+        self.max = max(self.max, seconds)
+        self.last_seen = now
+
+    def _expire(self, now):
+        while self.slices and self.slices[0][0] <= now - WINDOW:
+            self.slices.popleft()
+
+    def recent(self, now):
+        self._expire(now)
+        merged = Histogram()
+        for _, histogram in self.slices:
+            merged.merge(histogram)
+        return merged
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+class Registry:
+    def __init__(self):
+        self._stats = {}         # normalized SQL -> StatementStats
+        self._plans = {}         # normalized SQL -> (captured at, plan lines)
+        self.slow = deque(maxlen=SLOW_LOG_SIZE)
+        self.slow_total = 0
+        self._lock = threading.Lock()
+
+    def record(self, query, params, seconds, rows=None, acquire=0.0, path=None, error=False):
+        sql = normalize(query)
+        now = time.time()
+        with self._lock:
+            stats = self._stats.get(sql)
+            if stats is None:
+                stats = self._stats[sql] = StatementStats(sql)
+            stats.observe(seconds, rows, len(params), acquire, error, now)
+        if seconds >= SLOW_QUERY_SECONDS:
+            self._log_slow(stats, query, params, seconds, rows, acquire, path, now)
+
+    def _log_slow(self, stats, query, params, seconds, rows, acquire, path, now):
+        entry = {
+            "at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now)),
+            "statement": stats.id,
+            "sql": stats.sql,
+            "seconds": round(seconds, 6),
+            "rows": rows,
+            "params": len(params),
+            "acquire_seconds": round(acquire, 6),
+            "plan": self._plan(stats.sql, query, params, path, now),
+        }
+        with self._lock:
+            self.slow.append(entry)
+            self.slow_total += 1
+        if SLOW_LOG_PATH:
+            with open(SLOW_LOG_PATH, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+
+    def _plan(self, sql, query, params, path, now):
+        """EXPLAIN QUERY PLAN of `query`, captured at most once per PLAN_TTL per statement."""
+        cached = self._plans.get(sql)
+        if cached and now - cached[0] < PLAN_TTL:
+            return cached[1]
+        try:
+            with db.connection(path, readonly=True) as conn:
+                plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + query, params)]
+        except Exception as e:   # e.g. DDL, or a statement that only parses against a newer schema
+            plan = [f"(no plan: {type(e).__name__}: {e})"]
+        self._plans[sql] = (now, plan)
+        return plan
+
+    def snapshot(self):
+        now = time.time()
+        with self._lock:
+            statements = []
+            for stats in self._stats.values():
+                recent = stats.recent(now)
+                statements.append({
+                    "statement": stats.id,
+                    "sql": stats.sql,
+                    "calls": stats.total.count,
+                    "errors": stats.errors,
+                    "params": stats.params,
+                    "mean_ms": round(stats.total.sum / stats.total.count * 1000, 3),
+                    "max_ms": round(stats.max * 1000, 3),
+                    "recent_calls": recent.count,
+                    "p50_ms": _ms(recent.quantile(0.50)),
+                    "p95_ms": _ms(recent.quantile(0.95)),
+                    "p99_ms": _ms(recent.quantile(0.99)),
+                    "rows_per_call": round(stats.rows / stats.total.count, 2),
+                    "acquire_ms_per_call": round(stats.acquire / stats.total.count * 1000, 3),
+                    "total_seconds": round(stats.total.sum, 6),
+                })
+            slow = list(self.slow)
+        statements.sort(key=lambda s: s["total_seconds"], reverse=True)
+        return {
+            "window_seconds": WINDOW,
+            "slow_query_seconds": SLOW_QUERY_SECONDS,
+            "slow_queries_total": self.slow_total,
+            "statements": statements,
+            "slow_queries": slow,
+            "cache": cache.stats(),
+        }
+
+    def prometheus(self):
+        def label(value):
+            return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+        with self._lock:
+            stats = list(self._stats.values())
+            slow_total = self.slow_total
+        lines = [
+            "# HELP food_wastage_query_duration_seconds Wall time of statements run through run_query / run_sql.",
+            "# TYPE food_wastage_query_duration_seconds histogram",
+        ]
+        for s in stats:
+            cumulative = 0
+            for bound, n in zip(BUCKETS + ("+Inf",), s.total.counts):
+                cumulative += n
+                lines.append(f'food_wastage_query_duration_seconds_bucket{{statement="{s.id}",le="{bound}"}} {cumulative}')
+            lines.append(f'food_wastage_query_duration_seconds_sum{{statement="{s.id}"}} {s.total.sum:.6f}')
+            lines.append(f'food_wastage_query_duration_seconds_count{{statement="{s.id}"}} {s.total.count}')
+        for name, kind, help_, value in [
+            ("food_wastage_query_rows_total", "counter", "Rows returned.", lambda s: s.rows),
+            ("food_wastage_query_acquire_seconds_total", "counter", "Time spent waiting for a pooled connection.",
+             lambda s: f"{s.acquire:.6f}"),
+            ("food_wastage_query_errors_total", "counter", "Executions that raised.", lambda s: s.errors),
+            ("food_wastage_query_params", "gauge", "Parameters bound by the last execution.", lambda s: s.params),
+        ]:
+            lines += [f"# HELP {name} {help_}", f"# TYPE {name} {kind}"]
+            lines += [f'{name}{{statement="{s.id}"}} {value(s)}' for s in stats]
+        lines += ["# HELP food_wastage_query_info Normalized SQL of each statement id.",
+                  "# TYPE food_wastage_query_info gauge"]
+        lines += [f'food_wastage_query_info{{statement="{s.id}",sql="{label(s.sql)}"}} 1' for s in stats]
+        lines += ["# HELP food_wastage_slow_queries_total Executions slower than the slow-query threshold.",
+                  "# TYPE food_wastage_slow_queries_total counter",
+                  f"food_wastage_slow_queries_total {slow_total}"]
+        for key, value in cache.stats().items():
+            kind = "counter" if key in ("hits", "misses", "evictions", "expirations", "invalidations") else "gauge"
+            name = f"food_wastage_cache_{key}" + ("_total" if kind == "counter" else "")
+            lines += [f"# TYPE {name} {kind}", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        with self._lock:
+            self._stats.clear()
+            self._plans.clear()
+            self.slow.clear()
+            self.slow_total = 0
+
+
+# -------------------------
+# The shared registry and module-level shortcuts
+# -------------------------
+registry = Registry()
+
+
+@contextmanager
+def timed(query, params=(), path=None):
+    """Record the block as one execution of `query`. Set .rows on the yielded object if it returns rows."""
+    observation = SimpleNamespace(rows=None)
+    if not ENABLED:
+        yield observation
+        return
+    start = time.perf_counter()
+    error = False
+    try:
+        yield observation
+    except BaseException:
+        error = True
+        raise
+    finally:
+        registry.record(query, params, time.perf_counter() - start, observation.rows,
+                        db.last_acquire_seconds(), path, error)
+
+
+def configure(enabled=None, slow_query_seconds=None, slow_log_path=None, window=None):
+    global ENABLED, SLOW_QUERY_SECONDS, SLOW_LOG_PATH, WINDOW
+    if enabled is not None:
+        ENABLED = enabled
+    if slow_query_seconds is not None:
+        SLOW_QUERY_SECONDS = slow_query_seconds
+    if slow_log_path is not None:
+        SLOW_LOG_PATH = slow_log_path or None
+    if window is not None:
+        WINDOW = window
+
+
+def snapshot():
+    return registry.snapshot()
+
+
+def prometheus():
+    return registry.prometheus()
+
+
+def clear():
+    registry.clear()
+
+
+# -------------------------
+# HTTP export
+# -------------------------
+_server = None
+_server_lock = threading.Lock()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] == "/metrics":
+            body, content_type = prometheus(), "text/plain; version=0.0.4"
+        elif self.path.split("?")[0] == "/metrics.json":
+            body, content_type = json.dumps(snapshot()), "application/json"
+        else:
+            self.send_error(404)
+            return
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port, host="127.0.0.1"):
+    """Serve /metrics and /metrics.json from a daemon thread. Only the first call starts a server."""
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), _Handler)
+            threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    return _server
@@ -0,0 +1,381 @@
+"""Versioned schema migrations for food_wastage.db.
+
+The schema version is kept in SQLite's `PRAGMA user_version`. Each migration runs in its own
+transaction and bumps the version, so upgrade() is safe to call on every start-up.
+
+    python migrate.py            # bring the database up to date
+    python migrate.py --check    # print EXPLAIN QUERY PLAN for every query in queries.py
+"""
+import argparse
+import inspect
+import re
+
+import db
+import timeutil
+
+# -------------------------
+# Table definitions
+# -------------------------
+TABLES = {
+    "Providers": """
+        CREATE TABLE Providers (
+            Provider_ID INTEGER PRIMARY KEY,
+            Name TEXT,
+            Type TEXT,
+            Address TEXT,
+            City TEXT,
+            Contact TEXT
+        )""",
+    "Receivers": """
+        CREATE TABLE Receivers (
+            Receiver_ID INTEGER PRIMARY KEY,
+            Name TEXT,
+            Type TEXT,
+            City TEXT,
+            Contact TEXT
+        )""",
+    "Food_Listings": """
+        CREATE TABLE Food_Listings (
+            Food_ID INTEGER PRIMARY KEY,
+            Food_Name TEXT,
+            Quantity INTEGER,
+            Expiry_Date TIMESTAMP,
+            Provider_ID INTEGER REFERENCES Providers(Provider_ID),
+            Provider_Type TEXT,
+            Location TEXT,
+            Food_Type TEXT,
+            Meal_Type TEXT
+        )""",
+    "Claims": """
+        CREATE TABLE Claims (
+            Claim_ID INTEGER PRIMARY KEY,
+            Food_ID INTEGER REFERENCES Food_Listings(Food_ID),
+            Receiver_ID INTEGER REFERENCES Receivers(Receiver_ID),
+            Status TEXT,
+            Timestamp TIMESTAMP
+        )""",
+}
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_claims_food ON Claims(Food_ID)",
+    "CREATE INDEX IF NOT EXISTS idx_claims_receiver ON Claims(Receiver_ID)",
+    "CREATE INDEX IF NOT EXISTS idx_claims_status_timestamp ON Claims(Status, Timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_food_provider ON Food_Listings(Provider_ID)",
+    "CREATE INDEX IF NOT EXISTS idx_food_location_type ON Food_Listings(Location, Food_Type)",
+    "CREATE INDEX IF NOT EXISTS idx_providers_city ON Providers(City)",
+    # covering indexes so the whole-table GROUP BYs in queries.py read an index instead of the table
+    "CREATE INDEX IF NOT EXISTS idx_receivers_city ON Receivers(City)",
+    "CREATE INDEX IF NOT EXISTS idx_food_name ON Food_Listings(Food_Name)",
+    "CREATE INDEX IF NOT EXISTS idx_food_provider_type ON Food_Listings(Provider_Type, Quantity)",
+]
+
+
+def table_exists(conn, name):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    ).fetchone() is not None
+
+
+def columns(conn, table):
+    return [row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')]
+
+
+def rebuild_table(conn, table, create_sql):
+    """Recreate `table` from `create_sql`, copying the rows across.
+
+    Rows whose primary key is already taken (pandas' to_sql never enforced one) keep the first
+    copy; the later copies are moved to <table>_Duplicates rather than silently dropped.
+    """
+    if not table_exists(conn, table):
+        conn.execute(create_sql)
+        return
+    old = f"{table}_old"
+    conn.execute(f'ALTER TABLE "{table}" RENAME TO "{old}"')
+    conn.execute(create_sql)
+    shared = ", ".join(c for c in columns(conn, table) if c in columns(conn, old))
+    conn.execute(f'INSERT OR IGNORE INTO "{table}" ({shared}) SELECT {shared} FROM "{old}" ORDER BY rowid')
+    pk = columns(conn, table)[0]
+    dupes = conn.execute(
+        f'SELECT COUNT(*) FROM "{old}" o WHERE o.rowid <> (SELECT MIN(rowid) FROM "{old}" WHERE {pk} = o.{pk})'
+    ).fetchone()[0]
+    if dupes:
+        conn.execute(
+            f'CREATE TABLE "{table}_Duplicates" AS SELECT * FROM "{old}" o '
+            f'WHERE o.rowid <> (SELECT MIN(rowid) FROM "{old}" WHERE {pk} = o.{pk})'
+        )
+        print(f"⚠️ {table}: {dupes} duplicate {pk} row(s) moved to {table}_Duplicates")
+    conn.execute(f'DROP TABLE "{old}"')
+
+
+# -------------------------
+# Migrations -- append only; never edit one that has shipped
+# -------------------------
+def m001_keys_and_indexes(conn):
+    for table, create_sql in TABLES.items():
+        rebuild_table(conn, table, create_sql)
+    for statement in INDEXES:
+        conn.execute(statement)
+
+
+def m002_ingest_progress(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS Ingest_Progress (
+            Source TEXT,
+            Table_Name TEXT,
+            Signature TEXT,
+            Rows_Committed INTEGER,
+            Updated_At TIMESTAMP,
+            PRIMARY KEY (Source, Table_Name)
+        )""")
+
+
+def m003_summary_tables(conn):
+    import summary
+    summary.install(conn)
+
+
+def m004_availability(conn):
+    import availability
+    conn.execute("ALTER TABLE Claims ADD COLUMN Quantity INTEGER")
+    conn.execute("ALTER TABLE Food_Listings ADD COLUMN Claimed_Quantity INTEGER NOT NULL DEFAULT 0")
+    conn.execute("ALTER TABLE Food_Listings ADD COLUMN Full_Claims INTEGER NOT NULL DEFAULT 0")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS Food_Listings_Archive (
+            Food_ID INTEGER PRIMARY KEY,
+            Food_Name TEXT,
+            Quantity INTEGER,
+            Expiry_Date TIMESTAMP,
+            Provider_ID INTEGER,
+            Provider_Type TEXT,
+            Location TEXT,
+            Food_Type TEXT,
+            Meal_Type TEXT,
+            Archived_At TIMESTAMP
+        )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_food_expiry ON Food_Listings(Expiry_Date)")
+    conn.execute(f"""CREATE INDEX IF NOT EXISTS idx_food_live_location
+                     ON Food_Listings(Location, Food_Type, Expiry_Date) WHERE {availability.LIVE}""")
+    conn.execute(f"""CREATE INDEX IF NOT EXISTS idx_food_live_expiry
+                     ON Food_Listings(Expiry_Date) WHERE {availability.LIVE}""")
+    availability.install(conn)
+
+
+def m005_timestamps(conn):
+    import summary
+    # rows written before ingest / crud normalized timestamps ('3/5/2025 5:26', '2025-01-01', ...)
+    conn.create_function("to_timestamp", 1, timeutil.to_timestamp_or_same, deterministic=True)
+    for table, column in [("Claims", "Timestamp"), ("Food_Listings", "Expiry_Date"),
+                          ("Food_Listings_Archive", "Expiry_Date")]:
+        conn.execute(f"UPDATE {table} SET {column} = to_timestamp({column}) WHERE {column} NOT GLOB ?",
+                     (timeutil.CANONICAL_GLOB,))
+    conn.execute("ALTER TABLE Claims ADD COLUMN Claim_Month TEXT GENERATED ALWAYS AS (substr(Timestamp, 1, 7)) VIRTUAL")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_claims_timestamp ON Claims(Timestamp, Status)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_claims_month ON Claims(Claim_Month, Status)")
+    summary.install(conn)   # Summary_Claims_Month is now keyed on the same substr() as Claim_Month
+
+
+def m006_row_versions(conn):
+    import export
+    export.install(conn)
+
+
+def m007_search(conn):
+    import search
+    search.install(conn)
+
+
+def m008_geo(conn):
+    import availability
+    import geo
+    geo.install(conn)
+    # a city's live listings in expiry order, so a distance query reads only the first few of each nearby city
+    conn.execute(f"""CREATE INDEX IF NOT EXISTS idx_food_live_location_expiry
+                     ON Food_Listings(Location, Expiry_Date) WHERE {availability.LIVE}""")
+
+
+def m009_shard_map(conn):
+    # city -> shard assignments (see shards.py); no rows means everything stays in this file
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS Shard_Map (
+            City TEXT PRIMARY KEY,
+            Shard TEXT NOT NULL
+        ) WITHOUT ROWID""")
+
+
+def m010_partitions(conn):
+    # monthly archive files of this database (see partitions.py) and the time span each covers
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS Partitions (
+            Month TEXT PRIMARY KEY,
+            First_Time TEXT NOT NULL,
+            Last_Time TEXT NOT NULL,
+            Listings INTEGER NOT NULL,
+            Claims INTEGER NOT NULL,
+            Bytes INTEGER,
+            Compacted_At TEXT
+        ) WITHOUT ROWID""")
+
+
+def m011_changelog(conn):
+    import changelog
+    changelog.install(conn)
+
+
+def m012_pending_holds(conn):
+    import availability
+    availability.install(conn)   # new HOLDING: Pending and Approved claims hold food too
+
+
+def m013_key_sequences(conn):
+    import keys
+    keys.install(conn)
+
+
+def m014_archived_listing_summaries(conn):
+    import summary
+    summary.install(conn)   # the listing summaries count Food_Listings_Archive too, swept rows back in
+
+
+MIGRATIONS = [
+    (1, "primary keys, foreign keys and secondary indexes", m001_keys_and_indexes),
+    (2, "ingest progress tracking", m002_ingest_progress),
+    (3, "trigger-maintained analytics summary tables", m003_summary_tables),
+    (4, "claim quantities, live-listing indexes and listing archive", m004_availability),
+    (5, "canonical timestamps and the generated Claims.Claim_Month column", m005_timestamps),
+    (6, "row versions for incremental exports", m006_row_versions),
+    (7, "FTS5 name search over food listings, providers and receivers", m007_search),
+    (8, "gazetteer and R-tree index for distance queries", m008_geo),
+    (9, "city to shard map", m009_shard_map),
+    (10, "monthly partition list", m010_partitions),
+    (11, "change-data capture log and consumers", m011_changelog),
+    (12, "claims hold their food until cancelled or rejected", m012_pending_holds),
+    (13, "id sequences that survive archiving", m013_key_sequences),
+    (14, "swept listings stay in the listing summaries", m014_archived_listing_summaries),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def upgrade(path=None, target=LATEST_VERSION):
+    """Apply every migration newer than the database's user_version, then upgrade its shard files
+    (see shards.py) and monthly archives (see partitions.py) the same way. Returns the versions
+    applied to `path` itself."""
+    applied = []
+    with db.connection(path) as conn:
+        # foreign keys are off while migrating (rebuild_table renames and drops tables others point
+        # at); the pragma can't change inside a transaction, so it is switched around the loop
+        foreign_keys = conn.execute("PRAGMA foreign_keys").fetchone()[0]
+        conn.execute("PRAGMA foreign_keys = OFF")
+        try:
+            for version, description, migration in MIGRATIONS:
+                if version > target or version <= current_version(conn):
+                    continue
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    # re-check under the write lock in case another process got here first
+                    if version > current_version(conn):
+                        migration(conn)
+                        conn.execute(f"PRAGMA user_version = {version}")
+                    conn.commit()
+                except BaseException:
+                    conn.rollback()
+                    raise
+                applied.append((version, description))
+        finally:
+            conn.execute(f"PRAGMA foreign_keys = {foreign_keys}")
+        if applied:
+            conn.execute("ANALYZE")
+    import partitions
+    import shards
+    for other in shards.paths(path)[1:] + partitions.archive_paths(path):
+        upgrade(other, target)
+    return applied
+
+
+# -------------------------
+# Query plan check
+# -------------------------
+QUERY_HELPERS = ("run_sql", "run_batch", "stream", "result_format", "from_columns")   # queries.py functions that aren't analytics
+
+
+def capture_queries():
+    """Call every analytics function in queries.py without running it; yields (name, sql, params)."""
+    import queries
+
+    with queries.result_format("sql"):
+        for name, fn in inspect.getmembers(queries, inspect.isfunction):
+            if fn.__module__ != queries.__name__ or name.startswith("_") or name in QUERY_HELPERS:
+                continue
+            required = [p for p in inspect.signature(fn).parameters.values() if p.default is p.empty]
+            query, params = fn(*["" for _ in required])
+            yield name, query, params
+
+
+def table_aliases(query):
+    """{alias or table name: table name} for every FROM / JOIN in `query`."""
+    aliases = {}
+    for table, alias in re.findall(r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", query, re.IGNORECASE):
+        aliases[table] = table
+        if alias and alias.upper() not in SQL_KEYWORDS:
+            aliases[alias] = table
+    return aliases
+
+
+SQL_KEYWORDS = {"WHERE", "JOIN", "ON", "GROUP", "ORDER", "LIMIT", "LEFT", "INNER", "CROSS", "USING", "UNION"}
+
+
+def check_query_plans(path=None):
+    """EXPLAIN QUERY PLAN every query in queries.py. Returns [(name, plan_lines, uses_index)].
+
+    A query fails if any base table is read by a plain SCAN (no index) or through an AUTOMATIC
+    index, i.e. one SQLite had to build on the fly because a real one is missing.
+    """
+    report = []
+    with db.connection(path, readonly=True) as conn:
+        for name, query, params in capture_queries():
+            plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + query, params)]
+            tables = table_aliases(query)
+            table_steps = [
+                step for step in plan
+                if step.startswith(("SCAN", "SEARCH"))
+                # the Summary_* tables hold one row per group, so reading them whole is the point
+                and not tables.get(step.split()[1], step.split()[1]).startswith("Summary_")
+            ]
+            uses_index = all(
+                ("INDEX" in step or "PRIMARY KEY" in step) and "AUTOMATIC" not in step
+                for i, step in enumerate(table_steps)
+                # the outer loop of an indexed join has to visit every row of its table anyway
+                if not (i == 0 and len(table_steps) > 1 and step.startswith("SCAN"))
+            )
+            report.append((name, plan, uses_index))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate food_wastage.db to the latest schema")
+    parser.add_argument("--db", default=db.DB_NAME)
+    parser.add_argument("--check", action="store_true", help="print query plans instead of migrating")
+    args = parser.parse_args()
+
+    if args.check:
+        failures = 0
+        for name, plan, uses_index in check_query_plans(args.db):
+            failures += not uses_index
+            print(f"{'✅' if uses_index else '❌'} {name}")
+            for step in plan:
+                print(f"      {step}")
+        raise SystemExit(1 if failures else 0)
+
+    applied = upgrade(args.db)
+    for version, description in applied:
+        print(f"✅ migration {version}: {description}")
+    if not applied:
+        print(f"Database already at version {LATEST_VERSION}")
+
+
+if __name__ == "__main__":
+    main()
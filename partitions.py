@@ -0,0 +1,310 @@
+"""Monthly partitions: closed months of listings and claims moved out to archive database files.
+
+The hot database keeps recent activity. compact() moves every month that closed more than
+HOT_MONTHS ago into an archive file of its own next to it (food_wastage.2025-03.db, one per month),
+which has the full schema, so the summary triggers build there the same Summary_* rows that
+queries.py reads. A month's partition is the listings expiring in it together with all of their
+claims (plus claims whose listing no longer exists, by Claim_Month) and the archived listings of
+that month: a claim never ends up in another file than its listing, so the hold counters and
+summaries stay right on both sides, and the hot file's summaries shrink by exactly what moved.
+
+The rows leave the hot file's change log as "archive"s rather than deletes.
+
+Partitions, in the hot database, lists the archives with the time span their rows cover (the
+earliest and latest claim Timestamp / listing Expiry_Date in them). queries.py passes the date
+range a call is about to files(), which returns the hot file plus only the archives overlapping it,
+and merges their results like it merges shards (see shards.py); without a range every archive is
+read. crud.py works on the hot data only, as it does for availability.py's Food_Listings_Archive:
+a claim archived with its month can no longer be changed. A sharded database keeps archives per
+shard (food_wastage.north.2025-03.db).
+
+An archive drops what cold reads don't need -- the FTS5 name search (search.py), change tracking
+(export.py) and the change log (changelog.py) -- before anything is copied into it, and is
+VACUUMed once compaction has written to it, so it holds no free pages. SQLite has no built-in page compression, so that is as small as an
+archive gets while staying queryable.
+
+    python partitions.py --status
+    python partitions.py --compact                    # archive months closed more than HOT_MONTHS ago
+    python partitions.py --compact --hot-months 1 --vacuum-hot
+    python partitions.py --compact --every 3600       # keep doing it, hourly (or start() in a process)
+"""
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import cache
+import db
+import shards
+
+HOT_MONTHS = 3
+PARTITIONS_TTL = 1.0   # seconds a process keeps using the partition list it last read
+COMPACT_EVERY = 3600   # seconds between background compactions
+
+
+def archive_path(path, month):
+    """The archive file of `path` for 'YYYY-MM' `month`."""
+    root, ext = os.path.splitext(os.path.abspath(path))
+    return f"{root}.{month}{ext or '.db'}"
+
+
+def month_bounds(month):
+    """('YYYY-MM-01 00:00:00', first second of the next month) for 'YYYY-MM' `month`."""
+    year, number = int(month[:4]), int(month[5:7])
+    following = f"{year + number // 12:04d}-{number % 12 + 1:02d}"
+    return f"{month}-01 00:00:00", f"{following}-01 00:00:00"
+
+
+def month_period(start_month=None, end_month=None):
+    """(start, end) timestamps covering 'YYYY-MM' months start_month..end_month inclusive; None for an open end."""
+    return (month_bounds(start_month)[0] if start_month else None,
+            month_bounds(end_month)[1] if end_month else None)
+
+
+# -------------------------
+# Partition list --
+# [(month, first, last)] of each hot file, read at most every PARTITIONS_TTL seconds
+# -------------------------
+_lists = {}
+_lists_lock = threading.Lock()
+
+
+def archives(path=None):
+    """[(month, first, last)] for every archive of the hot file `path`, oldest first."""
+    path = os.path.abspath(path or db.DB_NAME)
+    entry = _lists.get(path)
+    if entry is not None and time.monotonic() - entry[0] < PARTITIONS_TTL:
+        return entry[1]
+    with _lists_lock:
+        try:
+            with db.connection(path, readonly=True) as conn:
+                listed = conn.execute("SELECT Month, First_Time, Last_Time FROM Partitions ORDER BY Month").fetchall()
+        except sqlite3.OperationalError:   # not migrated yet: no archives
+            listed = []
+        _lists[path] = (time.monotonic(), listed)
+    return listed
+
+
+def reload(path=None):
+    _lists.pop(os.path.abspath(path or db.DB_NAME), None)
+
+
+def files(path=None, start=None, end=None, home=None):
+    """The hot file `path` followed by its archives holding rows between start (inclusive) and end
+    (exclusive), both canonical timestamps or None for an open end."""
+    path = os.path.abspath(path or db.DB_NAME)
+    found = [path]
+    for month, first, last in archives(path):
+        if (end is None or first < end) and (start is None or last >= start):
+            found.append(archive_path(path, month))
+            shards.attach_home(found[-1], home)
+    return found
+
+
+def archive_paths(path=None):
+    path = path or db.DB_NAME
+    return [archive_path(path, month) for month, _, _ in archives(path)]
+
+
+# -------------------------
+# Compaction
+# -------------------------
+def closed_months(path=None, hot_months=HOT_MONTHS, as_of=None):
+    """Months of `path` with rows to archive: everything before the month hot_months before as_of's."""
+    now = datetime.strptime(as_of, "%Y-%m-%d %H:%M:%S") if as_of else datetime.now()
+    index = now.year * 12 + now.month - 1 - hot_months
+    cutoff = f"{index // 12:04d}-{index % 12 + 1:02d}-01 00:00:00"
+    with db.connection(path, readonly=True) as conn:
+        return [month for (month,) in conn.execute("""
+            SELECT substr(Expiry_Date, 1, 7) FROM Food_Listings WHERE Expiry_Date < :cutoff
+            UNION SELECT substr(Expiry_Date, 1, 7) FROM Food_Listings_Archive WHERE Expiry_Date < :cutoff
+            UNION SELECT Claim_Month FROM Claims c WHERE Claim_Month < substr(:cutoff, 1, 7)
+                  AND NOT EXISTS (SELECT 1 FROM Food_Listings f WHERE f.Food_ID = c.Food_ID)
+            ORDER BY 1""", {"cutoff": cutoff}) if month]
+
+
+def _strip(path):
+    """Drop the FTS5 search indexes, change tracking and the change log from an archive."""
+    import search
+
+    conn = shards._connect(path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        for (name,) in conn.execute("""SELECT name FROM sqlite_master WHERE type = 'trigger'
+                                       AND (name LIKE 'trg_search_%' OR name LIKE 'trg_export_%'
+                                            OR name LIKE 'trg_changelog_%')""").fetchall():
+            conn.execute(f"DROP TRIGGER {name}")
+        for index in search.INDEXES:
+            conn.execute(f"DROP TABLE IF EXISTS {index['name']}")
+        for table in ("Row_Versions", "Change_Log", "Change_Consumers"):
+            conn.execute(f"DROP TABLE IF EXISTS {table}")
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+
+def archive_month(month, path=None):
+    """Move `month`'s partition of the hot file `path` into its archive (created if needed).
+    Returns {"listings": n, "claims": n, "archived": n} moved."""
+    import changelog
+    import crud
+    import migrate
+
+    path = os.path.abspath(path or db.DB_NAME)
+    target = archive_path(path, month)
+    migrate.upgrade(target)
+    _strip(target)   # again after any migration that reinstalled something
+    start, end = month_bounds(month)
+    listings = "Expiry_Date >= :start AND Expiry_Date < :end"
+    claims = f"""SELECT {crud.CLAIM_COLUMNS} FROM Claims WHERE Food_ID IN (SELECT Food_ID FROM Food_Listings WHERE {listings})
+                 UNION ALL
+                 SELECT {crud.CLAIM_COLUMNS} FROM Claims c WHERE Claim_Month = :month
+                        AND NOT EXISTS (SELECT 1 FROM Food_Listings f WHERE f.Food_ID = c.Food_ID)"""
+    params = {"start": start, "end": end, "month": month}
+    source, dest = shards._connect(path), shards._connect(target)
+    try:
+        source.execute("BEGIN IMMEDIATE")
+        dest.execute("BEGIN IMMEDIATE")
+        logged = changelog.last_seq(source)
+        # claims go in after their listings, in the order they were made, so the hold triggers see
+        # the same sequence they did in the hot file
+        moved = {
+            "listings": shards._copy(source, dest, f"SELECT {crud.FOOD_COLUMNS} FROM Food_Listings WHERE {listings}",
+                                     params, "Food_Listings"),
+            "claims": shards._copy(source, dest, f"{claims} ORDER BY Claim_ID", params, "Claims"),
+            "archived": shards._copy(source, dest, f"SELECT * FROM Food_Listings_Archive WHERE {listings}",
+                                     params, "Food_Listings_Archive"),
+        }
+        if not any(moved.values()):
+            source.execute("ROLLBACK")
+            dest.execute("ROLLBACK")
+            return moved
+        dest.execute("COMMIT")
+        first, last, n_listings, n_claims = dest.execute("""
+            SELECT MIN(t), MAX(t), (SELECT COUNT(*) FROM Food_Listings) + (SELECT COUNT(*) FROM Food_Listings_Archive),
+                   (SELECT COUNT(*) FROM Claims)
+            FROM (SELECT Timestamp AS t FROM Claims UNION ALL SELECT Expiry_Date FROM Food_Listings
+                  UNION ALL SELECT Expiry_Date FROM Food_Listings_Archive)""").fetchone()
+        # the listing and the delete commit together, so a reader sees the rows in exactly one place
+        source.execute("""INSERT INTO Partitions (Month, First_Time, Last_Time, Listings, Claims, Bytes, Compacted_At)
+                          VALUES (?, ?, ?, ?, ?, NULL, NULL)
+                          ON CONFLICT(Month) DO UPDATE SET First_Time = excluded.First_Time,
+                              Last_Time = excluded.Last_Time, Listings = excluded.Listings, Claims = excluded.Claims""",
+                       (month, first, last, n_listings, n_claims))
+        source.execute(f"DELETE FROM Claims WHERE Claim_ID IN (SELECT Claim_ID FROM ({claims}))", params)
+        source.execute(f"DELETE FROM Food_Listings WHERE {listings}", params)
+        source.execute(f"DELETE FROM Food_Listings_Archive WHERE {listings}", params)
+        changelog.relabel(source, logged, "archive")   # not deletes, for the change log's consumers
+        source.execute("COMMIT")
+    except BaseException:
+        for conn in (source, dest):
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+        raise
+    finally:
+        source.close()
+        dest.close()
+    reload(path)
+    cache.clear()
+    return moved
+
+
+def vacuum(path):
+    """VACUUM and ANALYZE `path` and fold its WAL back in. Returns its size in bytes afterwards."""
+    conn = shards._connect(path)
+    try:
+        conn.execute("VACUUM")
+        conn.execute("ANALYZE")   # the planner statistics are from before the rows came or went
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+    return os.path.getsize(path)
+
+
+def compact(path=None, hot_months=HOT_MONTHS, as_of=None, vacuum_hot=False):
+    """Archive every closed month of the hot file `path` and VACUUM the archives written to.
+    Returns [(month, moved counts, archive bytes)]. vacuum_hot also VACUUMs the hot file, which
+    blocks its writers while it runs."""
+    path = os.path.abspath(path or db.DB_NAME)
+    done = []
+    for month in closed_months(path, hot_months, as_of):
+        moved = archive_month(month, path)
+        if any(moved.values()):
+            size = vacuum(archive_path(path, month))
+            with db.transaction(path) as conn:
+                conn.execute("UPDATE Partitions SET Bytes = ?, Compacted_At = ? WHERE Month = ?",
+                             (size, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), month))
+            done.append((month, moved, size))
+    if vacuum_hot and done:
+        vacuum(path)
+    elif done:
+        with db.connection(path) as conn:
+            conn.execute("ANALYZE")
+    return done
+
+
+def compact_all(home=None, hot_months=HOT_MONTHS, as_of=None, vacuum_hot=False):
+    """compact() every shard (see shards.py). Returns {shard path: compact() result}."""
+    return {path: compact(path, hot_months, as_of, vacuum_hot) for path in shards.paths(home)}
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def start(every=COMPACT_EVERY, home=None, hot_months=HOT_MONTHS):
+    """Run compact_all() every `every` seconds on a daemon thread. Only the first call starts one."""
+    global _worker
+
+    def loop():
+        while True:
+            try:
+                compact_all(home, hot_months)
+            except sqlite3.Error as e:   # e.g. locked for longer than busy_timeout; try again next time
+                print(f"⚠️ compaction failed: {e}")
+            time.sleep(every)
+
+    with _worker_lock:
+        if _worker is None:
+            _worker = threading.Thread(target=loop, name="partitions-compact", daemon=True)
+            _worker.start()
+    return _worker
+
+
+def status(path=None):
+    """[(month, first, last, listings, claims, MB, compacted at)] for every archive of `path`."""
+    with db.connection(path, readonly=True) as conn:
+        return [row[:5] + ((row[5] or 0) / 1e6, row[6]) for row in conn.execute(
+            "SELECT Month, First_Time, Last_Time, Listings, Claims, Bytes, Compacted_At FROM Partitions ORDER BY Month")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move closed months of listings and claims to archive files")
+    parser.add_argument("--db", default=db.DB_NAME, help="the home database")
+    parser.add_argument("--compact", action="store_true", help="archive closed months (default: just --status)")
+    parser.add_argument("--status", action="store_true")
+    parser.add_argument("--hot-months", type=int, default=HOT_MONTHS, help="months kept in the hot file")
+    parser.add_argument("--vacuum-hot", action="store_true", help="also VACUUM the hot file (blocks writers)")
+    parser.add_argument("--every", type=float, help="repeat --compact every N seconds")
+    args = parser.parse_args()
+
+    while args.compact:
+        start_time = time.perf_counter()
+        for path, done in compact_all(args.db, args.hot_months, vacuum_hot=args.vacuum_hot).items():
+            for month, moved, size in done:
+                print(f"✅ {os.path.basename(path)} {month}: {moved['listings']:,} listings, {moved['claims']:,} claims, "
+                      f"{moved['archived']:,} archived listings -> {size / 1e6:.1f} MB")
+        print(f"compaction took {time.perf_counter() - start_time:.1f}s")
+        if not args.every:
+            break
+        time.sleep(args.every)
+    print(f"{'file':<28}{'month':<9}{'first':<21}{'last':<21}{'listings':>10}{'claims':>10}{'MB':>8}")
+    for path in shards.paths(args.db):
+        for month, first, last, listings, claims, mb, _ in status(path):
+            print(f"{os.path.basename(path):<28}{month:<9}{first:<21}{last:<21}{listings:>10,}{claims:>10,}{mb:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,157 +1,591 @@
+import contextvars
 import sqlite3
-import pandas as pd
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import availability
+import cache
+import columnar
+import db
+import geo
+import metrics
+import partitions
+import shards
+import timeutil
+
+DB_NAME = db.DB_NAME
+
+# -------------------------
+# Result formats --
+# "frame" (the default) is a pandas DataFrame built over columnar.py's NumPy arrays, "pandas" the
+# same DataFrame from pd.read_sql_query, "columns" {column: NumPy array} without touching pandas,
+# "arrow" a pyarrow Table, and "sql" returns (query, params) without running anything.
+# -------------------------
+FORMATS = ("frame", "pandas", "columns", "arrow", "sql")
+_format = contextvars.ContextVar("queries_result_format", default="frame")
+
+
+@contextmanager
+def result_format(fmt):
+    """Make every analytics call in the block return `fmt`, e.g.
+
+        with queries.result_format("columns"):
+            cities = queries.providers_per_city()["City"]
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown result format {fmt!r}; expected one of {FORMATS}")
+    token = _format.set(fmt)
+    try:
+        yield
+    finally:
+        _format.reset(token)
+
+
+def _fetch(conn, query, params, fmt):
+    if fmt == "pandas":
+        import pandas as pd
+        return pd.read_sql_query(query, conn, params=params)
+    cursor = conn.execute(query, params)
+    if fmt == "arrow":
+        return columnar.fetch_arrow(cursor)
+    columns = columnar.fetch_columns(cursor)
+    return columnar.to_frame(columns) if fmt == "frame" else columns
+
+
+def from_columns(columns):
+    """{column: NumPy array} computed outside SQLite (see readmodel.py), in the current result format."""
+    fmt = _format.get()
+    if fmt == "sql":
+        raise ValueError("this result is computed in memory; there is no SQL to return")
+    if fmt == "arrow":
+        import pyarrow as pa
+        return pa.table(columns)
+    return columns if fmt == "columns" else columnar.to_frame(columns)
+
+
+def _rows(result):
+    if isinstance(result, dict):
+        return len(next(iter(result.values()), ()))
+    return len(result)
+
+
+def _copy(result):
+    if isinstance(result, dict):
+        return {name: array.copy() for name, array in result.items()}
+    return result.copy() if hasattr(result, "copy") else result   # pyarrow Tables are immutable
 
-DB_NAME = "food_wastage.db"
 
 # -------------------------
 # Helper Function
 # -------------------------
-def run_sql(query, params=()):
-    """Run SQL query and return result as pandas DataFrame"""
-    conn = sqlite3.connect(DB_NAME)
-    df = pd.read_sql_query(query, conn, params=params)
-    conn.close()
-    return df
+def run_sql(query, params=(), ttl=None, merge=None, city=None, period=None):
+    """Run SQL query on a pooled read-only connection and return the result in the current format.
+
+    When the database is sharded (see shards.py), a query about one `city` runs on that city's
+    shard only, and one with a `merge` (a shards.Merge) runs on every shard in parallel, its
+    partial results combined by the merge. Queries with neither read only the home database.
+    A query with a merge also reads the monthly archives of those files (see partitions.py),
+    only those overlapping `period` -- (start, end) timestamps, None for an open end -- if given.
+
+    Results are cached (see cache.py) for `ttl` seconds, or until crud.py writes to a table the query reads.
+    Executions (not cache hits) are timed by metrics.py.
+    """
+    fmt = _format.get()
+    if fmt == "sql":
+        return query, params
+    path = DB_NAME if city is None else shards.path_for_city(city, DB_NAME)
+    targets = [path]
+    if merge is not None:
+        start, end = period or (None, None)
+        hot = [path] if city is not None else shards.paths(DB_NAME)
+        targets = [target for hot_path in hot for target in partitions.files(hot_path, start, end, DB_NAME)]
+    key = (tuple(targets), query, tuple(params), fmt)
+    result = cache.query_cache.get(key)
+    if result is None:
+        version = cache.query_cache.version
+        # the file the query ran on (the first of them for a merge), for the slow-query log's EXPLAIN
+        with metrics.timed(query, params, path) as timing:
+            if len(targets) == 1:
+                with db.connection(path, readonly=True) as conn:
+                    result = _fetch(conn, query, params, fmt)
+            else:
+                conn = shards.gather(query, params, merge, targets)
+                try:
+                    result = _fetch(conn, merge.combine, (), fmt)
+                finally:
+                    conn.close()
+            timing.rows = _rows(result)
+        cache.query_cache.put(key, result, cache.tables_read(query), ttl, version)
+    return _copy(result)
+
+
+def _per_file(query):
+    """Whether `query` reads tables kept in every shard and archive: listings, claims and their summaries."""
+    return any(table.startswith(("Food_Listings", "Claims", "Summary_")) and table not in shards.GLOBAL_TABLES
+               for table in cache.tables_read(query))
+
+
+def stream(fn, *args, batch_size=columnar.FETCH_SIZE, **kwargs):
+    """Run analytics function `fn` lazily, yielding {column: NumPy array} batches of up to batch_size rows.
+
+    Nothing is cached and the whole result is never held at once. The read connection stays
+    borrowed until the generator is exhausted or closed. A query over listings or claims reads
+    every shard and archive one after the other, and the batches are not merged: each file's rows
+    come sorted and limited on their own, and aggregates come once per file.
+    """
+    with result_format("sql"):
+        query, params = fn(*args, **kwargs)
+    targets = [DB_NAME]
+    if _per_file(query):
+        targets = [target for path in shards.paths(DB_NAME) for target in partitions.files(path, home=DB_NAME)]
+    with metrics.timed(query, params, DB_NAME) as timing:
+        timing.rows = 0
+        for path in targets:
+            with db.connection(path, readonly=True) as conn:
+                for batch in columnar.iter_batches(conn.execute(query, params), batch_size):
+                    timing.rows += _rows(batch)
+                    yield batch
+
+
+# -------------------------
+# Concurrent batches --
+# the analytics calls are independent reads, and SQLite releases the GIL while a statement runs,
+# so a page that needs many of them can run them side by side on pooled read-only connections.
+# -------------------------
+BATCH_WORKERS = 4
+BATCH_TIMEOUT = 30   # seconds per call
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _batch_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="queries-batch")
+        return _executor
+
+
+def _run_until(fn, args, until, timeout):
+    remaining = until - time.monotonic()
+    if remaining <= 0:
+        raise TimeoutError(f"{fn.__name__} did not start within {timeout}s")
+    try:
+        with db.deadline(remaining):
+            return fn(*args)
+    except sqlite3.OperationalError:
+        if time.monotonic() >= until:
+            raise TimeoutError(f"{fn.__name__} took longer than {timeout}s") from None
+        raise
+
+
+def run_batch(calls, timeout=BATCH_TIMEOUT):
+    """Run independent analytics calls concurrently and return {name: result}.
+
+    `calls` maps a name to (function, *args). A call that raises, or is not done `timeout` seconds
+    after the batch started (its statement is interrupted), gets the exception as its result
+    instead, so one bad query never takes the others down. Results come back in the order of `calls`.
+    """
+    executor = _batch_executor()
+    until = time.monotonic() + timeout
+    futures = {}
+    for name, (fn, *args) in calls.items():
+        # copy the caller's context so result_format() applies inside the worker threads too
+        context = contextvars.copy_context()
+        futures[name] = executor.submit(context.run, _run_until, fn, args, until, timeout)
+    results = {}
+    for name, future in futures.items():
+        try:
+            # a little slack: the deadline is only checked every db.PROGRESS_STEPS instructions
+            results[name] = future.result(timeout=max(0.0, until + 1 - time.monotonic()))
+        except Exception as e:
+            results[name] = e
+    return results
+
+
+# -------------------------
+# Most of the functions below read the trigger-maintained Summary_* tables (see summary.py),
+# so they cost O(groups) rather than a scan of the base tables. Those over listings and claims
+# say how their per-shard results are merged when the database is sharded; those over providers
+# and receivers only read the home database, which holds all of them.
+# -------------------------
+
+
+# -------------------------
+# Claim periods --
+# the claim analytics take an optional start (inclusive) and end (exclusive), anything
+# timeutil.to_timestamp accepts. Without them they read the summary tables; with them they count
+# the claims made in the period, a range scan of idx_claims_timestamp, and only the monthly
+# archives holding such claims are read (see partitions.py).
+# -------------------------
+# '9999-12-31' rather than '9999': Timestamp has NUMERIC affinity, which would compare '9999' as a number
+_CLAIMED_IN = "c.Timestamp >= IFNULL(?, '') AND c.Timestamp < IFNULL(?, '9999-12-31')"
+
+
+def _period(start, end):
+    return timeutil.to_timestamp(start), timeutil.to_timestamp(end)
 
 
 # -------------------------
 # Providers & Receivers
 # -------------------------
 def providers_per_city():
-    return run_sql("SELECT City, COUNT(*) AS Provider_Count FROM Providers GROUP BY City;")
+    return run_sql("SELECT City, Provider_Count FROM Summary_Providers_City WHERE Provider_Count > 0 ORDER BY City;")
 
 def receivers_per_city():
-    return run_sql("SELECT City, COUNT(*) AS Receiver_Count FROM Receivers GROUP BY City;")
+    return run_sql("SELECT City, Receiver_Count FROM Summary_Receivers_City WHERE Receiver_Count > 0 ORDER BY City;")
 
 def top_provider_types():
     return run_sql("""
-        SELECT Provider_Type, SUM(Quantity) AS Total_Quantity
-        FROM Food_Listings
-        GROUP BY Provider_Type
+        SELECT Provider_Type, Total_Quantity
+        FROM Summary_Provider_Types
+        WHERE Listing_Count > 0
         ORDER BY Total_Quantity DESC;
-    """)
+    """, merge=shards.regroup(["Provider_Type"], ["Total_Quantity"], "Total_Quantity DESC"))
 
 def provider_contacts_by_city(city):
     return run_sql("SELECT Name, Contact FROM Providers WHERE City = ?", (city,))
 
-def top_receivers(limit=10):
+def top_receivers(limit=10, start=None, end=None):
+    merge = shards.regroup(["Name"], ["Total_Claims"], "Total_Claims DESC", limit)
+    if start or end:
+        return run_sql(f"""
+            SELECT r.Name, COUNT(*) AS Total_Claims
+            FROM Claims c
+            JOIN Receivers r ON c.Receiver_ID = r.Receiver_ID
+            WHERE {_CLAIMED_IN}
+            GROUP BY r.Name
+            ORDER BY Total_Claims DESC
+            LIMIT ?;
+        """, _period(start, end) + (limit,), merge=merge, period=_period(start, end))
     return run_sql("""
-        SELECT r.Name, COUNT(c.Claim_ID) AS Total_Claims
-        FROM Claims c
-        JOIN Receivers r ON c.Receiver_ID = r.Receiver_ID
+        SELECT r.Name, SUM(s.Claim_Count) AS Total_Claims
+        FROM Summary_Receiver_Claims s
+        JOIN Receivers r ON s.Receiver_ID = r.Receiver_ID
+        WHERE s.Claim_Count > 0
         GROUP BY r.Name
         ORDER BY Total_Claims DESC
         LIMIT ?;
-    """, (limit,))
+    """, (limit,), merge=merge)
 
 
 # -------------------------
 # Food Listings & Availability
 # -------------------------
 def total_food_available():
-    return run_sql("SELECT SUM(Quantity) AS Total_Food_Available FROM Food_Listings;")
+    # unexpired listings only, net of the quantity already claimed; no archive holds any
+    as_of = availability.now()
+    return run_sql(f"""
+        SELECT IFNULL(SUM(Quantity - Claimed_Quantity), 0) AS Total_Food_Available
+        FROM Food_Listings
+        WHERE {availability.LIVE} AND Expiry_Date >= ?;
+    """, (as_of,), merge=shards.regroup([], ["Total_Food_Available"]), period=(as_of, None))
 
 def city_with_most_listings():
     return run_sql("""
-        SELECT Location, COUNT(*) AS Total_Listings
-        FROM Food_Listings
-        GROUP BY Location
+        SELECT Location, Listing_Count AS Total_Listings
+        FROM Summary_Locations
+        WHERE Listing_Count > 0
         ORDER BY Total_Listings DESC
-        LIMIT 1;
-    """)
+        LIMIT ?;
+    """, (1,), merge=shards.regroup(["Location"], ["Total_Listings"], "Total_Listings DESC", 1))
 
 def common_food_types():
     return run_sql("""
-        SELECT Food_Type, COUNT(*) AS Count_Type
-        FROM Food_Listings
-        GROUP BY Food_Type
+        SELECT Food_Type, Listing_Count AS Count_Type
+        FROM Summary_Food_Types
+        WHERE Listing_Count > 0
         ORDER BY Count_Type DESC;
-    """)
+    """, merge=shards.regroup(["Food_Type"], ["Count_Type"], "Count_Type DESC"))
+
+
+def available_food(location=None, food_type=None, within_hours=None, limit=100):
+    """Live listings, soonest expiry first, with the quantity still claimable.
+
+    within_hours limits the result to listings expiring in the next N hours. Reads one of the
+    partial indexes over live listings, so the cost follows the size of the answer, not the table.
+    With a location, only that city's shard is read.
+    """
+    as_of = availability.now()
+    where = [availability.LIVE, "Expiry_Date >= ?"]
+    params = [as_of]
+    if within_hours is not None:
+        where.append("Expiry_Date < datetime(?, ?)")
+        params += [as_of, f"+{within_hours} hours"]
+    if location is not None:
+        where.append("Location = ?")
+        params.append(location)
+    if food_type is not None:
+        where.append("Food_Type = ?")
+        params.append(food_type)
+    return run_sql(f"""
+        SELECT Food_ID, Food_Name, Quantity - Claimed_Quantity AS Available_Quantity, Expiry_Date,
+               Provider_ID, Location, Food_Type, Meal_Type
+        FROM Food_Listings
+        WHERE {" AND ".join(where)}
+        ORDER BY Expiry_Date
+        LIMIT ?;
+    """, tuple(params) + (limit,), city=location, merge=None if location else shards.concat("Expiry_Date", limit),
+        period=(as_of, None))
+
+def expiring_soon(hours=24, location=None, food_type=None, limit=100):
+    return available_food(location, food_type, within_hours=hours, limit=limit)
+
+
+# -------------------------
+# Distance (see geo.py)
+# -------------------------
+NEAREST_MAX_KM = 250
+
+# cities within ? km of the city of receiver ?; receivers whose city has no coordinates get nothing
+_NEAR_RECEIVER = geo.near_cities_sql("""
+    SELECT g.Latitude AS Lat, g.Longitude AS Lon, ? AS Km
+    FROM Receivers r JOIN Gazetteer g ON g.City = r.City
+    WHERE r.Receiver_ID = ?""")
+
+
+def providers_near_receiver(receiver_id, km=25, limit=100):
+    """Providers within km of the receiver's city, nearest first."""
+    # all of a city's providers are equally far away, so each city contributes at most `limit`
+    return run_sql(f"""{_NEAR_RECEIVER}
+        SELECT p.Provider_ID, p.Name, p.Type, p.City, p.Contact, ROUND(n.Distance_Km, 1) AS Distance_Km
+        FROM near n
+        JOIN Providers p ON p.Provider_ID IN (
+            SELECT Provider_ID FROM Providers WHERE City = n.City ORDER BY Provider_ID LIMIT ?)
+        WHERE n.Distance_Km <= n.Km
+        ORDER BY n.Distance_Km, p.Provider_ID
+        LIMIT ?;
+    """, (km, receiver_id, limit, limit))
+
+def food_near_receiver(receiver_id, km=25, limit=100):
+    """Live listings within km of the receiver's city, nearest first, then soonest expiry.
+
+    Each nearby city contributes only its `limit` soonest-expiring listings, read in order from
+    idx_food_live_location_expiry, so a busy city costs no more than a quiet one.
+    """
+    as_of = availability.now()
+    return run_sql(f"""{_NEAR_RECEIVER}
+        SELECT f.Food_ID, f.Food_Name, f.Quantity - f.Claimed_Quantity AS Available_Quantity, f.Expiry_Date,
+               f.Provider_ID, f.Location, f.Food_Type, f.Meal_Type, ROUND(n.Distance_Km, 1) AS Distance_Km
+        FROM near n
+        JOIN Food_Listings f ON f.Food_ID IN (
+            SELECT Food_ID FROM Food_Listings
+            WHERE Location = n.City AND {availability.LIVE} AND Expiry_Date >= ?
+            ORDER BY Expiry_Date
+            LIMIT ?)
+        WHERE n.Distance_Km <= n.Km
+        ORDER BY n.Distance_Km, f.Expiry_Date
+        LIMIT ?;
+    """, (km, receiver_id, as_of, limit, limit), merge=shards.concat("Distance_Km, Expiry_Date", limit),
+        period=(as_of, None))
+
+def nearest_food(receiver_id, n=10, max_km=NEAREST_MAX_KM):
+    return food_near_receiver(receiver_id, km=max_km, limit=n)
 
 
 # -------------------------
 # Claims & Distribution
 # -------------------------
-def claims_per_food(limit=10):
+def claims_per_food(limit=10, start=None, end=None):
+    merge = shards.regroup(["Food_Name"], ["Claim_Count"], "Claim_Count DESC", limit)
+    if start or end:
+        return run_sql(f"""
+            SELECT f.Food_Name, COUNT(*) AS Claim_Count
+            FROM Claims c
+            JOIN Food_Listings f ON c.Food_ID = f.Food_ID
+            WHERE {_CLAIMED_IN}
+            GROUP BY f.Food_Name
+            ORDER BY Claim_Count DESC
+            LIMIT ?;
+        """, _period(start, end) + (limit,), merge=merge, period=_period(start, end))
     return run_sql("""
-        SELECT f.Food_Name, COUNT(c.Claim_ID) AS Claim_Count
-        FROM Claims c
-        JOIN Food_Listings f ON c.Food_ID = f.Food_ID
+        SELECT f.Food_Name, SUM(s.Claim_Count) AS Claim_Count
+        FROM Summary_Food_Claims s
+        JOIN Food_Listings f ON s.Food_ID = f.Food_ID
+        WHERE s.Claim_Count > 0
         GROUP BY f.Food_Name
         ORDER BY Claim_Count DESC
         LIMIT ?;
-    """, (limit,))
+    """, (limit,), merge=merge)
 
-def top_successful_provider():
+def top_successful_provider(start=None, end=None):
+    merge = shards.regroup(["Name"], ["Successful_Claims"], "Successful_Claims DESC", 1)
+    if start or end:
+        return run_sql(f"""
+            SELECT p.Name, COUNT(*) AS Successful_Claims
+            FROM Claims c
+            JOIN Food_Listings f ON c.Food_ID = f.Food_ID
+            JOIN Providers p ON f.Provider_ID = p.Provider_ID
+            WHERE c.Status = 'Completed' AND {_CLAIMED_IN}
+            GROUP BY p.Name
+            ORDER BY Successful_Claims DESC
+            LIMIT ?;
+        """, _period(start, end) + (1,), merge=merge, period=_period(start, end))
     return run_sql("""
-        SELECT p.Name, COUNT(c.Claim_ID) AS Successful_Claims
-        FROM Claims c
-        JOIN Food_Listings f ON c.Food_ID = f.Food_ID
+        SELECT p.Name, SUM(s.Completed_Count) AS Successful_Claims
+        FROM Summary_Food_Claims s
+        JOIN Food_Listings f ON s.Food_ID = f.Food_ID
         JOIN Providers p ON f.Provider_ID = p.Provider_ID
-        WHERE c.Status = 'Completed'
+        WHERE s.Completed_Count > 0
         GROUP BY p.Name
         ORDER BY Successful_Claims DESC
-        LIMIT 1;
-    """)
+        LIMIT ?;
+    """, (1,), merge=merge)
 
-def claim_status_percentage():
+_STATUS_PERCENTAGE = ("SELECT Status, ROUND(SUM(Claim_Count) * 100.0 / (SELECT SUM(Claim_Count) FROM part), 2) "
+                      "AS Percentage FROM part GROUP BY Status ORDER BY Status")
+
+def claim_status_percentage(start=None, end=None):
+    if start or end:
+        return run_sql(f"""
+            SELECT Status,
+                   ROUND(COUNT(*) * 100.0 / (SELECT COUNT(*) FROM Claims c WHERE {_CLAIMED_IN}), 2) AS Percentage
+            FROM Claims c
+            WHERE {_CLAIMED_IN}
+            GROUP BY Status
+            ORDER BY Status;
+        """, _period(start, end) * 2, period=_period(start, end), merge=shards.Merge(
+            _STATUS_PERCENTAGE, params=_period(start, end),
+            partial=f"SELECT Status, COUNT(*) AS Claim_Count FROM Claims c WHERE {_CLAIMED_IN} GROUP BY Status"))
     return run_sql("""
         SELECT Status,
-               ROUND(COUNT(*) * 100.0 / (SELECT COUNT(*) FROM Claims), 2) AS Percentage
-        FROM Claims
-        GROUP BY Status;
-    """)
+               ROUND(Claim_Count * 100.0 / (SELECT SUM(Claim_Count) FROM Summary_Claim_Status), 2) AS Percentage
+        FROM Summary_Claim_Status
+        WHERE Claim_Count > 0
+        ORDER BY Status;
+    """, merge=shards.Merge(
+        _STATUS_PERCENTAGE,
+        partial="SELECT Status, Claim_Count FROM Summary_Claim_Status WHERE Claim_Count > 0"))
 
 
 # -------------------------
 # Analysis & Insights
 # -------------------------
-def avg_quantity_per_receiver(limit=10):
-    return run_sql("""
+_AVG_QUANTITY_PARTIAL = """
+    SELECT r.Name, SUM(f.Quantity) AS Quantity, COUNT(f.Quantity) AS Claims
+    FROM Claims c
+    JOIN Receivers r ON c.Receiver_ID = r.Receiver_ID
+    JOIN Food_Listings f ON c.Food_ID = f.Food_ID
+    WHERE {where}
+    GROUP BY r.Name
+"""
+
+def avg_quantity_per_receiver(limit=10, start=None, end=None):
+    # sharded: an average of averages is wrong, so each shard returns sums and counts
+    where, params = "c.Status = 'Completed'", ()
+    if start or end:
+        where, params = f"{where} AND {_CLAIMED_IN}", _period(start, end)
+    return run_sql(f"""
         SELECT r.Name, ROUND(AVG(f.Quantity),2) AS Avg_Quantity_Claimed
         FROM Claims c
         JOIN Receivers r ON c.Receiver_ID = r.Receiver_ID
         JOIN Food_Listings f ON c.Food_ID = f.Food_ID
-        WHERE c.Status = 'Completed'
+        WHERE {where}
         GROUP BY r.Name
         ORDER BY Avg_Quantity_Claimed DESC
         LIMIT ?;
-    """, (limit,))
+    """, params + (limit,), period=params or None, merge=shards.Merge(
+        "SELECT Name, ROUND(SUM(Quantity) * 1.0 / SUM(Claims), 2) AS Avg_Quantity_Claimed FROM part "
+        f"GROUP BY Name ORDER BY Avg_Quantity_Claimed DESC LIMIT {int(limit)}",
+        partial=_AVG_QUANTITY_PARTIAL.format(where=where), params=params))
 
-def most_claimed_meal_type():
+def most_claimed_meal_type(start=None, end=None):
+    merge = shards.regroup(["Meal_Type"], ["Total_Claims"], "Total_Claims DESC")
+    if start or end:
+        return run_sql(f"""
+            SELECT f.Meal_Type, COUNT(*) AS Total_Claims
+            FROM Claims c
+            JOIN Food_Listings f ON c.Food_ID = f.Food_ID
+            WHERE c.Status = 'Completed' AND {_CLAIMED_IN}
+            GROUP BY f.Meal_Type
+            ORDER BY Total_Claims DESC;
+        """, _period(start, end), merge=merge, period=_period(start, end))
     return run_sql("""
-        SELECT f.Meal_Type, COUNT(c.Claim_ID) AS Total_Claims
-        FROM Claims c
-        JOIN Food_Listings f ON c.Food_ID = f.Food_ID
-        WHERE c.Status = 'Completed'
+        SELECT f.Meal_Type, SUM(s.Completed_Count) AS Total_Claims
+        FROM Summary_Food_Claims s
+        JOIN Food_Listings f ON s.Food_ID = f.Food_ID
+        WHERE s.Completed_Count > 0
         GROUP BY f.Meal_Type
         ORDER BY Total_Claims DESC;
-    """)
+    """, merge=merge)
 
 def total_donated_per_provider(limit=10):
     return run_sql("""
-        SELECT p.Name, SUM(f.Quantity) AS Total_Donated
-        FROM Providers p
-        JOIN Food_Listings f ON p.Provider_ID = f.Provider_ID
+        SELECT p.Name, SUM(s.Total_Quantity) AS Total_Donated
+        FROM Summary_Provider_Donations s
+        JOIN Providers p ON s.Provider_ID = p.Provider_ID
+        WHERE s.Listing_Count > 0
         GROUP BY p.Name
         ORDER BY Total_Donated DESC
         LIMIT ?;
-    """, (limit,))
+    """, (limit,), merge=shards.regroup(["Name"], ["Total_Donated"], "Total_Donated DESC", limit))
 
 def top_donated_foods(limit=5):
     return run_sql("""
-        SELECT Food_Name, COUNT(*) AS Donation_Count
-        FROM Food_Listings
-        GROUP BY Food_Name
+        SELECT Food_Name, Listing_Count AS Donation_Count
+        FROM Summary_Food_Names
+        WHERE Listing_Count > 0
         ORDER BY Donation_Count DESC
         LIMIT ?;
-    """, (limit,))
+    """, (limit,), merge=shards.regroup(["Food_Name"], ["Donation_Count"], "Donation_Count DESC", limit))
 
-def monthly_claim_trend():
+def monthly_claim_trend(start_month=None, end_month=None):
+    """Completed claims per month, optionally limited to 'YYYY-MM' months start_month..end_month inclusive."""
     return run_sql("""
-        SELECT strftime('%Y-%m', Timestamp) AS Month, COUNT(*) AS Total_Claims
-        FROM Claims
-        WHERE Status = 'Completed'
-        GROUP BY Month
+        SELECT Month, Completed_Count AS Total_Claims
+        FROM Summary_Claims_Month
+        WHERE Completed_Count > 0
+          AND Month >= IFNULL(?, '') AND Month <= IFNULL(?, '9999-99')
         ORDER BY Month;
-    """)
\ No newline at end of file
+    """, (start_month or None, end_month or None), merge=shards.regroup(["Month"], ["Total_Claims"], "Month"),
+        period=partitions.month_period(start_month, end_month))
+
+
+# -------------------------
+# Time ranges --
+# Timestamps are canonical 'YYYY-MM-DD HH:MM:SS' text (see timeutil.py), so these are range scans
+# of idx_claims_timestamp / idx_claims_status_timestamp. `start` is inclusive and `end` exclusive;
+# both accept anything timeutil.to_timestamp does (a date, a datetime, '2025-03-01', ...).
+# -------------------------
+def claim_counts_between(start, end):
+    period = _period(start, end)
+    return run_sql("""
+        SELECT Status, COUNT(*) AS Claim_Count
+        FROM Claims
+        WHERE Timestamp >= ? AND Timestamp < ?
+        GROUP BY Status
+        ORDER BY Claim_Count DESC;
+    """, period, merge=shards.regroup(["Status"], ["Claim_Count"], "Claim_Count DESC"), period=period)
+
+def claims_between(start, end, status=None, limit=100):
+    period = _period(start, end)
+    if status:
+        return run_sql("""
+            SELECT Claim_ID, Food_ID, Receiver_ID, Status, Timestamp, Quantity
+            FROM Claims
+            WHERE Status = ? AND Timestamp >= ? AND Timestamp < ?
+            ORDER BY Timestamp
+            LIMIT ?;
+        """, (status,) + period + (limit,), merge=shards.concat("Timestamp", limit), period=period)
+    return run_sql("""
+        SELECT Claim_ID, Food_ID, Receiver_ID, Status, Timestamp, Quantity
+        FROM Claims
+        WHERE Timestamp >= ? AND Timestamp < ?
+        ORDER BY Timestamp
+        LIMIT ?;
+    """, period + (limit,), merge=shards.concat("Timestamp", limit), period=period)
+
+def claim_status_by_month(start_month=None, end_month=None):
+    """Claims per month and status, through the generated Claim_Month column and idx_claims_month."""
+    return run_sql("""
+        SELECT Claim_Month AS Month, Status, COUNT(*) AS Claim_Count
+        FROM Claims
+        WHERE Claim_Month >= IFNULL(?, '') AND Claim_Month <= IFNULL(?, '9999-99')
+        GROUP BY Claim_Month, Status
+        ORDER BY Claim_Month, Status;
+    """, (start_month or None, end_month or None),
+        merge=shards.regroup(["Month", "Status"], ["Claim_Count"], "Month, Status"),
+        period=partitions.month_period(start_month, end_month))
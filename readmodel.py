@@ -0,0 +1,577 @@
+"""In-process columnar read model of the listings and claims, for the Analysis page at scale.
+
+queries.py answers every call from the database: an indexed SQLite round trip, then a DataFrame.
+With FOOD_WASTAGE_READ_MODEL set, the app instead keeps Food_Listings and Claims (and the names
+of providers and receivers) in memory as NumPy column arrays and computes the listing and claim
+aggregates below with vectorized group-bys: np.bincount over dictionary-encoded columns, and
+np.searchsorted for the joins. Each function takes the same arguments and returns the same
+columns as its namesake in queries.py, in the current queries.result_format.
+
+Text columns that repeat (Location, Food_Type, Meal_Type, Status, the names, ...) are
+dictionary-encoded: a code per row, in as small an integer type as the number of distinct values
+allows, and each value once. Claim timestamps are datetime64[s], quantities float32 (NaN for
+NULL). Rows are kept in key order, so a join or an update is a binary search, and deleted rows
+are masked out until there are enough of them to compact.
+
+The model is loaded once -- the hot file, shards and monthly archives, as run_sql reads them --
+and then kept current from the change log (see changelog.py): a refresh reads the changes after
+the seqs it was loaded at and applies them, O(changes). It keeps those positions itself rather
+than registering a consumer, so a process that goes away holds nothing back. It loads again when
+the log can't bring it up to date: after a shard move, or once the log has been truncated past
+its position. An "archive" change -- a listing the sweeper moved to Food_Listings_Archive, or a
+row a compaction moved into a monthly archive -- leaves the row in the model: swept listings count
+in the listing analytics, as they do in the summaries (see summary.py).
+
+    python readmodel.py      # load and report the memory used per column
+"""
+import argparse
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+import cache
+import changelog
+import columnar
+import db
+import partitions
+import queries
+import shards
+import timeutil
+
+REFRESH_TTL = 1.0     # seconds between reads of the change log, unless this process wrote meanwhile
+LOAD_BATCH = 65536    # rows per fetchmany() when loading
+
+# table -> {column: kind}, the key first; only the columns the aggregates below use
+TABLES = {
+    "Providers": {"Provider_ID": "id", "Name": "category"},
+    "Receivers": {"Receiver_ID": "id", "Name": "category"},
+    "Food_Listings": {"Food_ID": "id", "Food_Name": "category", "Quantity": "quantity", "Provider_ID": "id",
+                      "Provider_Type": "category", "Location": "category", "Food_Type": "category",
+                      "Meal_Type": "category"},
+    "Claims": {"Claim_ID": "id", "Food_ID": "id", "Receiver_ID": "id", "Status": "category", "Timestamp": "time"},
+}
+FILE_TABLES = ["Food_Listings", "Claims"]   # in every shard and archive; the rest only in the home database
+
+_CODE_TYPES = [np.int8, np.int16, np.int32, np.int64]
+_TYPES = {"id": np.int64, "quantity": np.float32, "time": "datetime64[s]"}
+
+
+# -------------------------
+# Column storage
+# -------------------------
+class _Categories:
+    """The distinct values of a dictionary-encoded column; a row holds its value's position here."""
+
+    def __init__(self):
+        self.values = []
+        self.index = {}
+        self._array = None
+
+    def encode(self, values):
+        index = self.index
+        codes = [index.setdefault(value, len(index)) for value in values]
+        if len(index) > len(self.values):
+            self.values.extend(list(index)[len(self.values):])
+            self._array = None
+        return np.array(codes, dtype=np.int64)
+
+    def dtype(self):
+        return next(t for t in _CODE_TYPES if len(self.values) <= np.iinfo(t).max + 1)
+
+    def array(self):
+        """The values as an object array, to index with codes."""
+        if self._array is None:
+            self._array = np.empty(len(self.values), dtype=object)
+            self._array[:] = self.values
+        return self._array
+
+    def nbytes(self):
+        return sys.getsizeof(self.values) + sys.getsizeof(self.index) + sum(map(sys.getsizeof, self.values))
+
+
+class _Table:
+    """One table as growable column arrays in key order."""
+
+    def __init__(self, name):
+        self.name = name
+        self.kinds = TABLES[name]
+        self.key = next(iter(self.kinds))
+        self.categories = {col: _Categories() for col, kind in self.kinds.items() if kind == "category"}
+        self.arrays = {col: np.empty(0, self._dtype(col)) for col in self.kinds}
+        self.alive = np.empty(0, dtype=bool)
+        self.n = 0          # rows in use, deleted ones included
+        self.dead = 0
+        self.in_order = True
+        self.version = 0    # bumped after every change, rows moved included, for the cached lookups below
+        self._slots = None
+        self._joins = {}
+
+    def _dtype(self, col):
+        kind = self.kinds[col]
+        return self.categories[col].dtype() if kind == "category" else _TYPES[kind]
+
+    def _encode(self, col, values):
+        kind = self.kinds[col]
+        if kind == "category":
+            codes = self.categories[col].encode(values)
+            if self.arrays[col].dtype != self._dtype(col):   # more distinct values than the code type holds
+                self.arrays[col] = self.arrays[col].astype(self._dtype(col))
+            return codes
+        if kind == "time":
+            return np.array(values, dtype="datetime64[s]")
+        if isinstance(values, np.ndarray) and values.dtype != object:
+            return values.astype(_TYPES[kind])
+        missing = np.nan if kind == "quantity" else -1   # -1: an id that matches nothing
+        return np.array([missing if value is None else value for value in values], dtype=_TYPES[kind])
+
+    def column(self, col):
+        return self.arrays[col][:self.n]
+
+    def mask(self):
+        return self.alive[:self.n]
+
+    def live(self, col, mask=None):
+        """The values of `col` in the live rows (and in `mask`, if given); no copy when nothing is deleted."""
+        if mask is None:
+            return self.column(col) if not self.dead else self.column(col)[self.mask()]
+        return self.column(col)[mask]
+
+    def append(self, columns):
+        """Add rows given as {column: values}, without looking for their keys (see settle())."""
+        encoded = {col: self._encode(col, columns[col]) for col in self.kinds}
+        keys = encoded[self.key]
+        m = len(keys)
+        if not m:
+            return
+        if self.n + m > len(self.alive):
+            capacity = max(2 * len(self.alive), self.n + m, 1024)
+            for col, array in list(self.arrays.items()) + [(None, self.alive)]:
+                grown = np.empty(capacity, array.dtype)
+                grown[:self.n] = array[:self.n]
+                if col is None:
+                    self.alive = grown
+                else:
+                    self.arrays[col] = grown
+        for col, values in encoded.items():
+            self.arrays[col][self.n:self.n + m] = values
+        self.alive[self.n:self.n + m] = True
+        if self.in_order and (np.any(keys[1:] <= keys[:-1]) or self.n and keys[0] <= self.arrays[self.key][self.n - 1]):
+            self.in_order = False
+        self.n += m
+        self.version += 1
+
+    def settle(self):
+        """Put the rows back in key order, keeping the last copy of a key appended twice, and compact
+        once a quarter of them are deleted (or after a sort, as a search could land on a dropped copy)."""
+        resorted = not self.in_order
+        if resorted:
+            order = np.argsort(self.column(self.key), kind="stable")
+            for col in self.kinds:
+                self.arrays[col][:self.n] = self.column(col)[order]
+            self.alive[:self.n] = self.mask()[order]
+            keys, alive = self.column(self.key), self.mask()
+            alive[:-1] &= keys[:-1] != keys[1:]
+            self.dead = self.n - int(np.count_nonzero(alive))
+            self.in_order = True
+            self.version += 1
+        if self.dead and (resorted or self.dead * 4 >= self.n):
+            keep = self.mask().copy()
+            for col in self.kinds:
+                self.arrays[col] = self.column(col)[keep]
+            self.n = len(self.arrays[self.key])
+            self.alive = np.ones(self.n, dtype=bool)
+            self.dead = 0
+            self.version += 1
+
+    def slots(self):
+        """Position of the live row with each key, indexed by key (-1 for none), while the keys are dense
+        enough for that to be small; else None."""
+        if self._slots is None or self._slots[0] != self.version:
+            ids = self.column(self.key)
+            slots = None
+            if self.n and ids[0] >= 0 and ids[-1] < 4 * self.n + 1024:
+                slots = np.full(ids[-1] + 1, -1, dtype=np.int32 if self.n < 2**31 else np.int64)
+                slots[ids[self.mask()]] = np.flatnonzero(self.mask())
+            self._slots = (self.version, slots)
+        return self._slots[1]
+
+    def lookup(self, keys):
+        """(positions, found): where each of `keys` is, and whether it is a live row here."""
+        keys = np.asarray(keys, dtype=np.int64)
+        if not self.n:
+            return np.zeros(len(keys), dtype=np.int64), np.zeros(len(keys), dtype=bool)
+        # a few keys (a refresh's batch) are cheaper to search for than to rebuild stale slots for
+        fresh = self._slots is not None and self._slots[0] == self.version
+        slots = self.slots() if fresh or len(keys) * 16 >= self.n else None
+        if slots is not None:
+            positions = slots[np.clip(keys, 0, len(slots) - 1)]
+            found = (positions >= 0) & (keys >= 0) & (keys < len(slots))
+            return np.maximum(positions, 0), found
+        ids = self.column(self.key)
+        positions = np.minimum(np.searchsorted(ids, keys), self.n - 1)
+        return positions, (ids[positions] == keys) & self.mask()[positions]
+
+    def join(self, col, parent):
+        """lookup() of every row's `col` in table `parent`, kept until either table changes."""
+        cached = self._joins.get(col)
+        if cached is None or cached[0] != (self.version, parent.version):
+            cached = self._joins[col] = ((self.version, parent.version), *parent.lookup(self.column(col)))
+        return cached[1], cached[2]
+
+    def upsert(self, rows):
+        """Insert or replace rows given as {column: value} dicts, at most one per key."""
+        if not rows:
+            return
+        columns = {col: [row[col] for row in rows] for col in self.kinds}
+        keys = np.array(columns[self.key], dtype=np.int64)
+        positions, _ = self.lookup(keys)
+        present = (self.column(self.key)[positions] == keys) if self.n else np.zeros(len(keys), dtype=bool)
+        if present.any():
+            at = positions[present]
+            for col in self.kinds:
+                values = [value for value, hit in zip(columns[col], present) if hit]
+                self.arrays[col][at] = self._encode(col, values)
+            self.dead -= int(np.count_nonzero(~self.alive[at]))
+            self.alive[at] = True
+            self.version += 1
+        new = np.flatnonzero(~present)
+        if len(new):
+            new = new[np.argsort(keys[new], kind="stable")]
+            self.append({col: [columns[col][i] for i in new] for col in self.kinds})
+        self.settle()
+
+    def delete(self, keys):
+        if not len(keys):
+            return
+        positions, found = self.lookup(keys)
+        at = np.unique(positions[found])
+        self.alive[at] = False
+        self.dead += len(at)
+        self.version += 1
+        self.settle()
+
+    def memory(self):
+        """[(column, type, bytes)], a category's bytes including its distinct values."""
+        report = []
+        for col, kind in self.kinds.items():
+            array = self.arrays[col]
+            if kind == "category":
+                values = self.categories[col]
+                report.append((col, f"{array.dtype} codes, {len(values.values):,} values",
+                               array.nbytes + values.nbytes()))
+            else:
+                report.append((col, str(array.dtype), array.nbytes))
+        report.append(("(live rows)", "bool", self.alive.nbytes))
+        return report
+
+
+def _read(table, conn, source=None):
+    query = f"SELECT {', '.join(table.kinds)} FROM {source or table.name}"
+    for batch in columnar.iter_batches(conn.execute(query), LOAD_BATCH):
+        table.append(batch)
+
+
+# -------------------------
+# Loading and refreshing
+# -------------------------
+class _Reload(Exception):
+    """The change log can't bring the model up to date; it has to be read again."""
+
+
+class ReadModel:
+    def __init__(self, home=None):
+        self.home = home or db.DB_NAME
+        self.lock = threading.RLock()
+        self.tables = {}
+        self.positions = {}       # shard -> the last seq of its change log applied
+        self.refreshed_at = 0.0   # time.monotonic()
+        self.cache_version = None
+        self.loads = 0
+        self.changes = 0          # applied since the last load
+
+    def load(self):
+        """Read every table from every shard and archive, and the change log positions they are at."""
+        tables = {name: _Table(name) for name in TABLES}
+        positions = {}
+        version = cache.query_cache.version
+        for shard in shards.names(self.home):
+            path = shards.shard_path(shard, self.home)
+            with db.connection(path, readonly=True) as conn:
+                conn.execute("BEGIN")   # one read transaction: the rows as of exactly this seq
+                positions[shard] = changelog.last_seq(conn) or 0
+                for name in TABLES if shard == shards.HOME else FILE_TABLES:
+                    _read(tables[name], conn)
+                _read(tables["Food_Listings"], conn, "Food_Listings_Archive")
+            # after the hot file, so rows a compaction moves meanwhile are read twice rather than never
+            partitions.reload(path)
+            for archive in partitions.archive_paths(path):
+                with db.connection(archive, readonly=True) as conn:
+                    for name in FILE_TABLES:
+                        _read(tables[name], conn)
+                    _read(tables["Food_Listings"], conn, "Food_Listings_Archive")
+        for table in tables.values():
+            table.settle()
+        with self.lock:
+            self.tables, self.positions = tables, positions
+            self.refreshed_at, self.cache_version = time.monotonic(), version
+            self.loads += 1
+            self.changes = 0
+
+    def refresh(self, force=False):
+        """Apply the changes logged since the last refresh. Unless forced, only every REFRESH_TTL
+        seconds, or sooner after a write by this process. Returns the changes applied."""
+        with self.lock:
+            version = cache.query_cache.version
+            if not force and version == self.cache_version and time.monotonic() - self.refreshed_at < REFRESH_TTL:
+                return 0
+            try:
+                applied = sum(self._catch_up(shard) for shard in shards.names(self.home))
+            except _Reload:
+                self.load()
+                return 0
+            self.refreshed_at, self.cache_version = time.monotonic(), version
+            self.changes += applied
+            return applied
+
+    def _catch_up(self, shard):
+        path = shards.shard_path(shard, self.home)
+        after = self.positions.get(shard)
+        if after is None:   # a shard created since the load: its rows arrived in a move
+            raise _Reload
+        with db.connection(path, readonly=True) as conn:
+            first = conn.execute("SELECT MIN(Seq) FROM Change_Log").fetchone()[0]
+        if first is not None and first > after + 1:
+            raise _Reload
+        applied = 0
+        while True:
+            batch = changelog.read(path, after, changelog.BATCH_SIZE, shard=shard)
+            if not batch:
+                return applied
+            self._apply(batch)
+            after = self.positions[shard] = batch[-1].seq
+            applied += len(batch)
+
+    def _apply(self, batch):
+        latest = {}
+        for change in batch:
+            if change.op == "move":   # the other side is in another shard's log, maybe not read yet
+                raise _Reload
+            latest[change.table, change.row_id] = change   # each change carries the whole row
+        for name, table in self.tables.items():
+            changes = [change for (changed, _), change in latest.items() if changed == name]
+            table.delete([change.row_id for change in changes if change.op == "delete"])
+            # an archived row is still counted, from Food_Listings_Archive or a monthly archive
+            table.upsert([change.data for change in changes if change.op in ("insert", "update", "archive")])
+
+    def memory(self):
+        """[(table, rows, column, type, bytes)] of every column held."""
+        with self.lock:
+            return [(name, table.n - table.dead, col, kind, size)
+                    for name, table in self.tables.items() for col, kind, size in table.memory()]
+
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def get(home=None):
+    """The process's read model of `home`, loaded on first use."""
+    home = home or db.DB_NAME
+    with _models_lock:
+        model = _models.get(home)
+        if model is None:
+            model = _models[home] = ReadModel(home)
+            model.load()
+    return model
+
+
+@contextmanager
+def _reading():
+    model = get()
+    model.refresh()
+    with model.lock:
+        yield model.tables
+
+
+# -------------------------
+# Group-by helpers
+# -------------------------
+def _counts(codes, categories, weights=None):
+    return np.bincount(codes, weights, minlength=len(categories.values))
+
+
+def _ranked(categories, totals, key, value, limit=None, keep=None):
+    """{key, value} of the groups in `keep` (those with a total, by default), largest total first."""
+    groups = np.flatnonzero(totals > 0 if keep is None else keep)
+    groups = groups[np.argsort(-totals[groups], kind="stable")][:limit]
+    totals = totals[groups]
+    return {key: categories.array()[groups], value: totals if totals.dtype.kind == "f" else totals.astype(np.int64)}
+
+
+def _live(table):
+    """Mask of table's live rows, or None when that is all of them."""
+    return table.mask() if table.dead else None
+
+
+def _claims_in(tables, start=None, end=None, status=None):
+    """Mask of the live claims made in [start, end) with `status`, or None for all of them."""
+    claims = tables["Claims"]
+    start, end = timeutil.to_timestamp(start), timeutil.to_timestamp(end)
+    if not (start or end or status):
+        return _live(claims)
+    mask = claims.mask()
+    if start:
+        mask = mask & (claims.column("Timestamp") >= np.datetime64(start))
+    if end:
+        mask = mask & (claims.column("Timestamp") < np.datetime64(end))
+    if status is not None:
+        mask = mask & (claims.column("Status") == claims.categories["Status"].index.get(status, -1))
+    return mask
+
+
+def _inner(join, mask=None):
+    """(parent positions, child rows) of an inner join: the child rows in mask that found a parent."""
+    positions, found = join
+    rows = found if mask is None else found & mask
+    return positions[rows], rows
+
+
+def _result(columns):
+    return queries.from_columns(columns)
+
+
+# -------------------------
+# Listings
+# -------------------------
+def top_provider_types():
+    with _reading() as tables:
+        listings = tables["Food_Listings"]
+        categories = listings.categories["Provider_Type"]
+        codes = listings.live("Provider_Type")
+        quantity = _counts(codes, categories, np.nan_to_num(listings.live("Quantity"))).astype(np.int64)
+        return _result(_ranked(categories, quantity, "Provider_Type", "Total_Quantity",
+                               keep=_counts(codes, categories) > 0))
+
+def city_with_most_listings():
+    with _reading() as tables:
+        listings = tables["Food_Listings"]
+        categories = listings.categories["Location"]
+        return _result(_ranked(categories, _counts(listings.live("Location"), categories),
+                               "Location", "Total_Listings", 1))
+
+def common_food_types():
+    with _reading() as tables:
+        listings = tables["Food_Listings"]
+        categories = listings.categories["Food_Type"]
+        return _result(_ranked(categories, _counts(listings.live("Food_Type"), categories), "Food_Type", "Count_Type"))
+
+def total_donated_per_provider(limit=10):
+    with _reading() as tables:
+        listings, providers = tables["Food_Listings"], tables["Providers"]
+        at, rows = _inner(listings.join("Provider_ID", providers), _live(listings))
+        categories = providers.categories["Name"]
+        codes = providers.column("Name")[at]
+        quantity = _counts(codes, categories, np.nan_to_num(listings.column("Quantity")[rows])).astype(np.int64)
+        return _result(_ranked(categories, quantity, "Name", "Total_Donated", limit,
+                               keep=_counts(codes, categories) > 0))
+
+def top_donated_foods(limit=5):
+    with _reading() as tables:
+        listings = tables["Food_Listings"]
+        categories = listings.categories["Food_Name"]
+        return _result(_ranked(categories, _counts(listings.live("Food_Name"), categories),
+                               "Food_Name", "Donation_Count", limit))
+
+
+# -------------------------
+# Claims --
+# start (inclusive) and end (exclusive) as in queries.py
+# -------------------------
+def top_receivers(limit=10, start=None, end=None):
+    with _reading() as tables:
+        claims, receivers = tables["Claims"], tables["Receivers"]
+        at, _ = _inner(claims.join("Receiver_ID", receivers), _claims_in(tables, start, end))
+        categories = receivers.categories["Name"]
+        return _result(_ranked(categories, _counts(receivers.column("Name")[at], categories),
+                               "Name", "Total_Claims", limit))
+
+def claims_per_food(limit=10, start=None, end=None):
+    with _reading() as tables:
+        claims, listings = tables["Claims"], tables["Food_Listings"]
+        at, _ = _inner(claims.join("Food_ID", listings), _claims_in(tables, start, end))
+        categories = listings.categories["Food_Name"]
+        return _result(_ranked(categories, _counts(listings.column("Food_Name")[at], categories),
+                               "Food_Name", "Claim_Count", limit))
+
+def top_successful_provider(start=None, end=None):
+    with _reading() as tables:
+        claims, listings, providers = tables["Claims"], tables["Food_Listings"], tables["Providers"]
+        at, _ = _inner(claims.join("Food_ID", listings), _claims_in(tables, start, end, "Completed"))
+        positions, found = listings.join("Provider_ID", providers)
+        categories = providers.categories["Name"]
+        codes = providers.column("Name")[positions[at][found[at]]]
+        return _result(_ranked(categories, _counts(codes, categories), "Name", "Successful_Claims", 1))
+
+def claim_status_percentage(start=None, end=None):
+    with _reading() as tables:
+        claims = tables["Claims"]
+        categories = claims.categories["Status"]
+        counts = _counts(claims.live("Status", _claims_in(tables, start, end)), categories)
+        # ORDER BY Status, NULL first as in SQLite
+        groups = np.array(sorted(np.flatnonzero(counts), key=lambda code: (categories.values[code] is not None,
+                                                                           categories.values[code] or "")),
+                          dtype=np.int64)
+        return _result({"Status": categories.array()[groups],
+                        "Percentage": np.round(counts[groups] * 100.0 / max(counts.sum(), 1), 2)})
+
+def claim_counts_between(start, end):
+    with _reading() as tables:
+        claims = tables["Claims"]
+        categories = claims.categories["Status"]
+        return _result(_ranked(categories, _counts(claims.live("Status", _claims_in(tables, start, end)), categories),
+                               "Status", "Claim_Count"))
+
+def avg_quantity_per_receiver(limit=10, start=None, end=None):
+    with _reading() as tables:
+        claims, listings, receivers = tables["Claims"], tables["Food_Listings"], tables["Receivers"]
+        listing_at, has_listing = claims.join("Food_ID", listings)
+        receiver_at, rows = _inner(claims.join("Receiver_ID", receivers),
+                                   has_listing & _claims_in(tables, start, end, "Completed"))
+        categories = receivers.categories["Name"]
+        codes, quantity = receivers.column("Name")[receiver_at], listings.column("Quantity")[listing_at[rows]]
+        counted, total = _counts(codes, categories, ~np.isnan(quantity)), _counts(codes, categories, np.nan_to_num(quantity))
+        # AVG skips NULL quantities; a receiver with nothing but NULLs averages NULL, sorted last
+        with np.errstate(invalid="ignore", divide="ignore"):
+            average = np.round(np.where(counted > 0, total / counted, np.nan), 2)
+        groups = np.flatnonzero(_counts(codes, categories))
+        groups = groups[np.argsort(-average[groups], kind="stable")][:limit]
+        return _result({"Name": categories.array()[groups], "Avg_Quantity_Claimed": average[groups]})
+
+def most_claimed_meal_type(start=None, end=None):
+    with _reading() as tables:
+        claims, listings = tables["Claims"], tables["Food_Listings"]
+        at, _ = _inner(claims.join("Food_ID", listings), _claims_in(tables, start, end, "Completed"))
+        categories = listings.categories["Meal_Type"]
+        return _result(_ranked(categories, _counts(listings.column("Meal_Type")[at], categories),
+                               "Meal_Type", "Total_Claims"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load the columnar read model and report its memory use per column")
+    parser.add_argument("--db", default=db.DB_NAME, help="the home database")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    report = get(args.db).memory()
+    print(f"Loaded in {time.perf_counter() - start:.2f}s")
+    print(f"{'table':<16}{'rows':>12}  {'column':<16}{'type':<34}{'MB':>10}")
+    for table, rows, col, kind, size in report:
+        print(f"{table:<16}{rows:>12,}  {col:<16}{kind:<34}{size / 1e6:>10.2f}")
+    print(f"{'total':<80}{sum(size for *_, size in report) / 1e6:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
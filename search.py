@@ -0,0 +1,133 @@
+"""Full-text / prefix search over food, provider and receiver names (SQLite FTS5).
+
+Each index is an external-content FTS5 table: it stores only the inverted index and reads the
+text back from the base table, so the names are not duplicated. AFTER INSERT / UPDATE / DELETE
+triggers on the base table keep it current, which covers crud.py, the batch functions,
+ingest.py and the sweeper alike. The prefix='2 3 4 5 6' option adds prefix indexes, so
+"bre*" / "bread*" / "gonz*" read one doclist instead of merging every term that starts that way.
+
+Every word typed becomes a prefix term and all of them must match ("gonz coch" finds
+"Gonzales-Cochran"); commas or slashes separate alternatives ("bread, soup"). A popular word can match a large share of the table, and bm25 ranking is
+computed per match, so only the newest RANK_CANDIDATES matches are ranked; ties go to the
+newest row.
+
+    python search.py --check      # FTS5 integrity-check of every index against its table
+    python search.py --rebuild    # rebuild every index from its table
+"""
+import argparse
+import re
+import sqlite3
+
+import db
+
+INDEXES = [
+    {"name": "Search_Food", "source": "Food_Listings", "key": "Food_ID", "columns": ["Food_Name"]},
+    {"name": "Search_Providers", "source": "Providers", "key": "Provider_ID", "columns": ["Name"]},
+    {"name": "Search_Receivers", "source": "Receivers", "key": "Receiver_ID", "columns": ["Name"]},
+]
+BY_SOURCE = {index["source"]: index for index in INDEXES}
+
+TOKENIZE = "unicode61 remove_diacritics 2"
+PREFIXES = "2 3 4 5 6"
+RANK_CANDIDATES = 1000   # newest matches ranked per search
+
+_WORD = re.compile(r"\w+")
+
+
+def match_expression(text):
+    """The FTS5 MATCH expression for what the user typed, or None if it has no words.
+    "gonz coch" -> every word must match; "bread, soup" or "bread/soup" -> either may."""
+    groups = []
+    for alternative in re.split(r"[,/|]", text or ""):
+        # quoting each word keeps FTS5 operators (AND, NEAR, ^, ...) in the input from being parsed
+        words = " ".join(f'"{word}"*' for word in _WORD.findall(alternative))
+        if words:
+            groups.append(f"({words})")
+    return " OR ".join(groups) or None
+
+
+def search_sql(source, columns, with_rank=False):
+    """SELECT `columns` of the `source` rows matching ?, best first, at most ? of them, plus the
+    row's Rank (lower is better) if with_rank. Params: (match expression, RANK_CANDIDATES, limit)."""
+    index = BY_SOURCE[source]
+    return f"""
+        SELECT {', '.join(f't.{col}' for col in columns)}{', s.rank AS Rank' if with_rank else ''}
+        FROM (SELECT rowid, rank FROM (SELECT rowid, rank FROM {index['name']} WHERE {index['name']} MATCH ?
+                                       ORDER BY rowid DESC LIMIT ?)
+              ORDER BY rank, rowid DESC LIMIT ?) s
+        JOIN {source} t ON t.{index['key']} = s.rowid
+        ORDER BY s.rank, s.rowid DESC
+    """
+
+
+# -------------------------
+# Index maintenance
+# -------------------------
+def install_sql(index):
+    """DDL for one index: the FTS5 table and the three triggers that keep it in sync."""
+    name, source, key = index["name"], index["source"], index["key"]
+    cols = ", ".join(index["columns"])
+    new_values = ", ".join(f"NEW.{col}" for col in index["columns"])
+    old_values = ", ".join(f"OLD.{col}" for col in index["columns"])
+    add_new = f"INSERT INTO {name} (rowid, {cols}) VALUES (NEW.{key}, {new_values});"
+    remove_old = f"INSERT INTO {name} ({name}, rowid, {cols}) VALUES ('delete', OLD.{key}, {old_values});"
+    return [
+        *(f"DROP TRIGGER IF EXISTS trg_{name.lower()}_{suffix}" for suffix in ("ins", "del", "upd")),
+        f"DROP TABLE IF EXISTS {name}",
+        f"CREATE VIRTUAL TABLE {name} USING fts5({cols}, content='{source}', content_rowid='{key}', "
+        f"tokenize='{TOKENIZE}', prefix='{PREFIXES}')",
+        f"CREATE TRIGGER trg_{name.lower()}_ins AFTER INSERT ON {source} BEGIN {add_new} END",
+        f"CREATE TRIGGER trg_{name.lower()}_del AFTER DELETE ON {source} BEGIN {remove_old} END",
+        f"CREATE TRIGGER trg_{name.lower()}_upd AFTER UPDATE OF {key}, {cols} ON {source} BEGIN "
+        f"{remove_old} {add_new} END",
+    ]
+
+
+def install(conn):
+    """(Re)create every index and its triggers and fill them. Runs inside the caller's transaction."""
+    for index in INDEXES:
+        for statement in install_sql(index):
+            conn.execute(statement)
+    rebuild(conn)
+
+
+def rebuild(conn):
+    for index in INDEXES:
+        conn.execute(f"INSERT INTO {index['name']} ({index['name']}) VALUES ('rebuild')")
+
+
+def check(conn):
+    """{index name: error} for every index that doesn't match its table (empty if all good)."""
+    problems = {}
+    for index in INDEXES:
+        try:
+            conn.execute(f"INSERT INTO {index['name']} ({index['name']}, rank) VALUES ('integrity-check', 1)")
+        except sqlite3.DatabaseError as e:
+            problems[index["name"]] = str(e)
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check or rebuild the full-text search indexes")
+    parser.add_argument("--db", default=db.DB_NAME)
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument("--check", action="store_true")
+    action.add_argument("--rebuild", action="store_true")
+    args = parser.parse_args()
+
+    with db.transaction(args.db) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        if args.rebuild:
+            rebuild(conn)
+            print(f"✅ rebuilt {len(INDEXES)} search indexes")
+            return
+        problems = check(conn)
+    for name, error in problems.items():
+        print(f"❌ {name}: {error}")
+    if not problems:
+        print(f"✅ all {len(INDEXES)} search indexes match their tables")
+    raise SystemExit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
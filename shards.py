@@ -0,0 +1,407 @@
+"""Optional sharding of food listings and claims into per-region database files, by city.
+
+Without a shard map everything lives in food_wastage.db, as before. Once cities are assigned to
+shards (Shard_Map in the home database, filled by the commands below), each shard is a database
+file of its own next to it (food_wastage.<shard>.db), with the full schema and its own writer,
+so claims and listings in one region never wait on another region's write lock.
+
+What moves to a shard is a city's Food_Listings rows (by Location), their Claims and their
+archived listings, together with everything the triggers derive from them (summaries, holds,
+search index, row versions). Providers, Receivers and the gazetteer stay in the home database:
+they are small and change rarely, and every read-only connection to a shard attaches the home
+database and shadows those tables with TEMP views over it, so a query joining Claims to
+Receivers runs unchanged on any shard. Cities with no entry in the map stay in the home database,
+which is a shard like the others.
+
+crud.py routes every write to the shard of the row's city (claims: the shard of their listing)
+and finds rows by id by asking each shard. queries.py runs a query filtered to one city on that
+city's shard only, and fans global ones out to every shard in parallel, combining the partial
+results with a Merge (an SQL statement over the concatenated rows in an in-memory table "part").
+
+    python shards.py --status
+    python shards.py --move "City 00003" "City 00017" --to north   # assign cities to a shard, moving their rows
+    python shards.py --split home --to north                      # move about half of a busy shard's listings
+    python shards.py --check                                      # rows left in a shard their city isn't mapped to
+
+A move holds the source shard's write lock for its whole duration, copies the rows to the
+destination (replaying their claims there, so the holds and summaries are rebuilt by the
+triggers), records the new assignment and deletes the rows from the source. Other processes pick
+up a new assignment within MAP_TTL seconds; a write they route to the old shard in between is left
+there and reported by --check, and moving the city again sweeps it up.
+"""
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import cache
+import db
+
+HOME = "home"
+# tables that exist only in the home database; shard connections read them through TEMP views
+GLOBAL_TABLES = ["Providers", "Receivers", "Gazetteer", "Gazetteer_Index",
+                 "Summary_Providers_City", "Summary_Receivers_City"]
+MAP_TTL = 1.0          # seconds a process keeps using the shard map it last read
+FAN_OUT_WORKERS = 8
+MOVE_BATCH = 10_000    # rows per executemany when moving a city
+SPLIT_FRACTION = 0.5   # share of the listings --split moves
+
+
+def shard_path(name, home=None):
+    """The database file of shard `name`: the home database itself, or <home>.<name>.db next to it."""
+    home = os.path.abspath(home or db.DB_NAME)
+    if name == HOME:
+        return home
+    root, ext = os.path.splitext(home)
+    return f"{root}.{name}{ext or '.db'}"
+
+
+# -------------------------
+# Shard map --
+# {city: shard name}, read from the home database at most every MAP_TTL seconds
+# -------------------------
+_maps = {}
+_maps_lock = threading.Lock()
+
+
+def shard_map(home=None):
+    home = os.path.abspath(home or db.DB_NAME)
+    entry = _maps.get(home)
+    if entry is not None and time.monotonic() - entry[0] < MAP_TTL:
+        return entry[1]
+    with _maps_lock:
+        try:
+            with db.connection(home, readonly=True) as conn:
+                mapping = dict(conn.execute("SELECT City, Shard FROM Shard_Map"))
+        except sqlite3.OperationalError:   # not migrated yet: no shards
+            mapping = {}
+        for name in set(mapping.values()) - {HOME}:
+            attach_home(shard_path(name, home), home)
+        _maps[home] = (time.monotonic(), mapping)
+    return mapping
+
+
+def reload(home=None):
+    """Forget the cached map, so the next call reads it again."""
+    _maps.pop(os.path.abspath(home or db.DB_NAME), None)
+
+
+def active(home=None):
+    return bool(shard_map(home))
+
+
+def names(home=None):
+    """Every shard name, home first."""
+    return [HOME] + sorted(set(shard_map(home).values()) - {HOME})
+
+
+def paths(home=None):
+    """Every shard's database file, home first."""
+    return [shard_path(name, home) for name in names(home)]
+
+
+def path_for_city(city, home=None):
+    return shard_path(shard_map(home).get(city, HOME), home)
+
+
+def locate(table, key, row_id, home=None):
+    """The file holding `table` row `row_id` (by its primary key column `key`); home if no shard has it.
+    Raises ValueError if more than one shard has it, rather than act on either row."""
+    targets = paths(home)
+    if len(targets) == 1:
+        return targets[0]
+    found = []
+    for path in targets:
+        with db.connection(path, readonly=True) as conn:
+            if conn.execute(f"SELECT 1 FROM {table} WHERE {key} = ?", (row_id,)).fetchone():
+                found.append(path)
+    if len(found) > 1:
+        raise ValueError(f"{table} {key} {row_id} is in {len(found)} shards: {', '.join(found)}")
+    return found[0] if found else targets[0]
+
+
+_attached = set()
+
+
+def attach_home(path, home=None):
+    """Make read-only connections to `path` -- a shard, or an archive of one (see partitions.py) --
+    read the global tables from the home database."""
+    home = os.path.abspath(home or db.DB_NAME)
+    path = os.path.abspath(path)
+    if path in _attached or path == home:
+        return
+
+    def hook(conn, readonly):
+        # only readers need it: writes to a shard touch its own tables, and migrations must not
+        # see the views
+        if readonly:
+            conn.execute("ATTACH DATABASE ? AS home", (f"file:{home}?mode=ro",))
+            for table in GLOBAL_TABLES:
+                conn.execute(f"CREATE TEMP VIEW IF NOT EXISTS {table} AS SELECT * FROM home.{table}")
+
+    db.on_connect(path, hook)
+    _attached.add(path)
+
+
+# -------------------------
+# Fan-out reads --
+# combine is a query over the concatenated shard results in table "part"; partial, if given,
+# replaces the query on the shards (run with `params`, or the query's own); unlimited replaces the
+# query's trailing LIMIT ? parameter by -1 on the shards, for merges that need every group
+# -------------------------
+Merge = namedtuple("Merge", "combine partial params unlimited", defaults=(None, None, False))
+
+
+def concat(order_by, limit):
+    """Rows from every shard, re-sorted; each shard's own LIMIT already holds its share of the top rows."""
+    return Merge(f"SELECT * FROM part ORDER BY {order_by} LIMIT {int(limit)}")
+
+
+def regroup(keys, sums, order_by=None, limit=None):
+    """Groups that may span shards, with their measures added up across shards."""
+    columns = list(keys) + [f"SUM({col}) AS {col}" for col in sums]
+    query = f"SELECT {', '.join(columns)} FROM part"
+    if keys:
+        query += f" GROUP BY {', '.join(keys)}"
+    if order_by:
+        query += f" ORDER BY {order_by}"
+    if limit is not None:
+        query += f" LIMIT {int(limit)}"
+    return Merge(query, unlimited=limit is not None)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def fan_out(fn, targets):
+    """[fn(path) for path in targets], run in parallel; raises the first error."""
+    global _executor
+    if len(targets) == 1:
+        return [fn(targets[0])]
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=FAN_OUT_WORKERS, thread_name_prefix="shards")
+    return [future.result() for future in [_executor.submit(fn, path) for path in targets]]
+
+
+def gather(query, params, merge, targets):
+    """Run the shard side of `merge` on every file in `targets` (shards, or their archives) and return
+    an in-memory connection whose table "part" holds all their rows; the caller runs merge.combine on it."""
+    shard_query = merge.partial or query
+    shard_params = tuple(merge.params if merge.params is not None else params)
+    if merge.unlimited:
+        shard_params = shard_params[:-1] + (-1,)
+
+    def read(path):
+        with db.connection(path, readonly=True) as conn:
+            cursor = conn.execute(shard_query, shard_params)
+            return [col[0] for col in cursor.description], cursor.fetchall()
+
+    parts = fan_out(read, targets)
+    columns = parts[0][0]
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    conn.execute(f"CREATE TABLE part ({', '.join(_quote(col) for col in columns)})")
+    insert = f"INSERT INTO part VALUES ({', '.join('?' for _ in columns)})"
+    for _, rows in parts:
+        conn.executemany(insert, rows)
+    return conn
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+# -------------------------
+# Rebalancing
+# -------------------------
+def _connect(path):
+    conn = sqlite3.connect(path, isolation_level=None, timeout=db.PRAGMAS["busy_timeout"] / 1000)
+    conn.execute("PRAGMA journal_mode = WAL")
+    return conn
+
+
+def _copy(source, dest, select, params, table):
+    """INSERT the rows of `select` on source into dest.table, MOVE_BATCH at a time. Returns the count."""
+    cursor = source.execute(select, params)
+    insert = (f"INSERT INTO {table} ({', '.join(col[0] for col in cursor.description)}) "
+              f"VALUES ({', '.join('?' for _ in cursor.description)})")
+    copied = 0
+    while True:
+        rows = cursor.fetchmany(MOVE_BATCH)
+        if not rows:
+            return copied
+        dest.executemany(insert, rows)
+        copied += len(rows)
+
+
+def move_cities(cities, to, home=None):
+    """Assign `cities` to shard `to` (created if needed) and move their rows there.
+    Returns {"listings": n, "claims": n, "archived": n} moved."""
+    import changelog
+    import crud
+    import migrate
+
+    home = os.path.abspath(home or db.DB_NAME)
+    if not to.isidentifier():
+        raise ValueError(f"shard names are letters, digits and underscores, not {to!r}")
+    migrate.upgrade(home)   # Shard_Map
+    reload(home)
+    dest_path = shard_path(to, home)
+    migrate.upgrade(dest_path)
+    by_source = {}
+    for city in cities:
+        by_source.setdefault(path_for_city(city, home), []).append(city)
+    # also sweep up rows a stale router left in shards these cities aren't mapped to
+    for path in paths(home):
+        by_source.setdefault(path, [])
+    moved = {"listings": 0, "claims": 0, "archived": 0}
+    for source_path in by_source:
+        if source_path == dest_path:
+            continue
+        source, dest = _connect(source_path), _connect(dest_path)
+        try:
+            source.execute("BEGIN IMMEDIATE")
+            where = f"Location IN ({', '.join('?' for _ in cities)})"
+            if not source.execute(f"SELECT 1 FROM Food_Listings WHERE {where} UNION ALL "
+                                  f"SELECT 1 FROM Food_Listings_Archive WHERE {where} LIMIT 1",
+                                  tuple(cities) * 2).fetchone():
+                source.execute("ROLLBACK")
+                continue
+            dest.execute("BEGIN IMMEDIATE")
+            # the copies and deletes reach the change log as "move"s, not as new and deleted rows
+            logged = changelog.last_seq(source), changelog.last_seq(dest)
+            # base columns only: replaying the claims lets the destination's triggers rebuild the holds
+            moved["listings"] += _copy(source, dest, f"SELECT {crud.FOOD_COLUMNS} FROM Food_Listings WHERE {where}",
+                                       cities, "Food_Listings")
+            moved["claims"] += _copy(source, dest, f"""SELECT {crud.CLAIM_COLUMNS} FROM Claims WHERE Food_ID IN
+                                                       (SELECT Food_ID FROM Food_Listings WHERE {where})
+                                                       ORDER BY Claim_ID""", cities, "Claims")
+            moved["archived"] += _copy(source, dest, f"SELECT * FROM Food_Listings_Archive WHERE {where}",
+                                       cities, "Food_Listings_Archive")
+            changelog.relabel(dest, logged[1], "move")
+            dest.execute("COMMIT")
+            # the assignment goes in with the delete when the source is the home database
+            # (one transaction); otherwise just before it
+            if source_path == home:
+                _assign(source, cities, to)
+            else:
+                with db.transaction(home) as conn:
+                    _assign(conn, cities, to)
+            source.execute(f"DELETE FROM Claims WHERE Food_ID IN (SELECT Food_ID FROM Food_Listings WHERE {where})",
+                           cities)
+            source.execute(f"DELETE FROM Food_Listings WHERE {where}", cities)
+            source.execute(f"DELETE FROM Food_Listings_Archive WHERE {where}", cities)
+            changelog.relabel(source, logged[0], "move")
+            source.execute("COMMIT")
+        except BaseException:
+            for conn in (source, dest):
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+            raise
+        finally:
+            source.close()
+            dest.close()
+    with db.transaction(home) as conn:
+        _assign(conn, cities, to)
+    # a new shard was analyzed while empty; those statistics would steer the planner wrong now
+    with db.connection(dest_path) as conn:
+        conn.execute("ANALYZE")
+    reload(home)
+    cache.clear()
+    return moved
+
+
+def _assign(conn, cities, to):
+    if to == HOME:
+        conn.executemany("DELETE FROM Shard_Map WHERE City = ?", [(city,) for city in cities])
+    else:
+        conn.executemany("""INSERT INTO Shard_Map (City, Shard) VALUES (?, ?)
+                            ON CONFLICT(City) DO UPDATE SET Shard = excluded.Shard""",
+                         [(city, to) for city in cities])
+
+
+def split(shard, to, fraction=SPLIT_FRACTION, home=None):
+    """Move the busiest cities of `shard`, about `fraction` of its listings, to shard `to`.
+    Returns (cities moved, move_cities() counts)."""
+    with db.connection(shard_path(shard, home), readonly=True) as conn:
+        counts = conn.execute("""SELECT Location, Listing_Count FROM Summary_Locations
+                                 WHERE Listing_Count > 0 AND Location IS NOT NULL
+                                 ORDER BY Listing_Count DESC""").fetchall()
+    if len(counts) < 2:
+        raise ValueError(f"shard {shard!r} has {len(counts)} city with listings; nothing to split")
+    target = sum(n for _, n in counts) * fraction
+    cities, taken = [], 0
+    # largest first, skipping any city that would overshoot once something is taken
+    for city, n in counts:
+        if len(cities) == len(counts) - 1:
+            break
+        if not cities or taken + n <= target:
+            cities.append(city)
+            taken += n
+    return cities, move_cities(cities, to, home)
+
+
+def status(home=None):
+    """[(shard, path, cities, listings, claims, MB)] for every shard."""
+    report = []
+    for name, path in zip(names(home), paths(home)):
+        with db.connection(path, readonly=True) as conn:
+            cities, listings = conn.execute("""SELECT COUNT(*), IFNULL(SUM(Listing_Count), 0)
+                                               FROM Summary_Locations WHERE Listing_Count > 0""").fetchone()
+            claims = conn.execute("SELECT IFNULL(SUM(Claim_Count), 0) FROM Summary_Claim_Status").fetchone()[0]
+        size = sum(os.path.getsize(f) for f in (path, path + "-wal") if os.path.exists(f))
+        report.append((name, path, cities, listings, claims, size / 1e6))
+    return report
+
+
+def check(home=None):
+    """[(shard, city, listings)] for listings sitting in a shard their city isn't mapped to."""
+    problems = []
+    for name, path in zip(names(home), paths(home)):
+        with db.connection(path, readonly=True) as conn:
+            for city, n in conn.execute("SELECT Location, Listing_Count FROM Summary_Locations WHERE Listing_Count > 0"):
+                if shard_map(home).get(city, HOME) != name:
+                    problems.append((name, city, n))
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Assign cities to database shards and rebalance them")
+    parser.add_argument("--db", default=db.DB_NAME, help="the home database")
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument("--status", action="store_true")
+    action.add_argument("--check", action="store_true")
+    action.add_argument("--move", nargs="+", metavar="CITY", help="cities to assign to --to")
+    action.add_argument("--split", metavar="SHARD", help="move the busiest cities of SHARD to --to")
+    parser.add_argument("--to", help="destination shard (created if it doesn't exist; 'home' for the home database)")
+    parser.add_argument("--fraction", type=float, default=SPLIT_FRACTION, help="share of listings --split moves")
+    args = parser.parse_args()
+    if (args.move or args.split) and not args.to:
+        parser.error("--move and --split need --to")
+
+    if args.move or args.split:
+        start = time.perf_counter()
+        if args.split:
+            cities, moved = split(args.split, args.to, args.fraction, args.db)
+        else:
+            cities, moved = args.move, move_cities(args.move, args.to, args.db)
+        print(f"✅ {len(cities)} cities -> {args.to}: {moved['listings']:,} listings, {moved['claims']:,} claims, "
+              f"{moved['archived']:,} archived listings moved in {time.perf_counter() - start:.1f}s")
+    if args.check:
+        problems = check(args.db)
+        for name, city, n in problems:
+            print(f"❌ {n:,} listings of {city!r} in shard {name!r}, mapped to {shard_map(args.db).get(city, HOME)!r}")
+        print("✅ every listing is in its city's shard" if not problems else
+              f"move the cities again (--move ... --to ...) to sweep them up")
+        raise SystemExit(1 if problems else 0)
+    print(f"{'shard':<12}{'cities':>8}{'listings':>12}{'claims':>12}{'MB':>9}  file")
+    for name, path, cities, listings, claims, mb in status(args.db):
+        print(f"{name:<12}{cities:>8,}{listings:>12,}{claims:>12,}{mb:>9.1f}  {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""Pre-aggregated summary tables behind the Analysis page.
+
+Every summary is a small GROUP BY of one base table, kept current by AFTER INSERT / UPDATE /
+DELETE triggers, so the analytics in queries.py read O(groups) rows instead of re-aggregating
+the base tables on every rerun. Because the triggers live in the database, writes from crud.py,
+the batch functions and ingest.py are all covered.
+
+The listing summaries also count Food_Listings_Archive, so the listings availability.py sweeps
+out of the hot table still count as donated: the move is a delete on one table and an insert on
+the other, and the summary comes out unchanged.
+
+    python summary.py --check      # compare every summary with a fresh GROUP BY
+    python summary.py --rebuild    # recompute every summary from scratch
+"""
+import argparse
+import re
+
+import db
+
+# -------------------------
+# Summary definitions --
+# keys / measures are SQL expressions over one base-table row, written against "{row}"
+# (NEW / OLD inside the triggers, the base table itself when rebuilding). A measure is the
+# row's contribution to its group, so counts are 1 and conditional counts are 0/1. "also" lists
+# tables with the same columns whose rows count too.
+# -------------------------
+LISTING_TABLES = ["Food_Listings_Archive"]   # swept listings (see availability.py)
+
+SUMMARIES = [
+    {
+        "name": "Summary_Providers_City",
+        "source": "Providers",
+        "keys": [("City", "{row}.City")],
+        "measures": [("Provider_Count", "1")],
+    },
+    {
+        "name": "Summary_Receivers_City",
+        "source": "Receivers",
+        "keys": [("City", "{row}.City")],
+        "measures": [("Receiver_Count", "1")],
+    },
+    {
+        "name": "Summary_Provider_Types",
+        "source": "Food_Listings",
+        "also": LISTING_TABLES,
+        "keys": [("Provider_Type", "{row}.Provider_Type")],
+        "measures": [("Listing_Count", "1"), ("Total_Quantity", "IFNULL({row}.Quantity, 0)")],
+    },
+    {
+        "name": "Summary_Provider_Donations",
+        "source": "Food_Listings",
+        "also": LISTING_TABLES,
+        "keys": [("Provider_ID", "{row}.Provider_ID")],
+        "measures": [("Listing_Count", "1"), ("Total_Quantity", "IFNULL({row}.Quantity, 0)")],
+    },
+    {
+        "name": "Summary_Locations",
+        "source": "Food_Listings",
+        "also": LISTING_TABLES,
+        "keys": [("Location", "{row}.Location")],
+        "measures": [("Listing_Count", "1")],
+    },
+    {
+        "name": "Summary_Food_Types",
+        "source": "Food_Listings",
+        "also": LISTING_TABLES,
+        "keys": [("Food_Type", "{row}.Food_Type")],
+        "measures": [("Listing_Count", "1")],
+    },
+    {
+        "name": "Summary_Food_Names",
+        "source": "Food_Listings",
+        "also": LISTING_TABLES,
+        "keys": [("Food_Name", "{row}.Food_Name")],
+        "measures": [("Listing_Count", "1")],
+    },
+    {
+        "name": "Summary_Claim_Status",
+        "source": "Claims",
+        "keys": [("Status", "{row}.Status")],
+        "measures": [("Claim_Count", "1")],
+    },
+    {
+        "name": "Summary_Food_Claims",
+        "source": "Claims",
+        "keys": [("Food_ID", "{row}.Food_ID")],
+        "measures": [("Claim_Count", "1"), ("Completed_Count", "({row}.Status IS 'Completed')")],
+    },
+    {
+        "name": "Summary_Receiver_Claims",
+        "source": "Claims",
+        "keys": [("Receiver_ID", "{row}.Receiver_ID")],
+        "measures": [("Claim_Count", "1"), ("Completed_Count", "({row}.Status IS 'Completed')")],
+    },
+    {
+        "name": "Summary_Claims_Month",
+        "source": "Claims",
+        # the same expression as the generated Claims.Claim_Month (migration 5)
+        "keys": [("Month", "substr({row}.Timestamp, 1, 7)")],
+        "measures": [("Claim_Count", "1"), ("Completed_Count", "({row}.Status IS 'Completed')")],
+    },
+]
+
+
+def _sql(expr, row):
+    return expr.replace("{row}", row)
+
+
+def _key_match(summary, row):
+    # IS rather than = so that a NULL City etc. gets a group of its own, like GROUP BY does
+    return " AND ".join(f"{col} IS {_sql(expr, row)}" for col, expr in summary["keys"])
+
+
+def _apply(summary, row, sign):
+    """Statements that add (sign '+') or remove (sign '-') one base row's contribution."""
+    name = summary["name"]
+    sets = ", ".join(f"{col} = {col} {sign} {_sql(expr, row)}" for col, expr in summary["measures"])
+    statements = [f"UPDATE {name} SET {sets} WHERE {_key_match(summary, row)};"]
+    if sign == "+":
+        cols = [col for col, _ in summary["keys"] + summary["measures"]]
+        values = [_sql(expr, row) for _, expr in summary["keys"] + summary["measures"]]
+        statements.append(
+            f"INSERT INTO {name} ({', '.join(cols)}) SELECT {', '.join(values)} "
+            f"WHERE NOT EXISTS (SELECT 1 FROM {name} WHERE {_key_match(summary, row)});"
+        )
+    return statements
+
+
+def _columns_used(summary):
+    text = " ".join(expr for _, expr in summary["keys"] + summary["measures"])
+    return sorted(set(re.findall(r"\{row\}\.(\w+)", text)))
+
+
+def sources(summary, conn=None):
+    """The tables whose rows the summary counts: its source, then those of "also" that exist in conn."""
+    also = summary.get("also", [])
+    if conn is not None and also:
+        existing = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        also = [table for table in also if table in existing]
+    return [summary["source"]] + also
+
+
+def _triggers(summary, table):
+    """Trigger names (ins, del, upd) of the summary on `table`."""
+    prefix = f"trg_{summary['name'].lower()}" + ("" if table == summary["source"] else f"_{table.lower()}")
+    return [f"{prefix}_{suffix}" for suffix in ("ins", "del", "upd")]
+
+
+def install_sql(summary, tables=None):
+    """DDL for one summary: the table, a unique index on its keys and three triggers on each of
+    `tables` (its sources by default)."""
+    name = summary["name"]
+    key_cols = ", ".join(col for col, _ in summary["keys"])
+    table_cols = [col for col, _ in summary["keys"]] + [f"{col} INTEGER NOT NULL DEFAULT 0"
+                                                       for col, _ in summary["measures"]]
+    add_new = "\n    ".join(_apply(summary, "NEW", "+"))
+    remove_old = "\n    ".join(_apply(summary, "OLD", "-"))
+    watched = ", ".join(_columns_used(summary))
+    statements = [f"DROP TRIGGER IF EXISTS {trigger}" for table in sources(summary) for trigger in _triggers(summary, table)]
+    statements += [
+        f"DROP TABLE IF EXISTS {name}",
+        f"CREATE TABLE {name} ({', '.join(table_cols)})",
+        f"CREATE UNIQUE INDEX idx_{name.lower()} ON {name} ({key_cols})",
+    ]
+    for table in tables or sources(summary):
+        ins, delete, upd = _triggers(summary, table)
+        statements += [
+            f"CREATE TRIGGER {ins} AFTER INSERT ON {table} BEGIN\n    {add_new}\nEND",
+            f"CREATE TRIGGER {delete} AFTER DELETE ON {table} BEGIN\n    {remove_old}\nEND",
+            f"CREATE TRIGGER {upd} AFTER UPDATE OF {watched} ON {table} BEGIN\n"
+            f"    {remove_old}\n    {add_new}\nEND",
+        ]
+    return statements
+
+
+def aggregate_sql(summary, tables=None):
+    """The GROUP BY over the base tables (its sources by default) that the summary is supposed to equal."""
+    columns = ", ".join(_columns_used(summary))
+    rows = " UNION ALL ".join(f"SELECT {columns} FROM {table}" for table in tables or sources(summary))
+    keys = [_sql(expr, "t") for _, expr in summary["keys"]]
+    measures = [f"SUM({_sql(expr, 't')})" for _, expr in summary["measures"]]
+    return f"SELECT {', '.join(keys + measures)} FROM ({rows}) t GROUP BY {', '.join(keys)}"
+
+
+def install(conn):
+    """(Re)create every summary table and trigger and fill them. Runs inside the caller's transaction."""
+    for summary in SUMMARIES:
+        for statement in install_sql(summary, sources(summary, conn)):
+            conn.execute(statement)
+    rebuild(conn)
+
+
+def rebuild(conn):
+    for summary in SUMMARIES:
+        cols = [col for col, _ in summary["keys"] + summary["measures"]]
+        conn.execute(f"DELETE FROM {summary['name']}")
+        conn.execute(f"INSERT INTO {summary['name']} ({', '.join(cols)}) {aggregate_sql(summary, sources(summary, conn))}")
+
+
+def check(conn):
+    """Compare every summary with a fresh aggregate. Returns {summary name: [(key, expected, actual)]}."""
+    problems = {}
+    for summary in SUMMARIES:
+        n_keys = len(summary["keys"])
+        cols = [col for col, _ in summary["keys"] + summary["measures"]]
+        expected = {row[:n_keys]: row[n_keys:] for row in conn.execute(aggregate_sql(summary, sources(summary, conn)))}
+        actual = {
+            row[:n_keys]: row[n_keys:]
+            for row in conn.execute(f"SELECT {', '.join(cols)} FROM {summary['name']}")
+            if any(row[n_keys:])   # groups that dropped to zero are left in place by the triggers
+        }
+        diffs = [(key, expected.get(key), actual.get(key))
+                 for key in set(expected) | set(actual) if expected.get(key) != actual.get(key)]
+        if diffs:
+            problems[summary["name"]] = diffs
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check or rebuild the analytics summary tables")
+    parser.add_argument("--db", default=db.DB_NAME)
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument("--check", action="store_true")
+    action.add_argument("--rebuild", action="store_true")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        with db.transaction(args.db) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rebuild(conn)
+        print(f"✅ rebuilt {len(SUMMARIES)} summary tables")
+        return
+
+    with db.connection(args.db, readonly=True) as conn:
+        conn.execute("BEGIN")   # one snapshot for the whole comparison
+        problems = check(conn)
+        conn.rollback()
+    for name, diffs in problems.items():
+        print(f"❌ {name}: {len(diffs)} group(s) out of date, e.g. {sorted(diffs, key=str)[:3]}")
+    if not problems:
+        print(f"✅ all {len(SUMMARIES)} summary tables match the base tables")
+    raise SystemExit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
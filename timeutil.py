@@ -0,0 +1,53 @@
+"""Canonical timestamp handling.
+
+Every date/time the database stores (Claims.Timestamp, Food_Listings.Expiry_Date) is text in
+the form 'YYYY-MM-DD HH:MM:SS'. That is what pandas wrote into the original database, it sorts
+lexicographically in time order, so plain indexes serve range queries, and substr(ts, 1, 7) is
+its month.
+"""
+from datetime import date, datetime
+
+FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# partner feeds and the bundled CSVs use US month-first dates
+INPUT_FORMATS = ["%m/%d/%Y %H:%M", "%m/%d/%Y %H:%M:%S", "%m/%d/%Y", "%m/%d/%y %H:%M", "%m/%d/%y"]
+
+# GLOB pattern that matches values already in canonical form
+CANONICAL_GLOB = "[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9] [0-9][0-9]:[0-9][0-9]:[0-9][0-9]"
+
+
+def to_timestamp(value):
+    """datetime / date / string -> 'YYYY-MM-DD HH:MM:SS'. None and '' stay None; anything unparseable raises ValueError."""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone().replace(tzinfo=None)
+        return value.strftime(FORMAT)
+    if isinstance(value, date):
+        return value.strftime("%Y-%m-%d 00:00:00")
+    text = str(value).strip()
+    if not text:
+        return None
+    try:
+        return to_timestamp(datetime.fromisoformat(text))
+    except ValueError:
+        pass
+    for fmt in INPUT_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).strftime(FORMAT)
+        except ValueError:
+            continue
+    raise ValueError(f"unrecognised timestamp {value!r}")
+
+
+def to_timestamp_or_same(value):
+    """to_timestamp for bulk conversions: values that can't be parsed are returned unchanged."""
+    try:
+        return to_timestamp(value)
+    except ValueError:
+        return value
+
+
+def now():
+    return datetime.now().strftime(FORMAT)
@@ -0,0 +1,192 @@
+"""A single writer thread per database that commits queued writes in groups.
+
+SQLite allows one writer at a time. When many threads each commit their own small write they
+queue up on the file lock, and every commit pays for its own WAL append. Here callers submit
+units of work, each a list of (query, params), and get a Future back. One thread per database
+collects units for up to MAX_DELAY seconds after the first one arrives (or until it has
+MAX_BATCH of them) and runs the lot in a single BEGIN IMMEDIATE transaction:
+
+- each unit runs inside its own SAVEPOINT, so a unit that fails (e.g. a duplicate primary key)
+  is rolled back and fails only its own Future;
+- the writer's connection uses synchronous=FULL and Futures resolve only after the COMMIT, so an
+  acknowledged write survives a power cut -- the fsync is paid once per group, not per write;
+- the result cache is invalidated for every table the group wrote, after the commit.
+
+The queue holds at most MAX_QUEUE units. When it is full, submit() blocks for up to
+SUBMIT_TIMEOUT seconds and then raises TimeoutError, so a burst slows its producers down
+instead of growing the queue without bound.
+
+Units are applied in submission order by the one thread, so writes to the same row (e.g. a claim
+and then its status change) land in the order they were submitted. crud.capture_writes() turns
+calls to the crud write functions into units; crud.submit_claim / submit_claim_update and
+async_api.py are built on it.
+"""
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+import cache
+import db
+
+MAX_BATCH = 256        # units per transaction
+MAX_DELAY = 0.002      # seconds to keep collecting after the first unit of a group
+MAX_QUEUE = 4096       # queued units before submit() blocks
+SUBMIT_TIMEOUT = 5.0   # seconds submit() blocks on a full queue before raising TimeoutError
+SYNCHRONOUS = "FULL"   # the writer connection's synchronous pragma; FULL makes an ack durable
+
+_STOP = object()
+
+
+class Writer:
+    def __init__(self, path=None, max_batch=None, max_delay=None, max_queue=None, synchronous=None):
+        self.path = os.path.abspath(path or db.DB_NAME)
+        self.max_batch = max_batch or MAX_BATCH
+        self.max_delay = MAX_DELAY if max_delay is None else max_delay
+        self.synchronous = synchronous or SYNCHRONOUS
+        self.pid = os.getpid()
+        self.groups = self.units = self.largest_group = self.rejected = 0
+        self._queue = queue.Queue(max_queue or MAX_QUEUE)
+        self._thread = threading.Thread(target=self._run, name=f"writer:{os.path.basename(self.path)}", daemon=True)
+        self._thread.start()
+
+    def submit(self, statements, timeout=None):
+        """Queue a unit of [(query, params), ...]; the Future resolves to the number of rows changed
+        once the transaction holding it has committed. Raises TimeoutError if the queue stays full
+        for `timeout` seconds (default SUBMIT_TIMEOUT; 0 = don't wait)."""
+        future = Future()
+        timeout = SUBMIT_TIMEOUT if timeout is None else timeout
+        try:
+            self._queue.put((list(statements), future), timeout=timeout)
+        except queue.Full:
+            self.rejected += 1
+            raise TimeoutError(f"write queue for {self.path} still full after {timeout}s") from None
+        return future
+
+    def execute(self, query, params=(), timeout=None):
+        return self.submit([(query, params)], timeout)
+
+    def close(self):
+        """Finish everything already queued, then stop the thread."""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+
+    def stats(self):
+        return {
+            "groups": self.groups,
+            "units": self.units,
+            "units_per_group": round(self.units / self.groups, 2) if self.groups else 0.0,
+            "largest_group": self.largest_group,
+            "queued": self._queue.qsize(),
+            "rejected": self.rejected,
+        }
+
+    def _run(self):
+        pool = db.get_pool(self.path)
+        conn = pool.acquire()
+        conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+        try:
+            stopping = False
+            while not stopping:
+                unit = self._queue.get()
+                if unit is _STOP:
+                    break
+                group = [unit]
+                until = time.monotonic() + self.max_delay
+                while len(group) < self.max_batch:
+                    try:
+                        unit = self._queue.get(timeout=max(0.0, until - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    if unit is _STOP:
+                        stopping = True
+                        break
+                    group.append(unit)
+                self._commit(conn, group)
+        finally:
+            conn.execute(f"PRAGMA synchronous = {pool.pragmas.get('synchronous', 'FULL')}")
+            pool.release(conn)
+
+    def _commit(self, conn, group):
+        group = [(statements, future) for statements, future in group if future.set_running_or_notify_cancel()]
+        if not group:
+            return
+        outcomes, tables = [], set()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for statements, future in group:
+                conn.execute("SAVEPOINT write_unit")
+                try:
+                    changed = sum(conn.execute(query, params).rowcount for query, params in statements)
+                except sqlite3.Error as e:
+                    conn.execute("ROLLBACK TO write_unit")
+                    conn.execute("RELEASE write_unit")
+                    outcomes.append((future, None, e))
+                else:
+                    conn.execute("RELEASE write_unit")
+                    outcomes.append((future, changed, None))
+                    tables.update(cache.table_written(query) for query, _ in statements)
+            conn.commit()
+        except BaseException as e:   # BEGIN or COMMIT failed (e.g. still locked after busy_timeout)
+            if conn.in_transaction:
+                conn.rollback()
+            for _, future in group:
+                future.set_exception(e)
+            return
+        finally:
+            self.groups += 1
+            self.units += len(group)
+            self.largest_group = max(self.largest_group, len(group))
+        tables.discard(None)
+        if tables:
+            cache.invalidate(tables)
+        for future, changed, error in outcomes:
+            if error is None:
+                future.set_result(changed)
+            else:
+                future.set_exception(error)
+
+
+# -------------------------
+# One writer per database file
+# -------------------------
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(path=None):
+    path = os.path.abspath(path or db.DB_NAME)
+    with _writers_lock:
+        writer = _writers.get(path)
+        # a writer inherited through fork() has no thread behind it in the child
+        if writer is None or writer.pid != os.getpid():
+            writer = _writers[path] = Writer(path)
+        return writer
+
+
+def submit(statements, path=None, timeout=None):
+    return get_writer(path).submit(statements, timeout)
+
+
+def configure(**settings):
+    """Override the module settings (e.g. configure(max_delay=0.002, max_queue=1024)); writers
+    started from now on use them."""
+    for name, value in settings.items():
+        if name.upper() not in ("MAX_BATCH", "MAX_DELAY", "MAX_QUEUE", "SUBMIT_TIMEOUT", "SYNCHRONOUS"):
+            raise ValueError(f"unknown writer setting {name!r}")
+        globals()[name.upper()] = value
+    close_all()
+
+
+@atexit.register
+def close_all():
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        if writer.pid == os.getpid():
+            writer.close()